@@ -0,0 +1,266 @@
+"""Vectorized backtests of simple trading rules, for many parameter sets at once."""
+import warnings
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from funclib import (ROLLING_DAYS_PER_YEAR, _first_valid_positions, get_ratios_pyramid_snapshot,
+                     latest_snapshot_by_default, log_prices)
+from parallel import PARALLEL_MIN_CELLS, map_column_chunks
+from profiling import timed, timed_cache_resource
+
+# the trading rules and their parameters:
+#   hold: always long, the reference of the other rules.
+#   trend: long above the moving average of the log prices over `window` days, short below, flat
+#     on a tie.
+#   threshold: long after a rise of more than `threshold` (a fraction) over `lookback` days, short
+#     after a fall of more, until the opposite event.
+#   mean_reversion: short above a z-score of `entry_z` of the log price over `window` days, long
+#     below -`entry_z`, flat within +-`exit_z`, and unchanged in between.
+BACKTEST_RULES = {'hold': (), 'trend': ('window',), 'threshold': ('lookback', 'threshold'),
+                  'mean_reversion': ('window', 'entry_z', 'exit_z')}
+# the returns are annualized with ROLLING_DAYS_PER_YEAR, the volatility is the one of the daily log
+# returns, the turnover is the traded positions per year (a reversal counts 2) and the exposure
+# is the percentage of days in the market
+BACKTEST_METRICS = ('total_return_pct', 'cagr_pct', 'volatility_pct', 'max_drawdown_pct', 'turnover',
+                    'num_trades', 'exposure_pct')
+# the parameter grids swept once per snapshot for the pages, 1501 parameter sets in total
+BACKTEST_GRIDS = {
+    'hold': {},
+    'trend': {'window': range(5, 1005, 5)},
+    'threshold': {'lookback': (5, 10, 21, 42, 63, 126, 189, 252, 504, 756),
+                  'threshold': np.round(np.arange(0.01, 0.51, 0.01), 2)},
+    'mean_reversion': {'window': (21, 42, 63, 126, 189, 252, 504, 756, 1008, 1260),
+                       'entry_z': (1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 3.0, 3.5, 4.0),
+                       'exit_z': (0.0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0)},
+}
+# the maximum size of the (parameter sets x columns x rows) blocks of a backtest, a few of which
+# are alive at a time
+BACKTEST_CHUNK_MAX_BYTES = 32 * 2**20
+# the number of backtests (for all sessions) kept by `get_ratios_backtest`, every snapshot has one
+# per rule and trading costs
+BACKTEST_CACHE_MAX_ENTRIES = 32
+
+
+def _trailing_window_sums(x: np.ndarray, windows: np.ndarray) -> np.ndarray:
+  """The sums of a (columns x rows) array over the trailing `window` rows, for many windows at once.
+
+  Every window is a difference of two shifted cumulative sums, both rows of a sliding window view
+  of the zero-padded cumulative sums, so the windows are gathered without a loop.
+
+  Returns:
+    (windows x columns x rows) array. Rows with fewer than `window` previous rows are partial sums.
+  """
+  num_rows = x.shape[1]
+  max_window = int(windows.max())
+  cumsums = np.zeros((len(x), max_window + 1 + num_rows))
+  np.cumsum(x, axis=1, out=cumsums[:, max_window + 1:])
+  # shifted[k, :, t] is the sum of the rows up to t + k - max_window - 1
+  shifted = np.moveaxis(np.lib.stride_tricks.sliding_window_view(cumsums, num_rows, axis=1), 1, 0)
+  return shifted[max_window + 1] - shifted[max_window + 1 - windows]
+
+
+def _lagged(x: np.ndarray, lags: np.ndarray) -> np.ndarray:
+  """The (lags x columns x rows) values of a (columns x rows) array `lag` rows before, NaN before
+  the first row."""
+  num_rows = x.shape[1]
+  max_lag = int(lags.max())
+  padded = np.full((len(x), max_lag + num_rows), np.nan)
+  padded[:, max_lag:] = x
+  shifted = np.moveaxis(np.lib.stride_tricks.sliding_window_view(padded, num_rows, axis=1), 1, 0)
+  return shifted[max_lag - lags]
+
+
+def _event_positions(long_entries: np.ndarray, short_entries: np.ndarray,
+                     exits: Optional[np.ndarray] = None) -> np.ndarray:
+  """The positions of entry and exit events along the last axis, a position is kept until the
+  next event. An entry takes precedence over an exit of the same row.
+
+  Instead of forward filling the events, the row of the last event of every kind is carried with
+  a running maximum, and the latest kind gives the position.
+  """
+  rows = np.arange(long_entries.shape[-1], dtype=np.int32)
+
+  def last_rows(events):
+    last = np.where(events, rows, np.int32(-1))
+    return np.maximum.accumulate(last, axis=-1, out=last)
+
+  last_long, last_short = last_rows(long_entries), last_rows(short_entries)
+  is_long, is_short = last_long > last_short, last_short > last_long
+  if exits is not None:
+    last_exit = last_rows(exits)
+    is_long &= last_long >= last_exit
+    is_short &= last_short >= last_exit
+  return is_long.astype(np.int8) - is_short.astype(np.int8)
+
+
+class BacktestResult(NamedTuple):
+  """The metrics of a trading rule for a grid of parameter sets, see `run_backtest`."""
+  rule: str
+  # parameter name -> (parameter sets,) values
+  params: dict[str, np.ndarray]
+  columns: tuple[str, ...]
+  # metric name -> (parameter sets x columns) array
+  metrics: dict[str, np.ndarray]
+
+
+def parameter_grid(**params) -> dict[str, np.ndarray]:
+  """All combinations of the values of the parameters, as flat arrays of the same length, eg.
+  `parameter_grid(lookback=[21, 63], threshold=[0.1, 0.2, 0.3])` has 6 parameter sets."""
+  if not params:
+    return {}
+  grids = np.meshgrid(*[np.asarray(values, dtype=np.float64) for values in params.values()], indexing='ij')
+  return {name: grid.ravel() for name, grid in zip(params, grids)}
+
+
+def _rule_positions(x: np.ndarray, first_valid: np.ndarray, rule: str, params: dict[str, np.ndarray]
+                    ) -> np.ndarray:
+  """The positions (1 long, -1 short, 0 flat) of `rule` decided at every close of the (columns x
+  rows) log prices `x`, from the closes up to that row only.
+
+  The windows and lookbacks are computed once per distinct value, and shared by the parameter
+  sets with that value.
+
+  Returns:
+    int8 (parameter sets x columns x rows) array.
+  """
+  rows = np.arange(x.shape[1])
+  if rule == 'hold':
+    return (rows >= first_valid[:, None]).astype(np.int8)[None]
+
+  if rule == 'threshold':
+    lookbacks, inverse = np.unique(params['lookback'].astype(int), return_inverse=True)
+    changes = (x - _lagged(x, lookbacks))[inverse]
+    thresholds = np.minimum(params['threshold'][:, None, None], 1)
+    return _event_positions(changes > np.log1p(thresholds), changes < np.log1p(-thresholds))
+
+  windows, inverse = np.unique(params['window'].astype(int), return_inverse=True)
+  n = windows[:, None, None]
+  full = rows >= first_valid[:, None] + n - 1
+  if rule == 'trend':
+    x = np.where(np.isnan(x), 0, x)
+    deviations = x - _trailing_window_sums(x, windows) / n
+    # flat on a tie, eg. a forward filled gap, whatever the rounding errors of the sums
+    deviations[~full | (np.abs(deviations) < 1e-12)] = 0
+    return np.sign(deviations).astype(np.int8)[inverse]
+  if rule == 'mean_reversion':
+    # centered per column for the precision of the sums of squares
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+      x = x - np.nanmean(x, axis=1, keepdims=True)
+    x[np.isnan(x)] = 0
+    means = _trailing_window_sums(x, windows) / n
+    stds = np.sqrt(np.maximum(_trailing_window_sums(x**2, windows) / n - means**2, 0))
+    z = np.where(full, (x - means) / stds, np.nan)[inverse]
+    entry_z, exit_z = params['entry_z'][:, None, None], params['exit_z'][:, None, None]
+    return _event_positions(z < -entry_z, z > entry_z, np.abs(z) < exit_z)
+  raise ValueError(f'Unknown backtest rule {rule}.')
+
+
+def _backtest_columns(log_values: np.ndarray, rule: str, params: dict[str, np.ndarray], cost: float,
+                      long_only: bool, max_bytes: int) -> tuple[np.ndarray, ...]:
+  """The BACKTEST_METRICS of `run_backtest` for the log prices of some columns, a (parameter sets
+  x columns) array each."""
+  # time along the last, contiguous axis
+  x = np.ascontiguousarray(log_values.T)
+  num_columns, num_rows = x.shape
+  num_sets = len(next(iter(params.values()))) if params else 1
+  first_valid = _first_valid_positions(log_values)
+  # the daily returns from the first close on, and their number of years
+  num_days = num_rows - first_valid - 1
+  years = num_days / ROLLING_DAYS_PER_YEAR
+
+  results = np.full((len(BACKTEST_METRICS), num_sets, num_columns), np.nan)
+  chunk_size = max(1, max_bytes // max(1, num_rows * num_columns * 8))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    # the daily log returns of a long and of a short position, -inf when a short loses it all
+    long_returns = np.zeros_like(x)
+    long_returns[:, 1:] = np.diff(x, axis=1)
+    long_returns[np.isnan(long_returns)] = 0
+    short_returns = np.log1p(-np.minimum(np.expm1(long_returns), 1))
+    cost_log = np.log1p(-cost)
+
+    for start in range(0, num_sets, chunk_size):
+      stop = min(start + chunk_size, num_sets)
+      positions = _rule_positions(x, first_valid, rule,
+                                  {name: values[start:stop] for name, values in params.items()})
+      if long_only:
+        np.maximum(positions, 0, out=positions)
+      trades = np.abs(np.diff(positions, axis=-1, prepend=np.int8(0)))
+      # a position taken at a close earns the return of the next day, the costs are paid at the close
+      held = positions[..., :-1]
+      log_equity = np.zeros(positions.shape)
+      log_equity[..., 1:] = np.where(held > 0, long_returns[:, 1:], np.where(held < 0, short_returns[:, 1:], 0))
+      if cost:
+        log_equity += trades * cost_log
+      means = log_equity.sum(axis=-1) / num_days
+      variance = np.maximum(np.einsum('...t,...t->...', log_equity, log_equity) / num_days - means**2, 0)
+      np.cumsum(log_equity, axis=-1, out=log_equity)
+      # below the running high of the equity, which starts at 1
+      drops = np.maximum(log_equity, 0)
+      np.maximum.accumulate(drops, axis=-1, out=drops)
+      drops -= log_equity
+      num_trades = np.count_nonzero(trades, axis=-1)
+      results[:, start:stop] = (np.expm1(log_equity[..., -1]) * 100,
+                                np.expm1(log_equity[..., -1] / years) * 100,
+                                np.sqrt(variance * ROLLING_DAYS_PER_YEAR) * 100,
+                                np.expm1(-drops.max(axis=-1)) * 100,
+                                trades.sum(axis=-1, dtype=np.int64) / years,
+                                num_trades,
+                                np.count_nonzero(held, axis=-1) / num_days * 100)
+  results[..., num_days < 1] = np.nan
+  return tuple(results)
+
+
+@timed
+def run_backtest(closes: pd.DataFrame, rule: str, params: Optional[dict] = None, cost_bps: float = 0.,
+                 long_only: bool = False, max_bytes: int = BACKTEST_CHUNK_MAX_BYTES) -> BacktestResult:
+  """Backtest a BACKTEST_RULES rule on every column of `closes` for many parameter sets at once.
+
+  All parameter sets are computed together as (parameter sets x columns x rows) arrays, in
+  blocks of about `max_bytes`, and the columns are spread over the `map_column_chunks` pool. A
+  position is decided at a close and earns the return of the next day, and holding a ratio
+  is holding the numerator against the denominator.
+
+  Args:
+    closes: aligned closes (or ratios) with a column per series, forward filled here.
+    params: the parameters of the rule, flat arrays of the same length, see `parameter_grid`.
+    cost_bps: the cost of every traded position, in basis points of the equity.
+    long_only: flat instead of short.
+  """
+  if rule not in BACKTEST_RULES:
+    raise ValueError(f'Unknown backtest rule {rule}.')
+  params = {name: np.asarray(values, dtype=np.float64).ravel() for name, values in (params or {}).items()}
+  if set(params) != set(BACKTEST_RULES[rule]):
+    raise ValueError(f'The {rule} rule takes the parameters {BACKTEST_RULES[rule]}.')
+  if len({len(values) for values in params.values()}) > 1:
+    raise ValueError('The parameters must have the same length, see `parameter_grid`.')
+  num_sets = len(next(iter(params.values()))) if params else 1
+  # the pool pays off with the cells of all parameter sets
+  results = map_column_chunks(_backtest_columns, log_prices(closes),
+                              min_cells=max(1, PARALLEL_MIN_CELLS // max(num_sets, 1)), rule=rule,
+                              params=params, cost=cost_bps / 10_000, long_only=long_only,
+                              max_bytes=max_bytes)
+  metrics = dict(zip(BACKTEST_METRICS, results))
+  for values in list(params.values()) + list(metrics.values()):
+    values.flags.writeable = False
+  return BacktestResult(rule, params, tuple(map(str, closes.columns)), metrics)
+
+
+def backtest_frame(result: BacktestResult, column: str) -> pd.DataFrame:
+  """A DataFrame of the parameters and the metrics of `result` for one column, a row per parameter
+  set."""
+  j = result.columns.index(column)
+  return pd.DataFrame({**result.params, **{metric: values[:, j] for metric, values in result.metrics.items()}})
+
+
+@latest_snapshot_by_default('usa')
+@timed_cache_resource(max_entries=BACKTEST_CACHE_MAX_ENTRIES)
+def get_ratios_backtest(date_str: Optional[str] = None, rule: str = 'hold', cost_bps: float = 0.,
+                        long_only: bool = False) -> BacktestResult:
+  """The `run_backtest` of `rule` over its BACKTEST_GRIDS for all ratios of `get_ratios_df`,
+  read-only, a page only sorts or slices it with `backtest_frame`.
+  """
+  ratios = get_ratios_pyramid_snapshot(date_str)['daily']
+  return run_backtest(ratios, rule, parameter_grid(**BACKTEST_GRIDS[rule]), cost_bps, long_only)
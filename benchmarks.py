@@ -0,0 +1,289 @@
+"""Benchmarks of the funclib hot paths, of the page imports and of full headless page builds.
+
+Run with `python benchmarks.py` (a quick grid) or `python benchmarks.py --full` (up to 10M rows
+and 500 symbols). Every run is appended to a JSON lines results file and compared with the
+previous run of the same benchmarks, printing the ones that got slower than `--tolerance`.
+The imports of every page are also checked against its IMPORT_BUDGET_SEC, and the script exits
+with an error if a page is over its budget.
+
+The pages are run with streamlit's AppTest against synthetic dumps served by a local HTTP
+server, so no network access is needed.
+"""
+import argparse
+import ast
+import functools
+import http.server
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# keep the benchmarks away from the user cache, before importing funclib
+os.environ['FAI_CACHE_DIR'] = tempfile.mkdtemp(prefix='fai-bench-')
+
+import backtest  # noqa: E402
+import charting  # noqa: E402
+import funclib  # noqa: E402
+import plotly_charts  # noqa: E402
+
+REPO_DIR = Path(__file__).parent
+RESULTS_FILEPATH = REPO_DIR / 'benchmark_results.jsonl'
+
+QUICK_GRID = {'num_rows': [1_000, 10_000, 100_000], 'num_symbols': [1, 8, 50]}
+FULL_GRID = {'num_rows': [1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+             'num_symbols': [1, 8, 50, 500]}
+# the number of rows of the symbols sweep, and the number of symbols of the rows sweep
+SWEEP_NUM_ROWS = 25_000
+SWEEP_NUM_SYMBOLS = 1
+
+# the time to import the top-level imports of every page, with streamlit already imported (as in
+# the server process). Only the pages that use them import yfinance and altair.
+IMPORT_BUDGET_SEC = {'app_streamlit.py': 0.1, 'overall.py': 0.8, 'usa_index_ratios.py': 1.0,
+                     'country_ratios.py': 0.8, 'index_ratios_maths.py': 0.1}
+
+
+def synthetic_closes(num_rows: int, num_symbols: int, seed: int = 0) -> pd.DataFrame:
+  """Random-walk daily closes with leading NaNs (late listings) and random gaps."""
+  rng = np.random.default_rng(seed)
+  values = 100 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, (num_rows, num_symbols)), axis=0))
+  for j, start in enumerate(rng.integers(0, num_rows // 4 + 1, num_symbols)):
+    values[:start, j] = np.nan
+  values[rng.random(values.shape) < 0.02] = np.nan
+  index = pd.date_range('1927-01-01', periods=num_rows, freq='D', name='Date')
+  return pd.DataFrame(values, index=index, columns=[f's{j}' for j in range(num_symbols)])
+
+
+def timeit(fn, repeat: int = 3) -> dict:
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return {'min_sec': min(times), 'median_sec': float(np.median(times))}
+
+
+def _cases(grid: dict):
+  """(num_rows, num_symbols) pairs: a rows sweep and a symbols sweep."""
+  cases = [(num_rows, SWEEP_NUM_SYMBOLS) for num_rows in grid['num_rows']]
+  cases += [(SWEEP_NUM_ROWS, num_symbols) for num_symbols in grid['num_symbols']]
+  return list(dict.fromkeys(cases))
+
+
+def bench_funclib(grid: dict, repeat: int):
+  """Yield (name, params, timings) for the funclib hot paths."""
+  for num_rows, num_symbols in _cases(grid):
+    params = {'num_rows': num_rows, 'num_symbols': num_symbols}
+    closes = synthetic_closes(num_rows, num_symbols)
+    first = closes.iloc[:, 0]
+
+    # the per-Series functions only depend on the number of rows
+    if num_symbols == 1:
+      yield 'days_since_ath', params, timeit(lambda: funclib.days_since_ath(first), repeat)
+      yield 'days_since_change', params, timeit(
+          lambda: funclib.days_since_change(first, change=-3, days_period=5), repeat)
+      yield '_num_occurences', params, timeit(lambda: funclib._num_occurences(first, change=-3), repeat)
+    yield 'days_since_ath_array', params, timeit(
+        lambda: funclib.days_since_ath_array(closes.to_numpy()), repeat)
+    if num_rows * num_symbols <= 10_000_000:
+      yield 'days_since_change_array', params, timeit(
+          lambda: funclib.days_since_change_array(closes, changes=[-3, 3], days_periods=[1, 5]), repeat)
+
+    yield 'compute_rolling_metrics', params, timeit(lambda: funclib.compute_rolling_metrics(closes), repeat)
+    yield 'batch_process', params, timeit(lambda: funclib.batch_process.__wrapped__(closes), repeat)
+
+    if num_symbols >= 2:
+      a, b = closes.iloc[:, 0], closes.iloc[::2, 1]
+      yield '_reindex_and_compute_ratio', params, timeit(
+          lambda: funclib._reindex_and_compute_ratio(a, b), repeat)
+
+    if num_symbols >= 2:
+      if num_rows * num_symbols**2 <= 50_000_000:
+        yield 'compute_ratio_tensor', params, timeit(lambda: funclib.compute_ratio_tensor(closes), repeat)
+      log_values = funclib.log_prices(closes)
+      yield 'summarize_ratios', params, timeit(
+          lambda: funclib.summarize_ratios(log_values, tuple(closes.columns), 252), repeat)
+
+    # a sweep of the 200 parameter sets of the trend grid
+    if num_rows * num_symbols <= 250_000:
+      trend_grid = backtest.parameter_grid(**backtest.BACKTEST_GRIDS['trend'])
+      yield 'run_backtest', params, timeit(lambda: backtest.run_backtest(closes, 'trend', trend_grid), repeat)
+
+    yield 'wide_line_figure', params, timeit(
+        lambda: plotly_charts.wide_line_figure(closes).to_json(validate=False), repeat)
+
+    data = closes.iloc[:, :2].set_axis(['y1', 'y2'], axis=1) if num_symbols >= 2 else None
+    if data is not None:
+      data = data.assign(date=data.index)
+      yield 'generate_twin_chart', params, timeit(
+          lambda: charting.generate_twin_chart(data, 'y1', 'y1', 'y2', 'y2').to_dict(), repeat)
+
+
+def write_usa_dump(dirpath: Path, date_str: str, num_rows: int):
+  """Synthetic files of all symbols of `get_ratios_df`, in the fai-dumps layout."""
+  dirpath = dirpath / date_str
+  dirpath.mkdir(parents=True, exist_ok=True)
+  symbol_names = funclib.get_symbols('usa').index
+  closes = synthetic_closes(num_rows, len(symbol_names), seed=1)
+  for symbol_name, (_, close) in zip(symbol_names, closes.items()):
+    ending = funclib._symbol_filename_ending(symbol_name)
+    close = close.dropna()
+    if ending.endswith('yearly'):
+      close = close.resample('YS').last()
+    close.rename('Close').to_frame().to_csv(dirpath / f'{date_str}-{ending}.csv')
+
+
+def write_info_dump(dirpath: Path, date_str: str, num_rows: int):
+  """Synthetic files of all symbols of the INFO_GROUPS, in the fai-dumps layout."""
+  dirpath = dirpath / date_str
+  dirpath.mkdir(parents=True, exist_ok=True)
+  symbol_names = funclib.get_symbols(funclib.INFO_GROUPS).index
+  closes = synthetic_closes(num_rows, len(symbol_names), seed=2)
+  for symbol_name, (_, close) in zip(symbol_names, closes.items()):
+    ending = funclib._symbol_filename_ending(symbol_name)
+    close.dropna().rename('Close').to_frame().to_csv(dirpath / f'{date_str}-{ending}.csv')
+
+
+def write_country_dump(dirpath: Path, date_str: str, num_rows: int):
+  """Synthetic files of all country indices and FX rates, in the fai-dumps layout."""
+  dirpath = dirpath / date_str
+  dirpath.mkdir(parents=True, exist_ok=True)
+  symbols = funclib.get_symbols((funclib.COUNTRIES_GROUP, funclib.FX_GROUP))
+  closes = synthetic_closes(num_rows, len(symbols), seed=3)
+  for symbol_name, (_, close) in zip(symbols.index, closes.items()):
+    ending = funclib._symbol_filename_ending(symbol_name)
+    close.dropna().rename('Close').to_frame().to_csv(dirpath / f'{date_str}-{ending}.csv')
+
+
+def bench_get_ratios_df(dirpath: Path, repeat: int):
+  for num_rows in [10_000, 25_000, 100_000]:
+    date_str = f'{num_rows:08d}'
+    write_usa_dump(dirpath, date_str, num_rows)
+    source = dirpath / date_str
+    # load the closes once, only the ratios are timed
+    funclib.get_close_data_by_symbols(funclib.get_symbols('usa').index.to_list(), source)
+    yield 'get_ratios_df', {'num_rows': num_rows}, timeit(
+        lambda: funclib.get_ratios_df.__wrapped__(source), repeat)
+
+
+def _page_imports(page: str) -> str:
+  """The source of the top-level import statements of `page`."""
+  tree = ast.parse((REPO_DIR / page).read_text())
+  return ast.unparse([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))])
+
+
+def bench_imports(repeat: int):
+  """Time the top-level imports of every page, each in a fresh interpreter."""
+  for page in IMPORT_BUDGET_SEC:
+    code = (f'import time, streamlit\nstart = time.perf_counter()\nexec({_page_imports(page)!r}, {{}})\n'
+            'print(time.perf_counter() - start)')
+    times = [float(subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True,
+                                  text=True, check=True).stdout)
+             for _ in range(repeat)]
+    yield f'import:{page}', {}, {'min_sec': min(times), 'median_sec': float(np.median(times))}
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+  def log_message(self, *args):
+    pass
+
+
+def bench_pages(dirpath: Path, repeat: int):
+  """Time full headless runs of the pages, with a local HTTP server standing in for fai-dumps."""
+  from streamlit.testing.v1 import AppTest
+
+  write_info_dump(dirpath, '20240904', 25_000)
+  write_usa_dump(dirpath, '20241203', 25_000)
+  write_country_dump(dirpath, '20241203', 25_000)
+  funclib.write_manifest(dirpath)
+  server = http.server.ThreadingHTTPServer(
+      ('127.0.0.1', 0), functools.partial(_QuietHandler, directory=str(dirpath)))
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  url_assets = funclib.URL_ASSETS
+  funclib.URL_ASSETS = f'http://127.0.0.1:{server.server_port}/'
+  try:
+    for page in ['overall.py', 'usa_index_ratios.py', 'country_ratios.py']:
+      def run():
+        app = AppTest.from_file(str(REPO_DIR / page), default_timeout=600)
+        app.run()
+        assert not app.exception, app.exception
+
+      # the first run is cold (empty caches), the next ones are reruns of a session
+      yield f'page:{page}:cold', {}, timeit(run, 1)
+      yield f'page:{page}:warm', {}, timeit(run, repeat)
+  finally:
+    funclib.URL_ASSETS = url_assets
+    server.shutdown()
+    server.server_close()
+
+
+def _git_revision() -> str:
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                          capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return 'unknown'
+
+
+def _load_previous(filepath: Path) -> dict:
+  """The latest result of every (name, params) benchmark in the results file."""
+  previous = dict()
+  if filepath.exists():
+    with open(filepath) as f:
+      for line in f:
+        record = json.loads(line)
+        previous[(record['name'], json.dumps(record['params'], sort_keys=True))] = record
+  return previous
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument('--full', action='store_true', help='up to 10M rows and 500 symbols')
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--no-pages', action='store_true', help='skip the headless page runs')
+  parser.add_argument('--results', type=Path, default=RESULTS_FILEPATH)
+  parser.add_argument('--tolerance', type=float, default=0.2,
+                      help='relative slowdown (of the min time) reported as a regression')
+  args = parser.parse_args()
+
+  grid = FULL_GRID if args.full else QUICK_GRID
+  previous = _load_previous(args.results)
+  run_info = {'revision': _git_revision(), 'timestamp': datetime.now().isoformat(timespec='seconds')}
+
+  regressions, over_budget = [], []
+  with tempfile.TemporaryDirectory() as tmp_dir, open(args.results, 'a') as f:
+    benches = [bench_imports(args.repeat), bench_funclib(grid, args.repeat),
+               bench_get_ratios_df(Path(tmp_dir), args.repeat)]
+    if not args.no_pages:
+      benches.append(bench_pages(Path(tmp_dir) / 'dumps', args.repeat))
+    for bench in benches:
+      for name, params, timings in bench:
+        record = {'name': name, 'params': params, **timings, **run_info}
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        print(f"{name:<28} {json.dumps(params):<45} min {timings['min_sec']:9.4f} s  "
+              f"median {timings['median_sec']:9.4f} s")
+        prev = previous.get((name, json.dumps(params, sort_keys=True)))
+        if prev is not None and timings['min_sec'] > prev['min_sec'] * (1 + args.tolerance):
+          regressions.append((name, params, prev['min_sec'], timings['min_sec'], prev['revision']))
+        if name.startswith('import:') and timings['min_sec'] > IMPORT_BUDGET_SEC[name[len('import:'):]]:
+          over_budget.append((name, timings['min_sec']))
+
+  for name, params, prev_sec, sec, prev_revision in regressions:
+    print(f'REGRESSION {name} {params}: {prev_sec:.4f} s ({prev_revision}) -> {sec:.4f} s')
+  for name, sec in over_budget:
+    print(f'OVER BUDGET {name}: {sec:.4f} s > {IMPORT_BUDGET_SEC[name[len("import:"):]]:.4f} s')
+  if over_budget:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
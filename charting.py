@@ -0,0 +1,71 @@
+"""Altair charts of the pages, imported only by the pages that draw them."""
+from typing import Optional
+
+import altair as alt
+import pandas as pd
+
+from funclib import (CHART_MAX_POINTS, FIGURE_CACHE_MAX_ENTRIES, downsample_df, get_pyramid_range,
+                     get_ratios_pyramid_snapshot)
+from profiling import timed, timed_cache_resource
+
+
+def _twin_chart_data(data: pd.DataFrame, y1_col: str, y2_col: str, max_points: Optional[int]
+                     ) -> pd.DataFrame:
+  # find the first valid index in data
+  data = data[data[[y1_col, y2_col]].first_valid_index():]
+  if max_points is not None:
+    data = downsample_df(data, max_points, columns=[y1_col, y2_col])
+  return data
+
+
+def _twin_chart(data, y1_col: str, y1_title: str, y2_col: str, y2_title: str) -> alt.LayerChart:
+  tableau_colors = ['#4C78A8', '#F58518']
+  base = alt.Chart(data).encode(x=alt.X('date:T', title='date'))
+  # add y1 and y2 charts
+  y1_schema = alt.Y(y1_col + ':Q',
+                    axis=alt.Axis(title=y1_title, titleColor=tableau_colors[0]),
+                    scale=alt.Scale(zero=False))
+  y1_tooltips = [alt.Tooltip('date:T', title='date'),
+                 alt.Tooltip(y1_col + ':Q', title=y1_title, format='.3f')]
+  y1_chart = base.mark_line(color=tableau_colors[0]).encode(y=y1_schema, tooltip=y1_tooltips).interactive()
+  y2_schema = alt.Y(y2_col + ':Q',
+                    axis=alt.Axis(title=y2_title, titleColor=tableau_colors[1]),
+                    scale=alt.Scale(zero=False))
+  y2_tooltips = [alt.Tooltip('date:T', title='date'),
+                 alt.Tooltip(y2_col + ':Q', title=y2_title, format='.3f')]
+  y2_chart = base.mark_line(color=tableau_colors[1]).encode(y=y2_schema, tooltip=y2_tooltips).interactive()
+  # Overlay the charts
+  twin_axes_chart = alt.layer(y1_chart, y2_chart).resolve_scale(y='independent').interactive()
+  return twin_axes_chart
+
+
+@timed
+def generate_twin_chart(data: pd.DataFrame, y1_col: str, y1_title: str, y2_col: str, y2_title: str,
+                        max_points: Optional[int] = CHART_MAX_POINTS) -> alt.Chart:
+  """
+  Args:
+    max_points: the point budget per line, see `downsample_df`. None to plot all rows.
+  """
+  data = _twin_chart_data(data, y1_col, y2_col, max_points)
+  return _twin_chart(data, y1_col, y1_title, y2_col, y2_title)
+
+
+@timed_cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def get_ratios_twin_chart_spec(date_str: str, start: Optional[str], end: Optional[str], y1_col: str,
+                               y1_title: str, y2_col: str, y2_title: str) -> dict:
+  """The `generate_twin_chart` of two ratios of the `date_str` snapshot in [start, end], as a
+  Vega-Lite spec for `st.vega_lite_chart(spec=spec)`.
+
+  On a rerun only the downsampled data are serialized again. The spec must be treated as
+  read-only.
+
+  Returns:
+    spec: the chart reads the 'ratios' dataset, a DataFrame with a 'date' column and the ratios.
+  """
+  ratios_df = get_pyramid_range(get_ratios_pyramid_snapshot(date_str), start, end)
+  data = _twin_chart_data(ratios_df.assign(date=ratios_df.index), y1_col, y2_col, CHART_MAX_POINTS)
+  spec = _twin_chart(alt.NamedData(name='ratios'), y1_col, y1_title, y2_col, y2_title).to_dict()
+  # without the view size of the default altair theme, like `st.altair_chart`
+  spec.pop('config', None)
+  spec['datasets'] = {'ratios': data[['date', y1_col, y2_col]].reset_index(drop=True)}
+  return spec
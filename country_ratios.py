@@ -0,0 +1,86 @@
+import time
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from description_strings import outro_string
+from funclib import (COMMON_CURRENCY, COUNTRIES_GROUP, FX_GROUP, get_country_ratios_snapshot,
+                     get_country_ratios_summary, get_symbols, latest_snapshot_date, select_ratios)
+from plotly_charts import wide_line_figure
+from profiling import finish_run, span, start_run
+
+timer_start = time.time_ns()
+start_run('country_ratios')
+
+st.title('Comparing country stock markets')
+st.write(
+    'This page compares the main stock market index of every country with the others. Every index '
+    'is first converted to the same currency with its exchange rate, so the ratios show the '
+    f'relative performance of the markets for a {COMMON_CURRENCY} investor. See "The math" page '
+    'for the formula.')
+
+# the newest snapshot of the dumps, the same for all sections of the run
+date_str = latest_snapshot_date((COUNTRIES_GROUP, FX_GROUP))
+# the ratios of all pairs of the snapshot, read-only
+ratio_matrix = get_country_ratios_snapshot(date_str)
+if len(ratio_matrix.names) < 2 or len(ratio_matrix.dates) == 0:
+  st.warning('The country indices are not available for this snapshot.')
+  finish_run()
+  st.stop()
+
+symbols = get_symbols(names=list(ratio_matrix.names))
+labels = symbols['button_name'].to_dict()
+
+with st.sidebar:
+  denominator = st.selectbox('Compared to', ratio_matrix.names, format_func=labels.get)
+  others = [name for name in ratio_matrix.names if name != denominator]
+  numerators = st.multiselect('Markets', others, format_func=labels.get,
+                              default=[name for name in others if symbols.loc[name, 'button_default']])
+  all_years = ratio_matrix.dates.astype('datetime64[Y]').astype(int) + 1970
+  start_year, end_year = st.slider('Period', min_value=int(all_years[0]), max_value=int(all_years[-1]),
+                                   value=(int(all_years[0]), int(all_years[-1])))
+
+st.header(f'Stock markets relative to the {labels[denominator]}')
+if not numerators:
+  st.info('Select at least one market in the sidebar.')
+else:
+  # a selection is only a slice of the matrix, nothing is downloaded or computed again
+  with span('select ratios'):
+    ratios_df = select_ratios(ratio_matrix, numerators, denominator).loc[str(start_year):str(end_year)]
+    ratios_df = ratios_df.dropna(how='all')
+    ratios_df.columns = [labels[name] for name in numerators]
+  fig = wide_line_figure(ratios_df, value_name='ratio', log_y=True, legend_title='market')
+  with span('ratios: plotly chart'):
+    st.plotly_chart(fig, use_container_width=True, theme=None)
+  st.write('When a ratio increases, the market outperforms the '
+           f'{labels[denominator]}, and vice versa when it decreases.')
+
+st.header('Who is outperforming whom')
+# number of (trading) days of every period
+periods = {'1 month': 21, '1 year': 252, '5 years': 1260, 'All': None}
+period = st.radio('Period', list(periods), index=1, horizontal=True, key='heatmap_period')
+statistic = st.radio('Statistic', ['Change of the ratio', 'Percentile of the latest ratio'],
+                     horizontal=True)
+# computed from the log prices of the snapshot, without the ratios tensor
+summary = get_country_ratios_summary(date_str, periods[period])
+if statistic == 'Change of the ratio':
+  values, midpoint, title = summary.change_pct, 0, '% change'
+else:
+  values, midpoint, title = summary.percentile, 50, 'percentile'
+names = [labels[name] for name in summary.names]
+fig = px.imshow(pd.DataFrame(values, index=names, columns=names), text_auto='.0f', aspect='auto',
+                color_continuous_scale='RdYlGn', color_continuous_midpoint=midpoint,
+                labels={'x': 'compared to', 'y': 'market', 'color': title})
+with span('heatmap: plotly chart'):
+  st.plotly_chart(fig, use_container_width=True, theme=None)
+st.write('Every row is a market and every column the market it is compared to, green when the row '
+         'market outperforms the column market.')
+
+st.divider()
+
+# Outro ###########################################################################################
+st.write('')
+st.write(outro_string)
+st.write(f'Page created in {(time.time_ns() - timer_start) / 1_000_000_000:.1f} sec.')
+finish_run()
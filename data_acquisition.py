@@ -0,0 +1,114 @@
+"""Downloading the daily histories of the registry symbols with yfinance.
+
+Only the download scripts need this module, so yfinance is imported here and not by funclib or
+the pages, which read the dumps.
+"""
+import os
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+import snapshot_cache
+from funclib import (CONSOLIDATED_DIRNAME, COUNTRIES_GROUP, FX_GROUP, INFO_GROUPS, START_DATE,
+                     get_symbols, write_manifest)
+from profiling import timed
+
+
+def yf_download(symbol: str, start: str) -> pd.DataFrame:
+  """Download the daily history of `symbol` from `start` (inclusive) with yfinance."""
+  df = yf.download(symbol, start=start, progress=False)
+  # newer yfinance versions return (price, ticker) columns
+  if isinstance(df.columns, pd.MultiIndex):
+    df.columns = df.columns.get_level_values(0)
+  df.index.name = 'Date'
+  return df
+
+
+def _update_consolidated_csv(filepath: Path, symbol: str, download_fn, overlap_days: int) -> int:
+  """Append the days missing from `filepath` to it, downloading only the tail of the history.
+
+  The last `overlap_days` stored days are downloaded again and validated. If they differ from
+  the stored values (eg. the provider adjusted the history) or nothing is stored yet, the full
+  history is downloaded and the file is rewritten. An empty or incomplete download (yfinance
+  returns an empty frame on errors) keeps the stored file as it is.
+
+  Returns:
+    num_new_rows: the number of appended (or written) rows.
+  """
+  stored = pd.read_csv(filepath, parse_dates=['Date'], index_col='Date') if filepath.exists() else None
+
+  if stored is not None and len(stored) > 0:
+    overlap = stored.iloc[-overlap_days:]
+    new = download_fn(symbol, overlap.index[0].strftime('%Y-%m-%d'))
+    if new is None or not overlap.index.isin(new.index).all():
+      print(f'The provider returned an incomplete {symbol} history, keeping the stored one.')
+      return 0
+    if np.allclose(overlap['Close'], new['Close'].reindex(overlap.index), rtol=1e-6, equal_nan=True):
+      new = new.loc[new.index > stored.index[-1]].reindex(columns=stored.columns)
+      new.to_csv(filepath, mode='a', header=False)
+      return len(new)
+    print(f'The stored {symbol} history differs from the provider, downloading it again.')
+
+  new = download_fn(symbol, START_DATE)
+  if new is None or len(new) == 0 or (stored is not None and len(stored) > 0
+                                      and new.index[-1] < stored.index[-1]):
+    print(f'Could not download the full {symbol} history, keeping the stored one.')
+    return 0
+  # replaced at once, a failing write keeps the stored file
+  tmp_filepath = filepath.with_name(filepath.name + '.tmp')
+  new.to_csv(tmp_filepath)
+  os.replace(tmp_filepath, filepath)
+  return len(new)
+
+
+@timed
+def download_and_save_data(dirpath: Path, tts=3, incremental: bool = False,
+                           download_fn: Callable[[str, str], pd.DataFrame] = yf_download,
+                           overlap_days: int = 5,
+                           groups: tuple[str, ...] = INFO_GROUPS + (COUNTRIES_GROUP, FX_GROUP)):
+  """Download the daily data of all symbols of `groups`.
+
+  Args:
+    dirpath: by default, a full snapshot is saved in a new `dirpath / YYYYMMDD` directory and
+      the manifest of `dirpath` is updated, see `write_manifest`.
+    tts: seconds to sleep between the downloads of two symbols.
+    incremental: if True, only the days after the last stored date of every symbol are
+      downloaded and appended to the files of the `dirpath / CONSOLIDATED_DIRNAME` directory,
+      which can be read with `get_close_data_from_dir`.
+    download_fn: fn(symbol, start_date_str) -> pd.DataFrame with a 'Date' index and a 'Close'
+      column. Defaults to yfinance.
+    overlap_days: number of already stored days to download again and validate.
+    groups: the registry groups to download, symbols sharing a file are downloaded once.
+  """
+  symbols = get_symbols(groups)
+  symbols = symbols[symbols['frequency'] == 'daily'].drop_duplicates('filename_prefix')
+  symbols = symbols[['yf_symbol', 'filename_prefix']]
+  if incremental:
+    dirpath = dirpath / CONSOLIDATED_DIRNAME
+    dirpath.mkdir(parents=True, exist_ok=True)
+    for symbol, prefix in symbols.itertuples(index=False):
+      filepath = dirpath / f'{CONSOLIDATED_DIRNAME}-{prefix}-daily.csv'
+      num_new_rows = _update_consolidated_csv(filepath, symbol, download_fn, overlap_days)
+      if num_new_rows > 0:
+        snapshot_cache.discard_local(filepath)
+      time.sleep(tts)
+    return
+
+  current_date_str = date.today().strftime('%Y%m%d')
+  dirpath = dirpath / current_date_str
+  dirpath.mkdir()
+  for symbol, prefix in symbols.itertuples(index=False):
+    df = download_fn(symbol, START_DATE)
+    # a failed download writes no file, the snapshot misses it (see `latest_snapshot_date`)
+    if df is None or len(df) == 0:
+      print(f'Could not download the {symbol} history, skipping it.')
+    else:
+      df.to_csv(dirpath / f'{current_date_str}-{prefix}-daily.csv')
+    time.sleep(tts)
+  # the pages pick up the new snapshot from the manifest
+  write_manifest(dirpath.parent)
@@ -1,8 +1,14 @@
+import inspect
+import io
+import json
+import os
+import threading
 import time
-from datetime import date
-from functools import partial
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Callable, Literal, NamedTuple, Optional
 from typing_extensions import deprecated
 from typing import TypeAlias
 # from warnings import deprecated # Python 3.13 onwards
@@ -10,31 +16,405 @@ from typing import TypeAlias
 import numpy as np
 import pandas as pd
 import streamlit as st
-import yfinance as yf
-from urllib.error import HTTPError
-import altair as alt
+
+import snapshot_cache
+from parallel import map_column_chunks
+from profiling import add, copy_context_for_thread, timed, timed_cache_data, timed_cache_resource
+from snapshot_cache import CACHE_DIR, cached_closes, cached_local_closes
 
 URL: TypeAlias = str
-URL_ASSETS = 'https://raw.githubusercontent.com/pmeletis/fai-dumps/main/'
+# the fai-dumps snapshots, an URL or a local directory (ending with a separator)
+URL_ASSETS = os.environ.get('FAI_ASSETS', 'https://raw.githubusercontent.com/pmeletis/fai-dumps/main/')
+
+# the earliest date of the downloaded histories
+START_DATE = '1927-01-01'
+CONSOLIDATED_DIRNAME = 'consolidated'
+
+# concurrent downloads of the dump files
+FETCH_MAX_WORKERS = 8
+FETCH_TIMEOUT = (5, 30)  # sec, (connect, read) per file
+FETCH_RETRIES = 3
+
+# rows per chunk when streaming the local csv files, bounds the memory of the parser
+CSV_CHUNKSIZE = 2**18
+
+# maximum number of points per series sent to the browser by a chart
+CHART_MAX_POINTS = 2000
+# the (typical) plotting width of a chart, used to pick the resolution of a series
+CHART_WIDTH_PX = 1200
+# the number of snapshots kept by the per-snapshot caches: the latest one and the previous one,
+# still read by the sessions started before the latest one was picked up
+SNAPSHOT_CACHE_MAX_ENTRIES = 2
+# the number of chart figures (for all sessions) kept by the figure caches of the pages
+FIGURE_CACHE_MAX_ENTRIES = int(os.environ.get('FAI_FIGURE_CACHE_MAX_ENTRIES', 256))
+# the maximum size of the intermediate blocks of the all-pairs ratios of many symbols
+RATIO_CHUNK_MAX_BYTES = 256 * 2**20
+# resolution levels of the series pyramids, from finest to coarsest: name -> resample frequency
+PYRAMID_LEVELS = {'daily': None, 'weekly': 'W', 'monthly': 'ME', 'yearly': 'YE'}
+
+# window lengths (in rows, ie. trading days) and metrics of the rolling analytics
+ROLLING_WINDOWS = (21, 63, 126, 252, 756, 1260)
+ROLLING_METRICS = ('return_pct', 'volatility_pct', 'drawdown_pct', 'max_drawdown_pct', 'correlation')
+ROLLING_DAYS_PER_YEAR = 252
+# the reference of the rolling correlations of the INFO symbols
+ROLLING_REFERENCE = 'sp500'
+
+# opt-in compact in-memory mode of the shared snapshots: float32 prices and ratios, uint16 counters
+COMPACT_MODE = os.environ.get('FAI_COMPACT_MODE') == '1'
+
+# the ranges of the "days since change" sliders, all their combinations are precomputed
+SLIDER_CHANGES = range(-15, 16)
+SLIDER_DAYS_PERIODS = range(1, 31)
+
+# the symbol registry, one row per symbol with its metadata and the layout of its dump files
+SYMBOLS_FILEPATH = Path(os.environ.get('FAI_SYMBOLS', Path(__file__).parent / 'symbols.csv'))
+SYMBOLS_COLUMNS = ['name', 'group', 'yf_symbol', 'filename_prefix', 'frequency', 'button_name',
+                   'button_default', 'country', 'currency']
+# the groups of the symbols of the overall page
+INFO_GROUPS = ('indices', 'crypto')
+# the country indices of the country ratios page, and the FX rates that convert their prices
+# to the common currency: the price of one unit of the `currency` of the row in COMMON_CURRENCY
+COUNTRIES_GROUP = 'countries'
+FX_GROUP = 'fx'
+COMMON_CURRENCY = 'USD'
+
+# the list of the snapshots of URL_ASSETS and of their files, see `build_manifest`
+MANIFEST_FILENAME = 'manifest.json'
+# seconds between two checks of the manifest for new snapshots, an unchanged manifest costs a 304
+MANIFEST_TTL_SEC = float(os.environ.get('FAI_MANIFEST_TTL_SEC', 600))
+# the fraction of the symbols of the groups that a snapshot must have to be picked by
+# `latest_snapshot_date`, the usa ratios need all of their symbols
+SNAPSHOT_MIN_COVERAGE = float(os.environ.get('FAI_SNAPSHOT_MIN_COVERAGE', 0.75))
+SNAPSHOT_GROUP_MIN_COVERAGE = {'usa': 1.}
+# the snapshot of every group when there is no manifest, eg. offline
+FALLBACK_SNAPSHOT_DATES = {'indices': '20240904', 'crypto': '20240904', 'usa': '20241203',
+                           'countries': '20241203', 'fx': '20241203'}
+# the older dumps, with a file per symbol at the root of URL_ASSETS
+LEGACY_DUMP_DATE = '20240322'
+
+_symbol_registry = None
+_symbol_registry_lock = threading.Lock()
+
+
+def get_symbol_registry() -> pd.DataFrame:
+  """The symbol registry of SYMBOLS_FILEPATH, loaded once per process on first use.
+
+  Returns:
+    registry: pd.DataFrame indexed by the unique symbol name, with the SYMBOLS_COLUMNS. It is
+      shared, use `get_symbols` for a copy to modify.
+  """
+  global _symbol_registry
+  with _symbol_registry_lock:
+    if _symbol_registry is None:
+      registry = pd.read_csv(SYMBOLS_FILEPATH, dtype=str, keep_default_na=False)
+      if missing := set(SYMBOLS_COLUMNS) - set(registry.columns):
+        raise ValueError(f'{SYMBOLS_FILEPATH} is missing the columns {missing}.')
+      if registry['name'].duplicated().any():
+        raise ValueError(f'{SYMBOLS_FILEPATH} has duplicate symbol names.')
+      registry['button_default'] = registry['button_default'] == 'True'
+      _symbol_registry = registry.set_index('name')
+    return _symbol_registry
+
+
+def get_symbols(groups: Optional[str | tuple[str, ...]] = None,
+                names: Optional[list[str]] = None) -> pd.DataFrame:
+  """A copy of the registry rows of the given `groups` and/or `names`, in registry order.
+
+  Raises:
+    ValueError: if a name is not in the registry.
+  """
+  registry = get_symbol_registry()
+  mask = np.ones(len(registry), dtype=bool)
+  if groups is not None:
+    mask &= registry['group'].isin([groups] if isinstance(groups, str) else groups).to_numpy()
+  if names is not None:
+    if unknown := set(names) - set(registry.index):
+      raise ValueError(f'Symbol names not supported: {sorted(unknown)}.')
+    mask &= registry.index.isin(names)
+  return registry[mask].copy()
+
+
+# the functions moved to the modules of their heavy dependencies: name -> module
+_LAZY_ATTRIBUTES = {'yf_download': 'data_acquisition', 'download_and_save_data': 'data_acquisition',
+                    'generate_twin_chart': 'charting'}
+
+
+def __getattr__(name: str):
+  """Import the moved functions on first access, so `from funclib import generate_twin_chart`
+  keeps working without funclib importing yfinance and altair.
+  """
+  if name in _LAZY_ATTRIBUTES:
+    import importlib
+    return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> 'requests.Session':
+  """The HTTP session shared by all downloads, so connections are kept alive and reused."""
+  global _session
+  with _session_lock:
+    if _session is None:
+      # imported on first download, the pages served from the snapshot caches never need it
+      import requests
+      from requests.adapters import HTTPAdapter
+      from urllib3.util.retry import Retry
+      retry = Retry(total=FETCH_RETRIES, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=['GET'], raise_on_status=False)
+      adapter = HTTPAdapter(pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS,
+                            max_retries=retry)
+      _session = requests.Session()
+      _session.mount('http://', adapter)
+      _session.mount('https://', adapter)
+    return _session
+
+
+class FetchResult(NamedTuple):
+  content: bytes
+  # True if the content was not downloaded again, because the file has not changed
+  not_modified: bool
+
+
+def _is_url(url: URL) -> bool:
+  return url.startswith(('http://', 'https://'))
+
+
+def fetch_url(url: URL) -> FetchResult:
+  """Download `url`, or read it if it is a local file path.
+
+  The validators (ETag, Last-Modified) and content of the last response of an URL are kept in
+  the snapshot cache, and the URL is requested again with If-None-Match and If-Modified-Since,
+  so an unchanged file costs a 304 response instead of its content.
+
+  Raises:
+    requests.HTTPError or OSError (eg. FileNotFoundError) if the file cannot be fetched.
+  """
+  if not _is_url(url):
+    with open(url, 'rb') as f:
+      return FetchResult(f.read(), False)
+
+  cached = snapshot_cache.load_response(url)
+  headers = dict()
+  if cached is not None:
+    validators = cached[0]
+    if 'ETag' in validators:
+      headers['If-None-Match'] = validators['ETag']
+    if 'Last-Modified' in validators:
+      headers['If-Modified-Since'] = validators['Last-Modified']
+  response = _get_session().get(url, headers=headers, timeout=FETCH_TIMEOUT)
+  if response.status_code == 304 and cached is not None:
+    return FetchResult(cached[1], True)
+  response.raise_for_status()
+  add('bytes', len(response.content))
+  validators = {key: response.headers[key] for key in ('ETag', 'Last-Modified') if key in response.headers}
+  if validators:
+    snapshot_cache.save_response(url, validators, response.content)
+  return FetchResult(response.content, False)
+
+
+def download_df_csv(url: URL, **read_csv_kwargs) -> Optional[pd.DataFrame]:
+  """Download a csv dataframe from `url` with `fetch_url`. The csv file must have a 'Date' column.
+
+  Returns:
+    df: pd.DataFrame or None if an error occurred.
+  """
+  import requests
+  read_csv_kwargs.setdefault('parse_dates', ['Date'])
+  try:
+    df = pd.read_csv(io.BytesIO(fetch_url(url).content), **read_csv_kwargs)
+  except requests.HTTPError as e:
+    if e.response.status_code == 404:
+      print(f"Error 404: The requested URL {url} was not found on the server.")
+    else:
+      print(f"HTTP Error: {e.response.status_code}")
+    df = None
+  except FileNotFoundError:
+    print(f"The file {url} was not found.")
+    df = None
+  except Exception as e:
+    print(f"Unknown error: {str(e)}")
+    df = None
+
+  return df
+
+
+@timed
+def download_df_csvs(urls: list[URL], max_workers: int = FETCH_MAX_WORKERS, **read_csv_kwargs
+                     ) -> list[Optional[pd.DataFrame]]:
+  """Download and parse all `urls` concurrently with `download_df_csv`.
+
+  Returns:
+    dfs: a pd.DataFrame or None (if an error occurred) per url, in the order of `urls`.
+  """
+  if not urls:
+    return []
+  with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+    # in the calling context, so the downloaded bytes are added to the open span
+    download_fn = copy_context_for_thread(partial(download_df_csv, **read_csv_kwargs))
+    return list(executor.map(download_fn, urls))
+
+
+def build_manifest(dirpath: Path) -> dict:
+  """The manifest of the snapshots of a fai-dumps directory, for `get_snapshot_manifest`.
+
+  Returns:
+    manifest: {'snapshots': {date_str: [filename ending, ...]}}, with the endings (see
+      `_symbol_filename_ending`) of the files of every `dirpath / YYYYMMDD` snapshot.
+  """
+  snapshots = dict()
+  for snapshot_dirpath in sorted(dirpath.glob('[0-9]' * 8)):
+    date_str = snapshot_dirpath.name
+    snapshots[date_str] = sorted(fp.stem[len(date_str) + 1:] for fp in snapshot_dirpath.glob(f'{date_str}-*.csv'))
+  return {'snapshots': snapshots}
+
+
+def write_manifest(dirpath: Path):
+  """Write the `build_manifest` of `dirpath` to its MANIFEST_FILENAME."""
+  filepath = dirpath / MANIFEST_FILENAME
+  tmp_filepath = filepath.with_name(f'{filepath.name}.{os.getpid()}.tmp')
+  tmp_filepath.write_text(json.dumps(build_manifest(dirpath), indent=1))
+  os.replace(tmp_filepath, filepath)
+
+
+def _load_manifest(url_assets: str, previous: Optional[dict[str, frozenset[str]]] = None
+                   ) -> dict[str, frozenset[str]]:
+  """The snapshots of the manifest of `url_assets`: date_str -> filename endings.
+
+  A local directory without a manifest is listed instead. If the manifest cannot be fetched,
+  the last saved response is used, and without one there are no snapshots. The `previous`
+  snapshots of `url_assets` are returned as they are if the manifest has not changed.
+  """
+  import requests
+  url = url_assets + MANIFEST_FILENAME
+  try:
+    if not _is_url(url) and not os.path.exists(url):
+      manifest = build_manifest(Path(url_assets))
+    else:
+      result = fetch_url(url)
+      if result.not_modified and previous is not None:
+        return previous
+      manifest = json.loads(result.content)
+  except (requests.RequestException, OSError, ValueError) as e:
+    print(f"Could not fetch the snapshot manifest {url}: {str(e)}")
+    cached = snapshot_cache.load_response(url) if _is_url(url) else None
+    manifest = json.loads(cached[1]) if cached is not None else {'snapshots': {}}
+  return {date_str: frozenset(endings) for date_str, endings in manifest['snapshots'].items()}
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_snapshot_manifest() -> dict[str, frozenset[str]]:
+  """The snapshots of URL_ASSETS and their files: date_str -> filename endings.
+
+  The manifest is checked again at most every MANIFEST_TTL_SEC, with a conditional request.
+  """
+  global _manifest
+  with _manifest_lock:
+    if (_manifest is None or _manifest[0] != URL_ASSETS
+        or time.monotonic() - _manifest[1] >= MANIFEST_TTL_SEC):
+      previous = _manifest[2] if _manifest is not None and _manifest[0] == URL_ASSETS else None
+      _manifest = (URL_ASSETS, time.monotonic(), _load_manifest(URL_ASSETS, previous))
+    return _manifest[2]
+
+
+_reported_missing = set()
+
+
+def latest_snapshot_date(groups: str | tuple[str, ...]) -> str:
+  """The newest snapshot with the files of at least SNAPSHOT_MIN_COVERAGE of the symbols of
+  `groups` (see SNAPSHOT_GROUP_MIN_COVERAGE), or the one with the most of them if none has enough.
+
+  Without the manifest, the snapshots already in the snapshot cache are considered, and then the
+  FALLBACK_SNAPSHOT_DATES of `groups` if no snapshot has any of them. The
+  date is the key of all caches of a snapshot, so a new snapshot is picked up without a change
+  of the code and its data are loaded once. The missing symbols of the picked snapshot are
+  reported once.
+  """
+  groups = (groups,) if isinstance(groups, str) else groups
+  endings = {_symbol_filename_ending(symbol_name) for symbol_name in get_symbols(groups).index}
+  manifest = get_snapshot_manifest()
+  coverage = {date_str: len(endings & files) for date_str, files in manifest.items()}
+  if not coverage or max(coverage.values()) == 0:
+    # not older than the cached snapshots, `_get_latest_snapshot` would build an older one on
+    # every call
+    manifest = snapshot_cache.cached_snapshots()
+    coverage = {date_str: len(endings & files) for date_str, files in manifest.items()}
+  if not coverage or max(coverage.values()) == 0:
+    return max(FALLBACK_SNAPSHOT_DATES[group] for group in groups)
+
+  min_coverage = max(SNAPSHOT_GROUP_MIN_COVERAGE.get(group, SNAPSHOT_MIN_COVERAGE) for group in groups)
+  covered = [date_str for date_str, count in coverage.items() if count >= min_coverage * len(endings)]
+  if covered:
+    date_str = max(covered)
+  else:
+    date_str = max(coverage, key=lambda date_str: (coverage[date_str], date_str))
+  missing = endings - manifest[date_str]
+  if missing and (date_str, groups) not in _reported_missing:
+    _reported_missing.add((date_str, groups))
+    print(f'The {date_str} snapshot of {", ".join(groups)} misses the files of {sorted(missing)}.')
+  return date_str
+
+
+def latest_snapshot_by_default(groups: str | tuple[str, ...]):
+  """Decorator replacing a None first argument (the snapshot date) of the decorated function
+  with `latest_snapshot_date(groups)`. It goes above the cache decorators, so the caches are
+  keyed by the resolved date. `__wrapped__` stays the uncached function.
+  """
+  def decorator(fn):
+    first_arg = next(iter(inspect.signature(fn).parameters))
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+      if args and args[0] is None:
+        args = (latest_snapshot_date(groups),) + args[1:]
+      elif not args and kwargs.get(first_arg) is None:
+        kwargs[first_arg] = latest_snapshot_date(groups)
+      return fn(*args, **kwargs)
+
+    wrapper.__wrapped__ = getattr(fn, '__wrapped__', fn)
+    return wrapper
+
+  return decorator
+
+
+def _is_date_or_close(column: str) -> bool:
+  return column.lower() in ('date', 'close')
+
+
+# only the Date and Close columns of the dump files are parsed, the others (Open, High, Low,
+# Volume, ...) are skipped by the parser, with explicit dtypes. The header may be in any case,
+# so the dates are parsed (with the fast ISO 8601 parser) by `_close_series`.
+CLOSE_CSV_KWARGS = dict(usecols=_is_date_or_close, parse_dates=False,
+                        dtype={'Close': np.float64, 'close': np.float64})
+
+
+def _close_series(df: pd.DataFrame) -> pd.Series:
+  """The 'Date'-indexed close series of a frame read with CLOSE_CSV_KWARGS."""
+  df = df.rename(columns=str.lower)
+  index = pd.DatetimeIndex(pd.to_datetime(df['date'], format='ISO8601'), name='Date')
+  return pd.Series(df['close'].to_numpy(dtype=np.float64), index=index, name='Close')
+
 
-INFO = pd.DataFrame({
-    'yf_symbol': ['^GSPC', '^NDX', '^N100', '^RUT', '^IXIC', '^NYA', 'BTC-USD', 'ETH-USD'],
-    'filename_prefix': ['sp500', 'nasdaq100', 'euronext100', 'russel2000', 'nasdaq_comp', 'nyse_comp', 'btcusd', 'ethusd'],
-    'button_name': ['S&P 500', 'NASDAQ 100', 'EURONEXT 100', 'RUSSEL 2000', 'NASDAQ Composite', 'NYSE Composite', 'BTCUSD', 'ETHUSD'],
-    # 'legend_name': [],
-    'button_default': [True, True, True, True, False, False, True, True],
-    'button_selection': [True, True, True, True, False, False, True, True],
-})
+def read_close_csv(filepath_or_buffer, chunksize: Optional[int] = CSV_CHUNKSIZE) -> pd.Series:
+  """Read the close series of a csv file with a 'Date' and a 'Close' column, in any case.
 
+  Args:
+    chunksize: number of rows parsed at a time, so large files are streamed and only their
+      Date and Close values are ever kept in memory. None to parse the file at once.
 
-def download_and_save_data(dirpath: Path, tts=3):
-  current_date_str = date.today().strftime('%Y%m%d')
-  dirpath = dirpath / current_date_str
-  dirpath.mkdir()
-  for symbol, prefix, _, _, _ in INFO.itertuples(index=False):
-    df = yf.download(symbol, start='1927-01-01')
-    df.to_csv(dirpath / f'{current_date_str}-{prefix}-daily.csv')
-    time.sleep(3)
+  Returns:
+    close: float64 pd.Series with a 'Date' DatetimeIndex.
+  """
+  if chunksize is None:
+    return _close_series(pd.read_csv(filepath_or_buffer, **CLOSE_CSV_KWARGS))
+  with pd.read_csv(filepath_or_buffer, chunksize=chunksize, **CLOSE_CSV_KWARGS) as reader:
+    chunks = [_close_series(chunk) for chunk in reader]
+  return pd.concat(chunks) if len(chunks) > 1 else chunks[0]
 
 
 def _get_most_recent(dirpath: Path, prefix):
@@ -45,32 +425,26 @@ def _get_most_recent(dirpath: Path, prefix):
     return dirpath / f'{prefix}_{most_recent_date}.csv'
 
 
-@st.cache_data
-def get_close_data_from_dumps(date_str: str = '20240904'):
-  reader_fn = partial(pd.read_csv, parse_dates=['Date'], index_col='Date')
+@timed
+def load_close_data_from_dumps(date_str: str, symbol_names: Optional[list[str]] = None) -> pd.DataFrame:
+  """Uncached `get_close_data_from_dumps`, for callers that keep the result themselves."""
+  if symbol_names is None:
+    symbol_names = get_symbols(INFO_GROUPS).index.to_list()
+  endings = [_symbol_filename_ending(symbol_name) for symbol_name in symbol_names]
 
-  # TODO(panos): handle http error 404 not found
-
-  dfs = dict()
-  for name in INFO['filename_prefix']:
-    url = URL_ASSETS + date_str + f'/{date_str}-{name}-daily.csv'
-    try:
-      df = reader_fn(url)
-    except HTTPError as e:
-      if e.code == 404:
-        print(f"Error 404: The requested URL {url} was not found on the server.")
-      else:
-        print(f"HTTP Error: {e.code}")
-      continue
-    except Exception as e:
-      print(f"Unknown error: {e.reason}")
-      continue
-    else:
-      dfs[name] = df['Close']
+  def download_fn(endings):
+    # download all files of the snapshot at the same time
+    dfs = download_df_csvs([_symbol_url(date_str, ending) for ending in endings], **CLOSE_CSV_KWARGS)
+    return [_close_series(df) if df is not None else None for df in dfs]
+
+  # missing files are None and skipped
+  closes = cached_closes(date_str, endings, download_fn)
+  dfs = {symbol_name: closes[ending] for symbol_name, ending in zip(symbol_names, endings)
+         if closes[ending] is not None}
 
   # aggregate data and delete latest day to be sure all symbols
   # have no-NaN latest value
-  daily_close = pd.DataFrame(dfs)
+  daily_close = align_closes(dfs)
   daily_close = daily_close[:-1]
 
   # fill in gaps
@@ -79,18 +453,24 @@ def get_close_data_from_dumps(date_str: str = '20240904'):
   return daily_close
 
 
-def get_close_data_from_dir(dirpath: Path):
+@latest_snapshot_by_default(INFO_GROUPS)
+@timed_cache_data
+def get_close_data_from_dumps(date_str: Optional[str] = None, symbol_names: Optional[list[str]] = None):
+  """The aligned daily closes of `symbol_names` (by default of the INFO_GROUPS) of a dump (by
+  default the latest one), with a column per symbol. All files are downloaded at once.
+  """
+  return load_close_data_from_dumps(date_str, symbol_names)
 
-  reader_fn = partial(pd.read_csv, parse_dates=['Date'], index_col='Date')
 
-  dfs = dict()
-  for p in dirpath.glob('*.csv'):
-    name = p.name.split(sep='-')[1]
-    dfs[name] = reader_fn(p)['Close']
+@timed
+def get_close_data_from_dir(dirpath: Path):
+
+  filepaths = {p.name.split(sep='-')[1]: p for p in dirpath.glob('*.csv')}
+  dfs = cached_local_closes(filepaths, lambda names: [read_close_csv(filepaths[name]) for name in names])
 
   # aggregate data and delete latest day to be sure all symbols
   # have no-NaN latest value
-  daily_close = pd.DataFrame(dfs)
+  daily_close = align_closes(dfs)
   daily_close = daily_close[:-1]
 
   return daily_close
@@ -104,28 +484,28 @@ def get_latest_close_data_from_dir(dirpath: Path = Path()):
   reader_fn = partial(pd.read_csv, parse_dates=['Date'], index_col='Date')
 
   filepath_sp = _get_most_recent(dirpath, 's&p500_daily')
-  url_sp = URL_ASSETS + 's%26p500_daily_20240322.csv'
+  url_sp = URL_ASSETS + f's%26p500_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_sp is not None:
     sp500_daily = reader_fn(filepath_sp)
   else:
     sp500_daily = reader_fn(url_sp)
 
   filepath_nc = _get_most_recent(dirpath, 'nasdaq_comp_daily')
-  url_nc = URL_ASSETS + 'nasdaq_comp_daily_20240322.csv'
+  url_nc = URL_ASSETS + f'nasdaq_comp_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_nc is not None:
     nasdaq_comp_daily = reader_fn(filepath_nc)
   else:
     nasdaq_comp_daily = reader_fn(url_nc)
 
   filepath_r2 = _get_most_recent(dirpath, 'russel2000_daily')
-  url_r2 = URL_ASSETS + 'russel2000_daily_20240322.csv'
+  url_r2 = URL_ASSETS + f'russel2000_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_nc is not None:
     russel2000_daily = reader_fn(filepath_r2)
   else:
     russel2000_daily = reader_fn(url_r2)
 
   filepath_btc = _get_most_recent(dirpath, 'btcusd_daily')
-  url_btc = URL_ASSETS + 'btcusd_daily_20240322.csv'
+  url_btc = URL_ASSETS + f'btcusd_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_nc is not None:
     btcusd_daily = reader_fn(filepath_btc)
   else:
@@ -142,47 +522,161 @@ def get_latest_close_data_from_dir(dirpath: Path = Path()):
   return indices_all_daily_close
 
 
+def _first_valid_positions(values: np.ndarray) -> np.ndarray:
+  """Row position of the first non-NaN value of every column of a 2-D array.
+
+  Columns without any valid value get position `len(values)`.
+  """
+  valid = ~np.isnan(values)
+  return np.where(valid.any(axis=0), valid.argmax(axis=0), len(values))
+
+
+def _ffill_array(values: np.ndarray) -> np.ndarray:
+  """Forward fill NaNs along the first axis of a 2-D array. Leading NaNs are kept."""
+  idx = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+  np.maximum.accumulate(idx, axis=0, out=idx)
+  return np.take_along_axis(values, idx, axis=0)
+
+
+def _run_lengths(reset: np.ndarray, axis: int = 0, initial: Optional[np.ndarray] = None) -> np.ndarray:
+  """Number of rows since the latest True of `reset` (inclusive) along `axis`.
+
+  Rows before the first True of a column count from the first row, or continue from the
+  `initial` counters of the row before the first row (with the shape of `reset` without `axis`).
+  """
+  shape = [1] * reset.ndim
+  shape[axis] = reset.shape[axis]
+  rows = np.arange(reset.shape[axis]).reshape(shape)
+  before = 0 if initial is None else -np.expand_dims(np.asarray(initial, dtype=np.int64), axis) - 1
+  last_reset = np.where(reset, rows, before)
+  np.maximum.accumulate(last_reset, axis=axis, out=last_reset)
+  return rows - last_reset
+
+
+@timed
+def days_since_ath_array(values: np.ndarray, eps: Optional[float] = None
+                         ) -> tuple[np.ndarray, np.ndarray]:
+  """Vectorized `days_since_ath` for all columns of a 2-D (time x symbols) array at once.
+
+  Args:
+    values: float array of prices, possibly with NaNs.
+    eps: tolerance, a price within `eps` from the all time high resets the counter.
+
+  Returns:
+    num_days_since_ath: int32 array of the same shape as `values`. Rows before the first
+      valid value of a column are 0.
+    first_valid: the row position of the first valid value per column.
+  """
+  assert eps is None or (isinstance(eps, float) and eps >= 0.0)
+  eps = eps or 0
+  values = np.asarray(values, dtype=np.float64)
+  if values.ndim == 1:
+    values = values[:, None]
+  first_valid = _first_valid_positions(values)
+  # it can be that S&P does not have values for the weekend days
+  values = _ffill_array(values)
+
+  # the ath before each day, fmax skips the leading NaNs
+  ath = np.fmax.accumulate(values, axis=0)
+  prev_ath = np.full_like(ath, np.nan)
+  prev_ath[1:] = ath[:-1]
+  with np.errstate(invalid='ignore'):
+    reset = prev_ath - values < eps
+  rows = np.arange(len(values))[:, None]
+  reset |= rows == first_valid
+
+  num_days_since_ath = _run_lengths(reset)
+  num_days_since_ath[rows < first_valid] = 0
+
+  return num_days_since_ath.astype(np.int32), first_valid
+
+
 def days_since_ath(signal: pd.Series, eps: Optional[float] = None):
   assert isinstance(signal, pd.Series)
-  signal = signal.copy()
   # get rid of any NaNs in the beginning
   signal = signal[signal.first_valid_index():]
-  # it can be that S&P does not have values for the weekend days
-  signal = signal.ffill()
-  # assert not signal.isna().any(), (signal.name, signal.first_valid_index())
-  assert eps is None or (isinstance(eps, float) and eps >= 0.0)
-
-  ath = signal.iloc[0]
-  num_days_since_ath = [0]
-  eps = eps or 0
-  for i, price in enumerate(signal[1:]):
-    diff = ath - price
-    if diff < eps:
-      ath = max(ath, price)
-      num_days_since_ath.append(0)
-    else:
-      num_days_since_ath.append(num_days_since_ath[-1] + 1)
-  num_days_since_ath = pd.Series(num_days_since_ath, index=signal.index, dtype=np.int32)
+  num_days_since_ath, _ = days_since_ath_array(signal.to_numpy(dtype=np.float64), eps=eps)
+  num_days_since_ath = pd.Series(num_days_since_ath[:, 0], index=signal.index, dtype=np.int32)
 
   return num_days_since_ath
 
 
+def _pct_change_array(values: np.ndarray, days_periods) -> np.ndarray:
+  """Percentage changes of a forward filled (time x symbols) array for many periods at once.
+
+  Returns:
+    pct_change: float array of shape (len(days_periods), time, symbols). Changes that reach
+      before the first valid value of a column are NaN.
+  """
+  days_periods = np.asarray(days_periods, dtype=np.int64)
+  assert days_periods.ndim == 1 and (days_periods >= 1).all()
+  rows = np.arange(len(values))
+  prev_rows = rows[None, :] - days_periods[:, None]
+  prev = values[np.maximum(prev_rows, 0)]
+  prev[prev_rows < 0] = np.nan
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return (values[None] / prev - 1) * 100
+
+
+@timed
+def days_since_change_array(values: np.ndarray | pd.DataFrame, changes, days_periods, dtype=np.int32,
+                            out: Optional[np.ndarray] = None
+                            ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Vectorized `days_since_change` for many thresholds, periods and symbols at once.
+
+  The percentage changes are computed once per period and shared by all thresholds.
+
+  Args:
+    values: float (time x symbols) array or DataFrame of prices, possibly with NaNs.
+    changes: percentage changes, eg. [2, -1] for 2% and -1%
+    days_periods: numbers of days to accumulate for the change
+    dtype: integer dtype of the returned counters
+    out: optional preallocated counters array (eg. a memory-mapped file), `dtype` is then ignored
+
+  Returns:
+    num_days_since_change: array of shape (changes, days_periods, time, symbols). Rows before
+      the first valid value of a column are 0.
+    num_occurences: int64 array of shape (changes, days_periods, symbols)
+    first_valid: the row position of the first valid value per column.
+  """
+  values = np.asarray(values, dtype=np.float64)
+  if values.ndim == 1:
+    values = values[:, None]
+  changes = np.asarray(changes, dtype=np.float64)[:, None, None]
+  first_valid = _first_valid_positions(values)
+  # it can be that S&P does not have values for the weekend days
+  values = _ffill_array(values)
+  pct_change = _pct_change_array(values, days_periods)
+
+  rows = np.arange(len(values))[:, None]
+  num_days_since_change = out
+  if num_days_since_change is None:
+    num_days_since_change = np.empty((len(changes),) + pct_change.shape, dtype=dtype)
+  assert num_days_since_change.shape == (len(changes),) + pct_change.shape
+  num_occurences = np.empty(num_days_since_change.shape[:2] + values.shape[1:], dtype=np.int64)
+  # loop over periods only, to bound the size of the (changes x time x symbols) intermediates
+  for i, pct in enumerate(pct_change):
+    # NaN changes compare to False, so they reset the counter and are not occurences
+    keeps_counting = np.where(changes > 0, pct < changes, np.where(changes < 0, pct > changes, False))
+    keeps_counting[:, 0] = False
+    counters = _run_lengths(~keeps_counting, axis=1)
+    num_days_since_change[:, i] = counters
+    occured = np.where(changes > 0, pct >= changes, pct <= changes)
+    num_occurences[:, i] = np.count_nonzero(occured, axis=1)
+  num_days_since_change[..., rows < first_valid] = 0
+
+  return num_days_since_change, num_occurences, first_valid
+
+
 def _num_occurences(signal: pd.Series, change):
   """How many times a change larger than 'change' has occured.
   """
   assert isinstance(signal, pd.Series)
   # get rid of any NaNs in the beginning
   signal = signal[signal.first_valid_index():]
-  # it can be that S&P does not have values for the weekend days
-  signal = signal.ffill()
-
-  frac_change = signal.pct_change()[1:] # the first element is NaN
-  pct_change = frac_change * 100
+  _, num_occurences, _ = days_since_change_array(signal.to_numpy(dtype=np.float64), [change], [1])
 
-  num_occurences = pct_change >= change if change > 0 else pct_change <= change
-  num_occurences = np.count_nonzero(num_occurences)
-
-  return num_occurences
+  return int(num_occurences[0, 0, 0])
 
 
 def days_since_change(signal: pd.Series, change, days_period: int = 1,
@@ -202,27 +696,18 @@ def days_since_change(signal: pd.Series, change, days_period: int = 1,
   assert isinstance(days_period, int) and days_period >= 1
   # get rid of any NaNs in the beginning
   signal = signal[signal.first_valid_index():]
-  # it can be that S&P does not have values for the weekend days
-  signal = signal.ffill()
+  values = signal.to_numpy(dtype=np.float64)
 
-  frac_change = signal.pct_change(periods=days_period)[1:] # the first element is NaN
-  pct_change = frac_change * 100
-
-  num_days_since_change = [0]
-  for i, c in enumerate(pct_change):
-    if (change > 0 and c < change) or (change < 0 and c > change):
-      num_days_since_change.append(num_days_since_change[i] + 1)
-    else:
-      num_days_since_change.append(0)
-  num_days_since_change = pd.Series(num_days_since_change, index=signal.index, dtype=np.int32)
-
-  num_occurences = pct_change >= change if change > 0 else pct_change <= change
-  num_occurences = np.count_nonzero(num_occurences)
+  num_days_since_change, num_occurences, _ = days_since_change_array(values, [change], [days_period])
+  num_days_since_change = pd.Series(num_days_since_change[0, 0, :, 0], index=signal.index, dtype=np.int32)
+  num_occurences = int(num_occurences[0, 0, 0])
 
   rets = (num_days_since_change,)
 
   if return_pct_change:
-    rets = rets + (pct_change,)
+    pct_change = _pct_change_array(_ffill_array(values[:, None]), [days_period])[0, 1:, 0]
+    # the first element is NaN
+    rets = rets + (pd.Series(pct_change, index=signal.index[1:], name=signal.name),)
 
   if return_num_occurences:
     rets = rets + (num_occurences,)
@@ -230,19 +715,594 @@ def days_since_change(signal: pd.Series, change, days_period: int = 1,
   return rets[0] if len(rets) == 1 else rets
 
 
-@st.cache_data
+class AthState(NamedTuple):
+  """The end-of-series state of `days_since_ath_array`, per column, to resume it on new rows."""
+  num_rows: int
+  last_value: np.ndarray  # the last forward filled value
+  ath: np.ndarray
+  counter: np.ndarray
+  first_valid: np.ndarray
+
+
+def days_since_ath_state(values: np.ndarray, num_days_since_ath: np.ndarray, first_valid: np.ndarray
+                         ) -> AthState:
+  """The AthState after the rows of `values`, given their `days_since_ath_array` results."""
+  values = np.asarray(values, dtype=np.float64)
+  if values.ndim == 1:
+    values = values[:, None]
+  if len(values) == 0:
+    empty = np.full(values.shape[1], np.nan)
+    return AthState(0, empty, empty.copy(), np.zeros(values.shape[1], dtype=np.int64), first_valid)
+  last_value = _ffill_array(values)[-1]
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+    ath = np.nanmax(values, axis=0)
+  return AthState(len(values), last_value, ath, num_days_since_ath[-1].astype(np.int64), first_valid)
+
+
+@timed
+def resume_days_since_ath(new_values: np.ndarray, state: AthState, eps: Optional[float] = None
+                          ) -> tuple[np.ndarray, np.ndarray, AthState]:
+  """`days_since_ath_array` of rows appended after `state`, in O(new rows).
+
+  Returns:
+    num_days_since_ath: int32 counters of the new rows, equal to the last rows of a
+      `days_since_ath_array` call on all rows.
+    first_valid: the row position of the first valid value per column, of all rows.
+    state: the AthState after the new rows.
+  """
+  assert eps is None or (isinstance(eps, float) and eps >= 0.0)
+  eps = eps or 0
+  new_values = np.asarray(new_values, dtype=np.float64)
+  if new_values.ndim == 1:
+    new_values = new_values[:, None]
+  num_new_rows = len(new_values)
+  if num_new_rows == 0:
+    return np.zeros(new_values.shape, dtype=np.int32), state.first_valid, state
+  rows = state.num_rows + np.arange(num_new_rows)[:, None]
+  new_first_valid = state.num_rows + _first_valid_positions(new_values)
+  first_valid = np.where(state.first_valid < state.num_rows, state.first_valid,
+                         np.minimum(new_first_valid, state.num_rows + num_new_rows))
+
+  # forward fill and accumulate the ath from the state
+  values = _ffill_array(np.concatenate([state.last_value[None], new_values]))
+  ath = np.fmax.accumulate(np.concatenate([state.ath[None], values[1:]]), axis=0)
+  values = values[1:]
+  with np.errstate(invalid='ignore'):
+    reset = ath[:-1] - values < eps
+  reset |= rows == first_valid
+
+  num_days_since_ath = _run_lengths(reset, initial=state.counter)
+  num_days_since_ath[rows < first_valid] = 0
+
+  new_state = AthState(state.num_rows + num_new_rows, values[-1], ath[-1], num_days_since_ath[-1], first_valid)
+  return num_days_since_ath.astype(np.int32), first_valid, new_state
+
+
+class ChangeState(NamedTuple):
+  """The end-of-series state of `days_since_change_array`, to resume it on new rows."""
+  num_rows: int
+  # the last max(days_periods) forward filled rows, NaN-padded before the first row
+  tail: np.ndarray
+  counters: np.ndarray  # (changes x days_periods x columns)
+  num_occurences: np.ndarray  # (changes x days_periods x columns)
+  first_valid: np.ndarray
+
+
+def days_since_change_state(values: np.ndarray, num_days_since_change: np.ndarray,
+                            num_occurences: np.ndarray, first_valid: np.ndarray, days_periods
+                            ) -> ChangeState:
+  """The ChangeState after the rows of `values`, given their `days_since_change_array` results."""
+  values = np.asarray(values, dtype=np.float64)
+  if values.ndim == 1:
+    values = values[:, None]
+  tail = np.full((max(days_periods), values.shape[1]), np.nan)
+  num_tail_rows = min(len(tail), len(values))
+  if num_tail_rows > 0:
+    tail[len(tail) - num_tail_rows:] = _ffill_array(values)[len(values) - num_tail_rows:]
+  counters = (num_days_since_change[:, :, -1].astype(np.int64) if len(values) > 0
+              else np.zeros(num_occurences.shape, dtype=np.int64))
+  return ChangeState(len(values), tail, counters, num_occurences.astype(np.int64), first_valid)
+
+
+@timed
+def resume_days_since_change(new_values: np.ndarray, state: ChangeState, changes, days_periods,
+                             dtype=np.int32) -> tuple[np.ndarray, np.ndarray, np.ndarray, ChangeState]:
+  """`days_since_change_array` of rows appended after `state`, in O(new rows).
+
+  Returns:
+    num_days_since_change: counters of the new rows, of shape (changes, days_periods, new rows,
+      symbols), equal to the last rows of a `days_since_change_array` call on all rows.
+    num_occurences: int64 array of shape (changes, days_periods, symbols) of all rows.
+    first_valid: the row position of the first valid value per column, of all rows.
+    state: the ChangeState after the new rows.
+  """
+  new_values = np.asarray(new_values, dtype=np.float64)
+  if new_values.ndim == 1:
+    new_values = new_values[:, None]
+  num_new_rows, num_tail_rows = len(new_values), len(state.tail)
+  if num_new_rows == 0:
+    return (np.zeros((len(changes), len(days_periods)) + new_values.shape, dtype=dtype),
+            state.num_occurences, state.first_valid, state)
+  changes = np.asarray(changes, dtype=np.float64)[:, None, None]
+  rows = state.num_rows + np.arange(num_new_rows)[:, None]
+  new_first_valid = state.num_rows + _first_valid_positions(new_values)
+  first_valid = np.where(state.first_valid < state.num_rows, state.first_valid,
+                         np.minimum(new_first_valid, state.num_rows + num_new_rows))
+
+  # the changes of the new rows reach back into the tail, NaN before the first row
+  values = np.concatenate([state.tail, new_values])
+  values[num_tail_rows:] = _ffill_array(values)[num_tail_rows:]
+  pct_change = _pct_change_array(values, days_periods)[:, num_tail_rows:]
+
+  num_days_since_change = np.empty((len(changes),) + pct_change.shape, dtype=dtype)
+  num_occurences = state.num_occurences.copy()
+  for i, pct in enumerate(pct_change):
+    keeps_counting = np.where(changes > 0, pct < changes, np.where(changes < 0, pct > changes, False))
+    keeps_counting[:, rows[:, 0] == 0] = False
+    num_days_since_change[:, i] = _run_lengths(~keeps_counting, axis=1, initial=state.counters[:, i])
+    occured = np.where(changes > 0, pct >= changes, pct <= changes)
+    num_occurences[:, i] += np.count_nonzero(occured, axis=1)
+  num_days_since_change[..., rows < first_valid] = 0
+
+  new_state = ChangeState(state.num_rows + num_new_rows, values[-num_tail_rows:],
+                          num_days_since_change[:, :, -1].astype(np.int64), num_occurences, first_valid)
+  return num_days_since_change, num_occurences, first_valid, new_state
+
+
+def counters_to_frame(counters: np.ndarray, first_valid: np.ndarray, like: pd.DataFrame
+                      ) -> pd.DataFrame:
+  """Wrap a (time x symbols) counters array in a DataFrame with the index and columns of `like`.
+
+  The layout is the same as `like.apply(fn)` with the per-Series functions: every column
+  starts at its first valid value, so columns with leading NaNs become float.
+  """
+  return pd.DataFrame({
+      name: pd.Series(counters[start:, j], index=like.index[start:], name=name)
+      for j, (name, start) in enumerate(zip(like.columns, first_valid))})
+
+
+@timed_cache_data
 def batch_process(daily_close: pd.DataFrame):
   """Process everything in one function to reduce computations.
-  """
-  supported_column_names = set(INFO['filename_prefix'])
-  if len(new_cols := set(daily_close.columns) - supported_column_names) > 0:
-    raise ValueError(f'unexpected columns in `daily_close`: {new_cols}.')
 
-  dsath = daily_close.apply(days_since_ath)
+  All columns are processed at once, so any symbols of the registry can be given.
+  """
+  # the columns are independent, large inputs are spread over a process pool
+  num_days_since_ath, first_valid = map_column_chunks(days_since_ath_array,
+                                                      daily_close.to_numpy(dtype=np.float64))
+  dsath = counters_to_frame(num_days_since_ath, first_valid, daily_close)
 
   return dsath
 
 
+def _window_sums(cumsums: np.ndarray, window: int) -> np.ndarray:
+  """Sums over the trailing `window` rows from `cumsums`, which has a leading row of zeros.
+  Rows with fewer than `window` previous rows are NaN.
+  """
+  sums = np.full((len(cumsums) - 1,) + cumsums.shape[1:], np.nan)
+  if window < len(cumsums):
+    sums[window - 1:] = cumsums[window:] - cumsums[:-window]
+  return sums
+
+
+def _rolling_extremes(values: np.ndarray, windows, fn=np.fmax) -> list[np.ndarray]:
+  """The trailing `fn` (np.fmax or np.fmin) of `values` over every window, with a sparse table.
+
+  The table level k holds the extreme over the trailing 2**k rows and is built once for all
+  windows, then every window combines two overlapping levels, in O(rows) per window instead of
+  O(rows x window). Rows with fewer than `window` previous rows use the available ones.
+  """
+  levels = [values]
+  while 2 ** len(levels) <= max(windows):
+    prev, shift = levels[-1], 2 ** (len(levels) - 1)
+    level = prev.copy()
+    level[shift:] = fn(prev[shift:], prev[:-shift])
+    levels.append(level)
+
+  extremes = []
+  for window in windows:
+    k = int(np.log2(window))
+    level, shift = levels[k], window - 2 ** k
+    extreme = level.copy()
+    if shift > 0:
+      extreme[shift:] = fn(level[shift:], level[:-shift])
+    extremes.append(extreme)
+  return extremes
+
+
+def _shifted(values: np.ndarray, shift: int) -> np.ndarray:
+  """`values` moved `shift` rows later, the first rows are NaN."""
+  if shift == 0:
+    return values
+  shifted = np.full_like(values, np.nan)
+  if shift < len(values):
+    shifted[shift:] = values[:-shift]
+  return shifted
+
+
+def _rolling_max_drawdowns(values: np.ndarray, windows) -> list[np.ndarray]:
+  """The largest drop below a running high within the trailing window, for every window, as a
+  fraction (<= 0). The running high starts at the first row of the window.
+
+  Like in `_rolling_extremes`, the table level k describes the trailing 2**k rows, by their
+  high, low and largest drop. The largest drop of two adjacent blocks is the larger of their
+  own ones and of the drop from the high of the earlier block to the low of the later one, so a
+  window is combined from the blocks of the binary digits of its length, in O(rows x log(window))
+  per window. Rows with fewer than `window` previous rows use the available ones.
+  """
+  def combine(earlier, later):
+    (high1, low1, drop1), (high2, low2, drop2) = earlier, later
+    return np.fmax(high1, high2), np.fmin(low1, low2), np.fmin(np.fmin(drop1, drop2), low2 / high1 - 1)
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    levels = [(values, values, np.where(np.isnan(values), np.nan, 0.))]
+    while 2 ** len(levels) <= max(windows):
+      shift = 2 ** (len(levels) - 1)
+      levels.append(combine([_shifted(x, shift) for x in levels[-1]], levels[-1]))
+
+    drops = []
+    for window in windows:
+      # from the latest block (the lowest digit) to the earliest one
+      block, end = None, 0
+      for k, level in enumerate(levels):
+        if window >> k & 1:
+          earlier = tuple(_shifted(x, end) for x in level)
+          block = earlier if block is None else combine(earlier, block)
+          end += 2 ** k
+      drops.append(block[2])
+  return drops
+
+
+class RollingMetrics(NamedTuple):
+  """Rolling-window metrics of aligned series, see `compute_rolling_metrics`."""
+  dates: np.ndarray  # datetime64
+  columns: tuple[str, ...]
+  windows: tuple[int, ...]
+  # metric name -> (windows x dates x columns) array, NaN where a window is not full
+  values: dict[str, np.ndarray]
+  # the column of the correlations, None without them
+  reference: Optional[str] = None
+
+
+@timed
+def compute_rolling_metrics(closes: pd.DataFrame, windows=ROLLING_WINDOWS, metrics=ROLLING_METRICS,
+                            reference: Optional[str] = None, dtype=np.float64) -> RollingMetrics:
+  """Compute rolling-window metrics of all columns of `closes` for many windows at once.
+
+  Instead of a pandas `.rolling()` call per window and metric, the cumulative sums of the
+  daily log returns (and their squares and products) are computed once, and every window is a
+  difference of two shifted cumulative sums. The rolling highs and lows share one sparse table
+  (see `_rolling_extremes`), the max drawdowns a similar table (see `_rolling_max_drawdowns`).
+  So the cost of a window is O(rows x columns).
+
+  Metrics:
+    return_pct: the percentage change over the window.
+    volatility_pct: the annualized (ROLLING_DAYS_PER_YEAR) standard deviation of the daily log
+      returns over the window, in percent.
+    drawdown_pct: the percentage below the highest close of the window.
+    max_drawdown_pct: the largest drop below a running high within the window, with the high
+      taken from the first row of the window on.
+    correlation: the correlation of the daily log returns with the `reference` column.
+
+  Args:
+    closes: aligned closes (or ratios) with a column per series, forward filled here.
+    windows: window lengths, in rows.
+    reference: the column the correlations are computed with, defaults to the first column.
+    dtype: float dtype of the returned metrics.
+  """
+  windows = tuple(int(window) for window in windows)
+  assert all(window >= 3 for window in windows)
+  if unknown := set(metrics) - set(ROLLING_METRICS):
+    raise ValueError(f'Unknown rolling metrics: {unknown}.')
+  columns = list(closes.columns)
+  values = _ffill_array(closes.to_numpy(dtype=np.float64))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    log_values = np.log(np.where(values > 0, values, np.nan))
+  num_rows = len(values)
+
+  # daily log returns, centered per column for the precision of the sums of squares
+  returns = np.full_like(log_values, np.nan)
+  returns[1:] = np.diff(log_values, axis=0)
+  valid = ~np.isnan(returns)
+  # flat stretches (eg. forward filled gaps) have no variance, but their sums of squares only cancel
+  # up to rounding, so they are told apart by their count of moving days
+  moving = valid & (returns != 0)
+  with np.errstate(invalid='ignore'), warnings.catch_warnings():
+    warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+    returns = np.where(valid, returns - np.nanmean(returns, axis=0), 0)
+
+  def cumsums(x):
+    return np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+
+  results = {metric: np.empty((len(windows), num_rows, len(columns)), dtype=dtype) for metric in metrics}
+  if 'return_pct' in metrics:
+    results['return_pct'][:] = _pct_change_array(values, windows)
+  if 'volatility_pct' in metrics or 'correlation' in metrics:
+    count_sums, sums, square_sums = cumsums(valid), cumsums(returns), cumsums(returns**2)
+    moving_sums = cumsums(moving)
+  if 'correlation' in metrics:
+    j = columns.index(reference) if reference is not None else 0
+    reference = columns[j]
+    # only the days where both returns are given
+    pair_valid = valid & valid[:, [j]]
+    x, y = np.where(pair_valid, returns, 0), np.where(pair_valid, returns[:, [j]], 0)
+    pair_count_sums, product_sums = cumsums(pair_valid), cumsums(x * y)
+    x_moving_sums, y_moving_sums = cumsums(pair_valid & moving), cumsums(pair_valid & moving[:, [j]])
+    x_sums, x_square_sums, y_sums, y_square_sums = cumsums(x), cumsums(x**2), cumsums(y), cumsums(y**2)
+  if 'drawdown_pct' in metrics:
+    highs = _rolling_extremes(values, windows, np.fmax)
+  if 'max_drawdown_pct' in metrics:
+    max_drawdowns = _rolling_max_drawdowns(values, windows)
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    for i, window in enumerate(windows):
+      if 'volatility_pct' in metrics:
+        # the window of `window` closes has `window - 1` returns
+        n = window - 1
+        full = _window_sums(count_sums, n) == n
+        s1, s2 = _window_sums(sums, n), _window_sums(square_sums, n)
+        variance = np.where(_window_sums(moving_sums, n) > 0, np.maximum(s2 - s1**2 / n, 0) / (n - 1), 0)
+        results['volatility_pct'][i] = np.where(full, np.sqrt(variance * ROLLING_DAYS_PER_YEAR) * 100, np.nan)
+      if 'correlation' in metrics:
+        n = window - 1
+        full = _window_sums(pair_count_sums, n) == n
+        full &= (_window_sums(x_moving_sums, n) > 0) & (_window_sums(y_moving_sums, n) > 0)
+        sx, sy = _window_sums(x_sums, n), _window_sums(y_sums, n)
+        sxx, syy = _window_sums(x_square_sums, n), _window_sums(y_square_sums, n)
+        sxy = _window_sums(product_sums, n)
+        covariance = sxy - sx * sy / n
+        correlation = covariance / np.sqrt((sxx - sx**2 / n) * (syy - sy**2 / n))
+        results['correlation'][i] = np.where(full, np.clip(correlation, -1, 1), np.nan)
+      if 'drawdown_pct' in metrics:
+        results['drawdown_pct'][i] = (values / highs[i] - 1) * 100
+      if 'max_drawdown_pct' in metrics:
+        results['max_drawdown_pct'][i] = max_drawdowns[i] * 100
+
+  for result in results.values():
+    result.flags.writeable = False
+  dates = np.array(closes.index.to_numpy(), dtype=np.datetime64)
+  dates.flags.writeable = False
+  return RollingMetrics(dates, tuple(columns), windows, results,
+                        reference if 'correlation' in metrics else None)
+
+
+def rolling_metric_frame(rolling: RollingMetrics, metric: str, window: int,
+                         columns: Optional[list[str]] = None, index_name: str = 'Date') -> pd.DataFrame:
+  """A 'Date'-indexed DataFrame of one metric and window of `rolling`, without copying when
+  all columns are selected."""
+  values = rolling.values[metric][rolling.windows.index(window)]
+  if columns is not None:
+    values = values[:, [rolling.columns.index(column) for column in columns]]
+  index = pd.DatetimeIndex(rolling.dates, name=index_name, copy=False)
+  return pd.DataFrame(values, index=index, columns=list(rolling.columns) if columns is None else columns,
+                      copy=False)
+
+
+class CompactFrame(NamedTuple):
+  """A Date-indexed frame stored as one contiguous, read-only 2-D array."""
+  dates: np.ndarray  # datetime64 (int64), shared by the frames of a snapshot
+  values: np.ndarray  # (dates x columns)
+  columns: tuple[str, ...]
+
+
+def to_compact(df: pd.DataFrame, dtype=np.float32, dates: Optional[np.ndarray] = None
+               ) -> CompactFrame:
+  """Copy `df` once into a CompactFrame of `dtype`. `dates` can be given to share the date axis
+  of another CompactFrame with the same index.
+  """
+  if dates is None:
+    dates = np.array(df.index.to_numpy(), dtype=np.datetime64)
+    dates.flags.writeable = False
+  assert len(dates) == len(df)
+  values = np.ascontiguousarray(df.to_numpy(dtype=dtype))
+  values.flags.writeable = False
+  return CompactFrame(dates, values, tuple(df.columns))
+
+
+def compact_to_frame(compact: CompactFrame, index_name: str = 'Date') -> pd.DataFrame:
+  """A read-only DataFrame view of `compact`, without copying its arrays."""
+  index = pd.DatetimeIndex(compact.dates, name=index_name, copy=False)
+  return pd.DataFrame(compact.values, index=index, columns=list(compact.columns), copy=False)
+
+
+class InfoSnapshot(NamedTuple):
+  """The data of all symbols of the INFO_GROUPS of a dump, see `get_info_snapshot`."""
+  date_str: str
+  close: CompactFrame
+  # sharing the date axis of `close`, rows before the first valid value of a column are 0
+  days_since_ath: CompactFrame
+  # the row position of the first valid value per column, see `counters_to_frame`
+  days_since_ath_first_valid: np.ndarray
+
+
+# the latest snapshot per kind, shared by all sessions of the process: kind -> (date_str, snapshot)
+_snapshots = dict()
+_snapshot_locks = dict()
+
+
+def _get_latest_snapshot(kind: str, date_str: str, build_fn: Callable):
+  """The `kind` snapshot of `date_str`, built once with `build_fn(date_str)` and shared.
+
+  Only the latest date of every kind is kept. When a newer date is requested, its snapshot is
+  built completely and then swapped in, so readers see either the old or the new snapshot and
+  sessions holding the old one keep a consistent view until their next rerun.
+  """
+  entry = _snapshots.get(kind)
+  if entry is not None and entry[0] == date_str:
+    return entry[1]
+  with _snapshot_locks.setdefault(kind, threading.Lock()):
+    entry = _snapshots.get(kind)
+    if entry is None or entry[0] < date_str:
+      entry = (date_str, build_fn(date_str))
+      _snapshots[kind] = entry
+    if entry[0] == date_str:
+      return entry[1]
+  # an older snapshot is built for the caller but not kept
+  return build_fn(date_str)
+
+
+def _resumable_prefix(state: Optional[tuple[str, dict]], columns, dates: np.ndarray, values: np.ndarray
+                      ) -> Optional[int]:
+  """The number of rows of a saved state (see `snapshot_cache.load_state`) if its snapshot is a
+  prefix of `dates` and `values` with the same `columns`, so the state can be resumed."""
+  if state is None:
+    return None
+  _, arrays = state
+  num_rows = int(arrays['num_rows'])
+  if (arrays['columns'].tolist() != list(columns) or num_rows > len(dates)
+      or snapshot_cache.digest(dates[:num_rows], values[:num_rows]) != str(arrays['digest'])):
+    return None
+  return num_rows
+
+
+def _resumable_days_since_ath(kind: str, date_str: str, close: CompactFrame
+                              ) -> tuple[np.ndarray, np.ndarray]:
+  """`days_since_ath_array` of `close`, resumed from the saved state of the latest older
+  snapshot of `kind` when its rows are the first rows of `close`, so only the new rows are
+  computed. The state of `close` is saved for the next snapshot.
+  """
+  previous = snapshot_cache.load_state(kind, date_str)
+  num_rows = _resumable_prefix(previous, close.columns, close.dates, close.values)
+  if num_rows is not None:
+    arrays = previous[1]
+    state = AthState(num_rows, arrays['last_value'], arrays['ath'], arrays['counter'], arrays['first_valid'])
+    new_num_days_since_ath, first_valid, state = resume_days_since_ath(close.values[num_rows:], state)
+    num_days_since_ath = np.concatenate([arrays['num_days_since_ath'], new_num_days_since_ath])
+  else:
+    num_days_since_ath, first_valid = days_since_ath_array(close.values)
+    state = days_since_ath_state(close.values, num_days_since_ath, first_valid)
+
+  snapshot_cache.save_state(kind, date_str, columns=np.array(close.columns, dtype=str),
+                            digest=snapshot_cache.digest(close.dates, close.values),
+                            num_days_since_ath=num_days_since_ath, **state._asdict())
+  return num_days_since_ath, first_valid
+
+
+@timed
+def _build_info_snapshot(date_str: str) -> InfoSnapshot:
+  close = to_compact(load_close_data_from_dumps(date_str), np.float32 if COMPACT_MODE else np.float64)
+  num_days_since_ath, first_valid = _resumable_days_since_ath('info-days_since_ath', date_str, close)
+  if COMPACT_MODE:
+    # the counters are at most the number of days
+    num_days_since_ath = num_days_since_ath.astype(
+        np.uint16 if len(close.dates) <= np.iinfo(np.uint16).max else np.uint32)
+  num_days_since_ath.flags.writeable = False
+  return InfoSnapshot(date_str, close, CompactFrame(close.dates, num_days_since_ath, close.columns),
+                      first_valid)
+
+
+@latest_snapshot_by_default(INFO_GROUPS)
+def get_info_snapshot(date_str: Optional[str] = None) -> InfoSnapshot:
+  """The closes and days since ATH of all symbols of the INFO_GROUPS of the `date_str` dump.
+
+  The whole group is computed once and pages select their symbols as columns of the views.
+
+  The arrays are read-only, pages read them through `compact_to_frame` and `counters_to_frame`
+  views instead of per-session copies. With COMPACT_MODE the closes are float32 and the
+  counters uint16, otherwise float64 and int32.
+  """
+  return _get_latest_snapshot('info', date_str, _build_info_snapshot)
+
+
+def _build_days_since_change_cube(date_str: str, dirpath: Path):
+  """Compute all slider combinations of `days_since_change_array` for the `date_str` dump
+  and save them in `dirpath`. The counters are written straight into a memory-mapped file.
+
+  When the cube of an older dump is a prefix of this one, its rows are copied and only the
+  new rows are computed from its saved end-of-series state, then the older cube is deleted.
+  """
+  close = get_info_snapshot(date_str).close
+  values = close.values.astype(np.float64)
+  # the counters are at most the number of days
+  dtype = np.uint16 if len(values) <= np.iinfo(np.uint16).max else np.uint32
+  kind = 'info-days_since_change'
+
+  dirpath.mkdir(parents=True, exist_ok=True)
+  tmp_filepath = dirpath / f'{date_str}-days_since_change.{os.getpid()}.tmp.npy'
+  shape = (len(SLIDER_CHANGES), len(SLIDER_DAYS_PERIODS)) + values.shape
+  out = np.lib.format.open_memmap(tmp_filepath, mode='w+', dtype=dtype, shape=shape)
+
+  previous = snapshot_cache.load_state(kind, date_str)
+  num_rows = _resumable_prefix(previous, close.columns, close.dates, values)
+  previous_filepath = None if previous is None else dirpath / f'{previous[0]}-days_since_change.npy'
+  if num_rows is not None and previous_filepath.exists() and previous[0] != date_str:
+    previous_cube = np.load(previous_filepath, mmap_mode='r')
+    for i in range(len(SLIDER_CHANGES)):
+      out[i, :, :num_rows] = previous_cube[i]
+    del previous_cube
+    arrays = previous[1]
+    state = ChangeState(num_rows, arrays['tail'], arrays['counters'], arrays['num_occurences'],
+                        arrays['first_valid'])
+    new_counters, num_occurences, first_valid, state = resume_days_since_change(
+        values[num_rows:], state, SLIDER_CHANGES, SLIDER_DAYS_PERIODS, dtype=dtype)
+    out[:, :, num_rows:] = new_counters
+  else:
+    # the workers of a parallel run write their columns straight into the file
+    _, num_occurences, first_valid = map_column_chunks(
+        days_since_change_array, values, out=out, changes=SLIDER_CHANGES, days_periods=SLIDER_DAYS_PERIODS)
+    state = days_since_change_state(values, out, num_occurences, first_valid, SLIDER_DAYS_PERIODS)
+  out.flush()
+  del out
+  digest = snapshot_cache.digest(close.dates, values)
+  meta_filepath = dirpath / f'{date_str}-days_since_change-meta.npz'
+  tmp_meta_filepath = meta_filepath.with_name(f'{meta_filepath.stem}.{os.getpid()}.tmp.npz')
+  np.savez(tmp_meta_filepath, num_occurences=num_occurences, first_valid=first_valid,
+           columns=np.array(close.columns, dtype=str), digest=digest)
+  # the meta first and the cube last, so that a cube is never picked up without its meta or
+  # after an interrupted build
+  os.replace(tmp_meta_filepath, meta_filepath)
+  os.replace(tmp_filepath, dirpath / f'{date_str}-days_since_change.npy')
+  snapshot_cache.save_state(kind, date_str, columns=np.array(close.columns, dtype=str), digest=digest,
+                            **state._asdict())
+  if previous_filepath is not None and previous[0] < date_str:
+    previous_filepath.unlink(missing_ok=True)
+    (dirpath / f'{previous[0]}-days_since_change-meta.npz').unlink(missing_ok=True)
+
+
+def _load_days_since_change_cube(filepath: Path, close: CompactFrame):
+  """The `get_days_since_change_cube` saved at `filepath`, None if there is none or it was built
+  from other closes than `close` (eg. with other symbols or COMPACT_MODE)."""
+  meta_filepath = filepath.with_name(f'{filepath.stem}-meta.npz')
+  if not filepath.exists() or not meta_filepath.exists():
+    return None
+  with np.load(meta_filepath) as meta:
+    if 'digest' not in meta or meta['columns'].tolist() != list(close.columns):
+      return None
+    num_occurences, first_valid, columns, digest = (meta['num_occurences'], meta['first_valid'],
+                                                    meta['columns'], str(meta['digest']))
+  num_days_since_change = np.load(filepath, mmap_mode='r')
+  if (num_days_since_change.shape[2:] != close.values.shape
+      or digest != snapshot_cache.digest(close.dates, close.values.astype(np.float64))):
+    return None
+  return num_days_since_change, num_occurences, first_valid, columns.tolist()
+
+
+@latest_snapshot_by_default(INFO_GROUPS)
+@timed_cache_resource(max_entries=SNAPSHOT_CACHE_MAX_ENTRIES)
+def get_days_since_change_cube(date_str: Optional[str] = None, dirpath: Path = CACHE_DIR):
+  """All combinations of the "days since change" sliders for all symbols of the `date_str` dump.
+
+  The cube is kept on disk and memory-mapped read-only, so any slider position is an O(1)
+  slice. Only the maps of the last SNAPSHOT_CACHE_MAX_ENTRIES snapshots are kept, so the disk
+  space of a deleted older cube is freed.
+
+  Returns:
+    num_days_since_change: memory-mapped array of shape
+      (len(SLIDER_CHANGES), len(SLIDER_DAYS_PERIODS), time, symbols)
+    num_occurences: int64 array of shape (len(SLIDER_CHANGES), len(SLIDER_DAYS_PERIODS), symbols)
+    first_valid: the row position of the first valid value per symbol
+    columns: the symbol (filename_prefix) of every symbol axis position
+  """
+  close = get_info_snapshot(date_str).close
+  filepath = dirpath / f'{date_str}-days_since_change.npy'
+  cube = _load_days_since_change_cube(filepath, close)
+  if cube is None:
+    _build_days_since_change_cube(date_str, dirpath)
+    cube = _load_days_since_change_cube(filepath, close)
+  return cube
+
+
 @st.cache_data
 @deprecated('Use the get_close_data_from_* functions.')
 def get_latest_close_data(dirpath: Path = Path()):
@@ -252,28 +1312,28 @@ def get_latest_close_data(dirpath: Path = Path()):
   reader_fn = partial(pd.read_csv, parse_dates=['Date'], index_col='Date')
 
   filepath_sp = _get_most_recent(dirpath, 's&p500_daily')
-  url_sp = URL_ASSETS + 's%26p500_daily_20240322.csv'
+  url_sp = URL_ASSETS + f's%26p500_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_sp is not None:
     sp500_daily = reader_fn(filepath_sp)
   else:
     sp500_daily = reader_fn(url_sp)
 
   filepath_nc = _get_most_recent(dirpath, 'nasdaq_comp_daily')
-  url_nc = URL_ASSETS + 'nasdaq_comp_daily_20240322.csv'
+  url_nc = URL_ASSETS + f'nasdaq_comp_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_nc is not None:
     nasdaq_comp_daily = reader_fn(filepath_nc)
   else:
     nasdaq_comp_daily = reader_fn(url_nc)
 
   filepath_r2 = _get_most_recent(dirpath, 'russel2000_daily')
-  url_r2 = URL_ASSETS + 'russel2000_daily_20240322.csv'
+  url_r2 = URL_ASSETS + f'russel2000_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_nc is not None:
     russel2000_daily = reader_fn(filepath_r2)
   else:
     russel2000_daily = reader_fn(url_r2)
 
   filepath_btc = _get_most_recent(dirpath, 'btcusd_daily')
-  url_btc = URL_ASSETS + 'btcusd_daily_20240322.csv'
+  url_btc = URL_ASSETS + f'btcusd_daily_{LEGACY_DUMP_DATE}.csv'
   if filepath_nc is not None:
     btcusd_daily = reader_fn(filepath_btc)
   else:
@@ -290,29 +1350,48 @@ def get_latest_close_data(dirpath: Path = Path()):
   return indices_all_daily_close
 
 
-def download_df_csv(url: URL) -> Optional[pd.DataFrame]:
-  """Download a csv dataframe from `url`. The csv file must have a 'Date' column.
+def _symbol_filename_ending(symbol_name: str) -> str:
+  registry = get_symbol_registry()
+  if symbol_name not in registry.index:
+    raise ValueError('Symbol name not supported.')
+  prefix, frequency = registry.loc[symbol_name, ['filename_prefix', 'frequency']]
+  return f'{prefix}-{frequency}'
+
+
+def _symbol_url(date_str: str, ending: str) -> URL:
+  return URL_ASSETS + f'{date_str}/{date_str}-{ending}.csv'
+
+
+@timed_cache_data
+def get_close_data_by_symbols(symbol_names: list[str], symbol_source: Path | URL) -> dict[str, pd.Series]:
+  """Like `get_close_data_by_symbol` for many symbols, downloading the online files concurrently.
 
   Returns:
-    df: pd.DataFrame or None if an error occurred.
+    closes: a dict from symbol name to its close pd.Series, in the order of `symbol_names`.
   """
-  reader_fn = partial(pd.read_csv, parse_dates=['Date'])
-  try:
-    df = reader_fn(url)
-  except HTTPError as e:
-    if e.code == 404:
-      print(f"Error 404: The requested URL {url} was not found on the server.")
-    else:
-      print(f"HTTP Error: {e.code}")
-    df = None
-  except Exception as e:
-    print(f"Unknown error: {str(e)}")
-    df = None
+  endings = [_symbol_filename_ending(symbol_name) for symbol_name in symbol_names]
+  if isinstance(symbol_source, Path) and symbol_source.is_dir() and symbol_source.exists():
+    filepaths = {ending: symbol_source / f'{symbol_source.name}-{ending}.csv' for ending in endings}
+    closes = cached_local_closes(filepaths, lambda endings: [read_close_csv(filepaths[ending])
+                                                             for ending in endings])
+  elif isinstance(symbol_source, URL):
+    def load_fn(endings):
+      dfs = download_df_csvs([_symbol_url(symbol_source, ending) for ending in endings],
+                             **CLOSE_CSV_KWARGS)
+      return [_close_series(df) if df is not None else None for df in dfs]
+    closes = cached_closes(symbol_source, endings, load_fn)
+  else:
+    raise NotImplementedError(f'Getting data for {symbol_names} from {symbol_source} is not implemented.')
 
-  return df
+  for ending, close in closes.items():
+    if close is None:
+      raise ValueError(f'Could not download data from {_symbol_url(symbol_source, ending)}.')
 
+  return {symbol_name: closes[ending].rename('close').rename_axis('date')
+          for symbol_name, ending in zip(symbol_names, endings)}
 
-@st.cache_data
+
+@timed_cache_data
 def get_close_data_by_symbol(symbol_name: str, symbol_source: Path | URL) -> pd.Series:
   """
   
@@ -320,23 +1399,7 @@ def get_close_data_by_symbol(symbol_name: str, symbol_source: Path | URL) -> pd.
     symbol_source: The source of the data. If a Path is given, it is assumed to exist
       locally. If a date string is given, it is assumed it is online.
   """
-  if symbol_name not in ['^FTW5000', '^NDX', '^SPX', '^SPXEW', '^IXIC', 'USGDP']:
-    raise ValueError('Symbol name not supported.')
-
-  ending = f'{symbol_name.lower()}-yearly' if symbol_name in ['USGDP'] else f'{symbol_name[1:].lower()}-daily'
-  if isinstance(symbol_source, Path) and symbol_source.is_dir() and symbol_source.exists():
-    df = pd.read_csv(symbol_source / f'{symbol_source.name}-{ending}.csv', parse_dates=['Date'])
-  elif isinstance(symbol_source, URL):
-    url = URL_ASSETS + f'{symbol_source}/{symbol_source}-{ending}.csv'
-    df = download_df_csv(url)
-    if df is None:
-      raise ValueError(f'Could not download data from {url}.')
-  else:
-    raise NotImplementedError(f'Getting data for {symbol_name} from {symbol_source} is not implemented.')
-
-  df.columns = df.columns.str.lower()
-  df = df.set_index('date')
-  return df['close']
+  return get_close_data_by_symbols([symbol_name], symbol_source)[symbol_name]
 
 
 def _reindex_and_compute_ratio(a: pd.Series, b: pd.Series):
@@ -355,8 +1418,129 @@ def _reindex_and_compute_ratio(a: pd.Series, b: pd.Series):
   return a / b_aligned
 
 
-@st.cache_data
-def get_ratios_df(symbol_source: Path | URL = '20241203',
+# name: (numerator symbol, denominator symbol) of the ratios of `get_ratios_df`
+USA_RATIOS = {
+    'spx/ftw5000': ('^SPX', '^FTW5000'),
+    'spx/spxew': ('^SPX', '^SPXEW'),
+    'ndx/spx': ('^NDX', '^SPX'),
+    'ndx/ixic': ('^NDX', '^IXIC'),
+    'spx/usgdp': ('^SPX', 'USGDP'),
+    'ftw5000/usgdp': ('^FTW5000', 'USGDP'),
+}
+
+
+def align_closes(closes: dict[str, pd.Series]) -> pd.DataFrame:
+  """Align all `closes` once on the sorted union of their dates (the master calendar).
+
+  The values are written straight into one preallocated (dates x symbols) array, without the
+  intermediate reindexed copies of `pd.concat`.
+
+  Returns:
+    aligned: float64 pd.DataFrame with a column per symbol, NaN where a symbol has no value
+      for a date.
+  """
+  for close in closes.values():
+    if not isinstance(close.index, pd.DatetimeIndex):
+      raise ValueError('Indices must be of DatetimeIndex.')
+  if not closes:
+    return pd.DataFrame()
+  indices = [close.index for close in closes.values()]
+  index = indices[0].append(indices[1:]).unique().sort_values()
+
+  values = np.full((len(index), len(closes)), np.nan)
+  for j, close in enumerate(closes.values()):
+    values[index.get_indexer(close.index), j] = close.to_numpy(dtype=np.float64)
+
+  return pd.DataFrame(values, index=index, columns=list(closes), copy=False)
+
+
+@timed
+def compute_ratios(closes: dict[str, pd.Series], ratios: dict[str, tuple[str, str]]) -> pd.DataFrame:
+  """Compute all `ratios` of `closes` in one vectorized division.
+
+  Like `_reindex_and_compute_ratio`, every denominator is forward filled to the dates of its
+  numerator, and the result has the union of the dates of the numerators.
+
+  Args:
+    closes: symbol name -> close pd.Series with a DatetimeIndex.
+    ratios: ratio name -> (numerator symbol name, denominator symbol name)
+
+  Returns:
+    ratios_df: pd.DataFrame with a column per ratio.
+  """
+  aligned = align_closes(closes)
+  values = aligned.to_numpy(dtype=np.float64)
+  columns = aligned.columns.to_list()
+  numerators = [columns.index(num) for num, _ in ratios.values()]
+  denominators = [columns.index(den) for _, den in ratios.values()]
+
+  ratio_values = values[:, numerators] / _ffill_array(values[:, denominators])
+
+  # keep only the dates where at least one numerator is given
+  keep = np.zeros(len(aligned), dtype=bool)
+  for num in set(numerators):
+    keep |= aligned.index.isin(closes[columns[num]].index)
+
+  return pd.DataFrame(ratio_values[keep], index=aligned.index[keep], columns=list(ratios))
+
+
+def _resumable_compute_ratios(kind: str, date_str: str, closes: dict[str, pd.Series],
+                              ratios: dict[str, tuple[str, str]]) -> pd.DataFrame:
+  """`compute_ratios`, resumed from the saved state of the latest older snapshot of `kind`.
+
+  The state is the ratios and the last aligned (forward filled) value of every symbol. When
+  every close series of the older snapshot is a prefix of the new one and all new rows are
+  after its last date, only the new rows are computed: each new part is seeded with the last
+  aligned value, so the denominators are forward filled as in a full computation.
+  """
+  symbols = list(closes)
+  lengths = np.array([len(close) for close in closes.values()])
+  previous = snapshot_cache.load_state(kind, date_str)
+  ratios_df = None
+  if previous is not None:
+    arrays = previous[1]
+    old_lengths = arrays['lengths']
+    last_date = pd.Timestamp(arrays['last_date'][()])
+    if (arrays['symbols'].tolist() == symbols and arrays['columns'].tolist() == list(ratios)
+        and (old_lengths <= lengths).all()
+        and str(arrays['digest']) == _closes_digest(closes, old_lengths)
+        and all(close.index[n:].min() > last_date for close, n in zip(closes.values(), old_lengths)
+                if len(close) > n)):
+      seeded = {symbol: pd.concat([pd.Series([value], index=pd.DatetimeIndex([last_date], name=close.index.name).astype(close.index.dtype)),
+                                   close.iloc[n:]])
+                for (symbol, close), value, n in zip(closes.items(), arrays['last_values'], old_lengths)}
+      new_ratios_df = compute_ratios(seeded, ratios).loc[lambda df: df.index > last_date]
+      old_ratios_df = pd.DataFrame(arrays['values'], columns=list(ratios),
+                                   index=pd.DatetimeIndex(arrays['dates'], name=new_ratios_df.index.name))
+      ratios_df = pd.concat([old_ratios_df, new_ratios_df])
+  if ratios_df is None:
+    ratios_df = compute_ratios(closes, ratios)
+
+  # the last aligned value of a symbol is its last valid value
+  last_values = []
+  for close in closes.values():
+    values = close.to_numpy(dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(values))
+    last_values.append(values[valid[-1]] if len(valid) else np.nan)
+  snapshot_cache.save_state(kind, date_str, symbols=np.array(symbols, dtype=str),
+                            columns=np.array(list(ratios), dtype=str), lengths=lengths,
+                            digest=_closes_digest(closes, lengths),
+                            last_date=max(close.index.max() for close in closes.values()).to_datetime64(),
+                            last_values=np.array(last_values), dates=ratios_df.index.to_numpy(),
+                            values=ratios_df.to_numpy())
+  return ratios_df
+
+
+def _closes_digest(closes: dict[str, pd.Series], lengths) -> str:
+  arrays = []
+  for close, n in zip(closes.values(), lengths):
+    arrays += [close.index.to_numpy()[:n], close.to_numpy(dtype=np.float64)[:n]]
+  return snapshot_cache.digest(*arrays)
+
+
+@latest_snapshot_by_default('usa')
+@timed_cache_data
+def get_ratios_df(symbol_source: Optional[Path | URL] = None,
                   dropna: False | Literal['all', 'any'] = 'all',
                   long_format: bool = False,
                   subsample_step: int = 1,
@@ -364,29 +1548,17 @@ def get_ratios_df(symbol_source: Path | URL = '20241203',
   """
   Args:
     symbol_source: The source of the data. Can be a Path or a date string of format 'YYYYMMDD.
+      None for the latest snapshot, see `latest_snapshot_date`.
     subsample_step: The step to subsample the data. Default is 1, meaning no subsampling.
     append_date_column: If True, a 'date' column is appended to the DataFrame.
       Does not apply if `long_format` is True.
+    long_format: deprecated, the charts take the wide frame, see `plotly_charts.wide_line_figure`.
   """
-  ftw5000 = get_close_data_by_symbol('^FTW5000', symbol_source)
-  spx = get_close_data_by_symbol('^SPX', symbol_source)
-  spxew = get_close_data_by_symbol('^SPXEW', symbol_source)
-  ndx = get_close_data_by_symbol('^NDX', symbol_source)
-  ixic = get_close_data_by_symbol('^IXIC', symbol_source)
-  usgdp = get_close_data_by_symbol('USGDP', symbol_source)
-
-  # TODO(panos): series may not be aligned date-wise, align them first and then compute ratio
-  spx_ftw5000 = _reindex_and_compute_ratio(spx, ftw5000)
-  spx_spxew = _reindex_and_compute_ratio(spx, spxew)
-  ndx_spx = _reindex_and_compute_ratio(ndx, spx)
-  ndx_ixic = _reindex_and_compute_ratio(ndx, ixic)
-  spx_usgdp = _reindex_and_compute_ratio(spx, usgdp)
-  ftw5000_usgdp = _reindex_and_compute_ratio(ftw5000, usgdp)
-
-  ratios_df = pd.concat({'spx/ftw5000': spx_ftw5000, 'spx/spxew': spx_spxew,
-                         'ndx/spx': ndx_spx, 'ndx/ixic': ndx_ixic,
-                         'spx/usgdp': spx_usgdp, 'ftw5000/usgdp': ftw5000_usgdp},
-                        axis=1, verify_integrity=True)
+  symbol_names = sorted({name for pair in USA_RATIOS.values() for name in pair})
+  closes = get_close_data_by_symbols(symbol_names, symbol_source)
+  # only the rows after the previous snapshot are computed
+  date_str = symbol_source.name if isinstance(symbol_source, Path) else symbol_source
+  ratios_df = _resumable_compute_ratios('usa_ratios', date_str, closes, USA_RATIOS)
 
   if dropna is not False:
     first_valid_index = ratios_df.dropna(how=dropna).index[0]
@@ -398,30 +1570,344 @@ def get_ratios_df(symbol_source: Path | URL = '20241203',
     ratios_df['date'] = ratios_df.index
 
   if long_format:
+    warnings.warn('long_format is deprecated, melting copies the ratios per symbol.', DeprecationWarning,
+                  stacklevel=2)
     ratios_df = ratios_df.reset_index().melt(id_vars=['date'], var_name='metric', value_name='value')
 
   return ratios_df
 
 
-def generate_twin_chart(data: pd.DataFrame, y1_col: str, y1_title: str, y2_col: str, y2_title: str
-                        ) -> alt.Chart:
-  tableau_colors = ['#4C78A8', '#F58518']
-  # find the first valid index in data
-  data = data[data[[y1_col, y2_col]].first_valid_index():]
-  base = alt.Chart(data).encode(x=alt.X('date:T', title='date'))
-  # add y1 and y2 charts
-  y1_schema = alt.Y(y1_col + ':Q',
-                    axis=alt.Axis(title=y1_title, titleColor=tableau_colors[0]),
-                    scale=alt.Scale(zero=False))
-  y1_tooltips = [alt.Tooltip('date:T', title='date'),
-                 alt.Tooltip(y1_col + ':Q', title=y1_title, format='.3f')]
-  y1_chart = base.mark_line(color=tableau_colors[0]).encode(y=y1_schema, tooltip=y1_tooltips).interactive()
-  y2_schema = alt.Y(y2_col + ':Q',
-                    axis=alt.Axis(title=y2_title, titleColor=tableau_colors[1]),
-                    scale=alt.Scale(zero=False))
-  y2_tooltips = [alt.Tooltip('date:T', title='date'),
-                 alt.Tooltip(y2_col + ':Q', title=y2_title, format='.3f')]
-  y2_chart = base.mark_line(color=tableau_colors[1]).encode(y=y2_schema, tooltip=y2_tooltips).interactive()
-  # Overlay the charts
-  twin_axes_chart = alt.layer(y1_chart, y2_chart).resolve_scale(y='independent').interactive()
-  return twin_axes_chart
+def _bucket_extremes(values: np.ndarray, num_buckets: int) -> tuple[np.ndarray, np.ndarray]:
+  """Row positions (num_buckets x columns) of the min and of the max of every column of `values`
+  in each of `num_buckets` equal-sized buckets of rows. They can be past the last row.
+  """
+  num_rows, num_cols = values.shape
+  width = -(-num_rows // num_buckets)
+  buckets = np.full((num_buckets * width, num_cols), np.nan)
+  buckets[:num_rows] = values
+  buckets = buckets.reshape(num_buckets, width, num_cols)
+  isnan = np.isnan(buckets)
+  offsets = np.arange(num_buckets)[:, None] * width
+  argmins = np.where(isnan, np.inf, buckets).argmin(axis=1) + offsets
+  argmaxs = np.where(isnan, -np.inf, buckets).argmax(axis=1) + offsets
+  return argmins, argmaxs
+
+
+def _minmax_rows(values: np.ndarray, num_buckets: int) -> np.ndarray:
+  """Sorted row positions of the min and max of every column of `values` in each of
+  `num_buckets` equal-sized buckets of rows, plus the first and the last row.
+  """
+  num_rows = values.shape[0]
+  if num_rows <= 2 * num_buckets:
+    return np.arange(num_rows)
+  argmins, argmaxs = _bucket_extremes(values, num_buckets)
+  rows = np.unique(np.concatenate([argmins.ravel(), argmaxs.ravel(), [0, num_rows - 1]]))
+  return rows[rows < num_rows]
+
+
+def minmax_rows_per_column(values: np.ndarray, num_buckets: int) -> list[np.ndarray]:
+  """Like `_minmax_rows`, but the sorted row positions of every column of `values` separately,
+  from its first to its last valid row, so each series keeps at most about 2 * `num_buckets`
+  rows instead of the union of the rows of all series. Empty for all-NaN columns.
+  """
+  num_rows, num_cols = values.shape
+  if num_rows == 0:
+    return [np.arange(0) for _ in range(num_cols)]
+  valid = ~np.isnan(values)
+  firsts = valid.argmax(axis=0)
+  lasts = num_rows - 1 - valid[::-1].argmax(axis=0)
+  if num_rows > 2 * num_buckets:
+    argmins, argmaxs = _bucket_extremes(values, num_buckets)
+  rows_per_column = []
+  for j, (first, last) in enumerate(zip(firsts, lasts)):
+    if not valid[first, j]:
+      rows_per_column.append(np.arange(0))
+    elif num_rows <= 2 * num_buckets:
+      rows_per_column.append(np.arange(first, last + 1))
+    else:
+      rows = np.unique(np.concatenate([argmins[:, j], argmaxs[:, j], [first, last]]))
+      rows_per_column.append(rows[(rows >= first) & (rows <= last)])
+  return rows_per_column
+
+
+@timed
+def downsample_df(df: pd.DataFrame, max_points: int = CHART_MAX_POINTS,
+                  columns: Optional[list[str]] = None) -> pd.DataFrame:
+  """Keep at most about `max_points` rows per series of `df`, preserving the visual extremes.
+
+  The rows are split in `max_points / 2` buckets and the rows with the min and the max of every
+  series in each bucket are kept (min-max decimation), so peaks and troughs survive, unlike a
+  fixed subsampling step. All series keep sharing the same rows.
+
+  Args:
+    columns: the series to preserve, defaults to all numeric columns.
+  """
+  if columns is None:
+    columns = df.select_dtypes('number').columns
+  rows = _minmax_rows(df[columns].to_numpy(dtype=np.float64), max(max_points // 2, 1))
+  return df.iloc[rows]
+
+
+@timed
+def build_pyramid(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+  """Precompute the multi-resolution pyramid of the numeric columns of a Date-indexed `df`.
+
+  Returns:
+    pyramid: level (see PYRAMID_LEVELS) -> pd.DataFrame of the last values of every period,
+      with the same columns as `df`. The daily level is `df` itself.
+  """
+  df = df.select_dtypes('number')
+  return {level: df if freq is None else df.resample(freq).last() for level, freq in PYRAMID_LEVELS.items()}
+
+
+def select_pyramid_level(pyramid: dict[str, pd.DataFrame], start=None, end=None,
+                         width_px: int = CHART_WIDTH_PX) -> str:
+  """The coarsest level of `pyramid` that has at least one point per pixel in [start, end]."""
+  levels = list(PYRAMID_LEVELS)
+  for level in levels[:0:-1]:
+    index = pyramid[level].index
+    if len(index[index.slice_indexer(start, end)]) >= width_px:
+      return level
+  return levels[0]
+
+
+def get_pyramid_range(pyramid: dict[str, pd.DataFrame], start=None, end=None,
+                      width_px: int = CHART_WIDTH_PX) -> pd.DataFrame:
+  """Serve the [start, end] range of the series of `pyramid` at the resolution picked by
+  `select_pyramid_level`, so zoomed-out views use few points and zoomed-in views daily data.
+
+  Args:
+    start, end: dates or date strings, None for the start or end of the series.
+  """
+  level = select_pyramid_level(pyramid, start, end, width_px)
+  return pyramid[level].loc[start:end]
+
+
+@timed
+def _build_ratios_pyramid_snapshot(date_str: str) -> dict[str, pd.DataFrame]:
+  dtype = np.float32 if COMPACT_MODE else np.float64
+  ratios = compact_to_frame(to_compact(get_ratios_df(date_str), dtype), index_name='date')
+  return build_pyramid(ratios)
+
+
+@latest_snapshot_by_default('usa')
+def get_ratios_pyramid_snapshot(date_str: Optional[str] = None) -> dict[str, pd.DataFrame]:
+  """The `build_pyramid` of the full-history ratios of an online dump, see `_get_latest_snapshot`.
+
+  The pyramid must be treated as read-only. With COMPACT_MODE the ratios are float32.
+  """
+  return _get_latest_snapshot('ratios_pyramid', date_str, _build_ratios_pyramid_snapshot)
+
+
+class RatioMatrix(NamedTuple):
+  """The ratios of all pairs of symbols, see `compute_ratio_tensor`."""
+  dates: np.ndarray  # datetime64
+  names: tuple[str, ...]
+  # (dates x names x names), values[t, i, j] is the ratio of symbol i over symbol j at date t
+  values: np.ndarray
+  # (dates x names), the aligned log prices the ratios are computed from
+  log_prices: np.ndarray
+
+
+def log_prices(closes: pd.DataFrame) -> np.ndarray:
+  """The forward filled log prices of aligned `closes`, NaN before the first (or a non-positive)
+  price."""
+  values = _ffill_array(closes.to_numpy(dtype=np.float64))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.log(np.where(values > 0, values, np.nan))
+
+
+def iter_log_ratio_chunks(log_values: np.ndarray, max_bytes: int = RATIO_CHUNK_MAX_BYTES):
+  """Yield the log ratios of all pairs of symbols, a block of numerators at a time.
+
+  With N symbols the full (time x N x N) tensor grows quadratically, the blocks are bounded
+  to about `max_bytes` each.
+
+  Yields:
+    start, stop: the numerator positions of the block.
+    log_ratios: float64 array (time x stop - start x N), log_ratios[t, i, j] is the log ratio of
+      numerator start + i over symbol j.
+  """
+  num_rows, num_symbols = log_values.shape
+  chunk_size = max(1, max_bytes // max(1, num_rows * num_symbols * 8))
+  for start in range(0, num_symbols, chunk_size):
+    stop = min(start + chunk_size, num_symbols)
+    yield start, stop, log_values[:, start:stop, None] - log_values[:, None, :]
+
+
+@timed
+def compute_ratio_tensor(closes: pd.DataFrame, dtype=np.float64, out: Optional[np.ndarray] = None,
+                         max_bytes: int = RATIO_CHUNK_MAX_BYTES) -> RatioMatrix:
+  """Compute the ratios of all pairs of the aligned `closes` in broadcasted passes.
+
+  The ratio of symbols i and j is exp(log price i - log price j), computed for all pairs from
+  one (time x symbols) log-price matrix instead of a `_reindex_and_compute_ratio` per pair.
+
+  Args:
+    closes: aligned closes (eg. `align_closes`) with a column per symbol, forward filled here.
+    dtype: float dtype of the ratios.
+    out: optional preallocated (time x symbols x symbols) array (eg. a memory-mapped file),
+      `dtype` is then ignored. With `max_bytes`, the memory of the computation stays bounded.
+    max_bytes: the size of the intermediate blocks, see `iter_log_ratio_chunks`.
+  """
+  log_values = log_prices(closes)
+  num_symbols = log_values.shape[1]
+  if out is None:
+    out = np.empty((len(log_values), num_symbols, num_symbols), dtype=dtype)
+  assert out.shape == (len(log_values), num_symbols, num_symbols)
+  for start, stop, log_ratios in iter_log_ratio_chunks(log_values, max_bytes):
+    out[:, start:stop] = np.exp(log_ratios)
+  if isinstance(out, np.memmap):
+    out.flush()
+
+  out.flags.writeable = False
+  log_values.flags.writeable = False
+  dates = np.array(closes.index.to_numpy(), dtype=np.datetime64)
+  dates.flags.writeable = False
+  return RatioMatrix(dates, tuple(closes.columns), out, log_values)
+
+
+class RatioSummary(NamedTuple):
+  """Summary statistics of all pairs of symbols, see `summarize_ratios`."""
+  names: tuple[str, ...]
+  # (names x names), the percentile of the latest ratio of i over j in its own history
+  percentile: np.ndarray
+  # (names x names), the percentage change of the ratio of i over j over the lookback period
+  change_pct: np.ndarray
+
+
+@timed
+def summarize_ratios(log_values: np.ndarray, names: tuple[str, ...], lookback_days: Optional[int] = None,
+                     max_bytes: int = RATIO_CHUNK_MAX_BYTES) -> RatioSummary:
+  """Who is outperforming whom: the summary statistics of all pairs of symbols.
+
+  The ratio tensor is never materialized, the percentiles are computed a block of numerators
+  at a time (see `iter_log_ratio_chunks`) and the changes from the log prices of the first row
+  where both symbols are given and of the last one.
+
+  Args:
+    log_values: (time x symbols) aligned log prices, see `log_prices`.
+    lookback_days: number of rows of the history considered, None for all.
+  """
+  if lookback_days is not None:
+    log_values = log_values[-(lookback_days + 1):]
+  num_symbols = log_values.shape[1]
+  percentile = np.full((num_symbols, num_symbols), np.nan)
+  for start, stop, log_ratios in iter_log_ratio_chunks(log_values, max_bytes):
+    valid = ~np.isnan(log_ratios)
+    with np.errstate(invalid='ignore'):
+      num_below = np.count_nonzero(log_ratios <= log_ratios[-1], axis=0)
+      percentile[start:stop] = np.where(valid[-1], num_below / valid.sum(axis=0) * 100, np.nan)
+  np.fill_diagonal(percentile, np.nan)
+
+  # the log prices are forward filled, so the ratio of i over j is given from the later of their
+  # first valid rows on, which is its change base
+  first_valid = _first_valid_positions(log_values)
+  base_rows = np.minimum(np.maximum(first_valid[:, None], first_valid[None, :]), len(log_values) - 1)
+  symbols = np.arange(num_symbols)
+  base = log_values[base_rows, symbols[:, None]] - log_values[base_rows, symbols[None, :]]
+  change_pct = (np.exp(log_values[-1, :, None] - log_values[-1, None, :] - base) - 1) * 100
+  np.fill_diagonal(change_pct, np.nan)
+
+  return RatioSummary(tuple(names), percentile, change_pct)
+
+
+@timed
+def compute_fx_adjusted_ratio_matrix(closes: pd.DataFrame, currencies: dict[str, str],
+                                     fx_columns: dict[str, str], dtype=np.float64) -> RatioMatrix:
+  """Compute the FX-adjusted ratios of all pairs of baskets in one vectorized pass.
+
+  The ratio of baskets 1 and 2, denominated in currencies 1 and 2, is
+  basket1 / basket2 x currency2 / currency1 (see index_ratios_maths.py), with a currency
+  expressed in units per common currency unit. Here every basket is converted once to the
+  common currency and all pairs are computed by `compute_ratio_tensor`.
+
+  Args:
+    closes: aligned and forward filled closes, with a column per basket and per FX rate.
+    currencies: basket column -> the currency of its prices.
+    fx_columns: currency -> the column of its FX rate, the price of one unit in the common
+      currency. The common currency has no FX column.
+    dtype: float dtype of the ratios.
+  """
+  baskets = list(currencies)
+  prices = closes[baskets].to_numpy(dtype=np.float64)
+  fx = np.ones_like(prices)
+  for j, basket in enumerate(baskets):
+    if currencies[basket] in fx_columns:
+      fx[:, j] = closes[fx_columns[currencies[basket]]].to_numpy(dtype=np.float64)
+  common = pd.DataFrame(prices * fx, index=closes.index, columns=baskets, copy=False)
+
+  return compute_ratio_tensor(common, dtype)
+
+
+def select_ratios(matrix: RatioMatrix, numerators: list[str], denominator: str) -> pd.DataFrame:
+  """The ratios of `numerators` over `denominator` as a 'Date'-indexed DataFrame, a slice of
+  the precomputed `matrix`.
+  """
+  names = list(matrix.names)
+  values = matrix.values[:, [names.index(name) for name in numerators], names.index(denominator)]
+  index = pd.DatetimeIndex(matrix.dates, name='Date', copy=False)
+  return pd.DataFrame(values, index=index, columns=[f'{name}/{denominator}' for name in numerators])
+
+
+@timed
+def _build_country_ratios_snapshot(date_str: str) -> RatioMatrix:
+  countries, fx = get_symbols(COUNTRIES_GROUP), get_symbols(FX_GROUP)
+  # all files are loaded at once and aligned on one calendar, gaps are forward filled
+  closes = load_close_data_from_dumps(date_str, countries.index.to_list() + fx.index.to_list())
+  fx_columns = {row.currency: name for name, row in fx.iterrows() if name in closes.columns}
+
+  currencies = dict()
+  for name, row in countries.iterrows():
+    if name not in closes.columns:
+      continue
+    if row.currency != COMMON_CURRENCY and row.currency not in fx_columns:
+      print(f'No {row.currency} FX rate in the {date_str} dump, {name} is skipped.')
+      continue
+    currencies[name] = row.currency
+  return compute_fx_adjusted_ratio_matrix(closes, currencies, fx_columns,
+                                          np.float32 if COMPACT_MODE else np.float64)
+
+
+@latest_snapshot_by_default((COUNTRIES_GROUP, FX_GROUP))
+def get_country_ratios_snapshot(date_str: Optional[str] = None) -> RatioMatrix:
+  """The FX-adjusted ratios of all pairs of country indices of the `date_str` dump.
+
+  The matrix is read-only, a selection in a page is only a `select_ratios` slice. Country
+  indices without a file in the dump, or without an FX rate for their currency, are left out.
+  """
+  return _get_latest_snapshot('country_ratios', date_str, _build_country_ratios_snapshot)
+
+
+@latest_snapshot_by_default((COUNTRIES_GROUP, FX_GROUP))
+@timed_cache_data
+def get_country_ratios_summary(date_str: Optional[str] = None, lookback_days: Optional[int] = None
+                               ) -> RatioSummary:
+  """The `summarize_ratios` of `get_country_ratios_snapshot`, eg. for a heatmap."""
+  ratio_matrix = get_country_ratios_snapshot(date_str)
+  return summarize_ratios(ratio_matrix.log_prices, ratio_matrix.names, lookback_days)
+
+
+@latest_snapshot_by_default(INFO_GROUPS)
+@timed_cache_resource(max_entries=SNAPSHOT_CACHE_MAX_ENTRIES)
+def get_info_rolling_metrics(date_str: Optional[str] = None, windows: tuple[int, ...] = ROLLING_WINDOWS
+                             ) -> RollingMetrics:
+  """The `compute_rolling_metrics` of all symbols of `get_info_snapshot`, with correlations to
+  ROLLING_REFERENCE. Read-only, pages slice it with `rolling_metric_frame`.
+  """
+  close = compact_to_frame(get_info_snapshot(date_str).close)
+  reference = ROLLING_REFERENCE if ROLLING_REFERENCE in close.columns else None
+  return compute_rolling_metrics(close, windows, reference=reference,
+                                 dtype=np.float32 if COMPACT_MODE else np.float64)
+
+
+@latest_snapshot_by_default('usa')
+@timed_cache_resource(max_entries=SNAPSHOT_CACHE_MAX_ENTRIES)
+def get_ratios_rolling_metrics(date_str: Optional[str] = None, windows: tuple[int, ...] = ROLLING_WINDOWS
+                               ) -> RollingMetrics:
+  """The `compute_rolling_metrics` of all ratios of `get_ratios_df`, with correlations to the
+  first ratio.
+  """
+  ratios = get_ratios_pyramid_snapshot(date_str)['daily']
+  return compute_rolling_metrics(ratios, windows, dtype=np.float32 if COMPACT_MODE else np.float64)
+
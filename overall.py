@@ -1,149 +1,101 @@
 import time
 from pathlib import Path
 
-import pandas as pd
-# import plotly.graph_objs as go
-import plotly.express as px
 import streamlit as st
 
 from description_strings import outro_string
-from funclib import (INFO, _num_occurences, batch_process, days_since_change,
-                     get_close_data_from_dumps)
+from profiling import finish_run, span, start_run
+from funclib import (INFO_GROUPS, ROLLING_WINDOWS, SLIDER_CHANGES, SLIDER_DAYS_PERIODS,
+                     compact_to_frame, get_days_since_change_cube, get_info_rolling_metrics,
+                     get_info_snapshot, get_symbols, latest_snapshot_date)
+from plotly_charts import get_info_line_figure
 
 timer_start = time.time_ns()
+start_run('overall')
 
 st.title('Insights on Financial Markets')
 st.subheader('A collection of insights and analytics on the stock and cryptocurrency markets.')
 
-daily_close_df = get_close_data_from_dumps()
+# the newest snapshot of the dumps, the same for all sections of the run
+date_str = latest_snapshot_date(INFO_GROUPS)
+# read-only views of the snapshot arrays
+snapshot = get_info_snapshot(date_str)
+daily_close_df = compact_to_frame(snapshot.close)
 assert len(daily_close_df) > 0, 'Empty daily_close dataframe.'
-dsath_df = batch_process(daily_close_df)
 
+# the snapshot has all symbols of the groups, the page only selects the columns of the view
+symbols = get_symbols(INFO_GROUPS)
+group_titles = {'indices': 'Stock market indices', 'crypto': 'Cryptocurrencies'}
+selected = []
 with st.sidebar:
-  st.write('Stock market indices') # :-2
-  for row in INFO[['button_name', 'button_default']][:-2].itertuples():
-    INFO.loc[row.Index, 'button_selection'] = st.checkbox(row.button_name, value=row.button_default)
-  st.write('Cryptocurrencies') # -2:
-  for row in INFO[['button_name', 'button_default']][-2:].itertuples():
-    INFO.loc[row.Index, 'button_selection'] = st.checkbox(row.button_name, value=row.button_default)
-
-columns_to_keep = INFO['filename_prefix'][INFO['button_selection']]#.to_list()
-daily_close = daily_close_df[columns_to_keep]
-dsath = dsath_df[columns_to_keep]
-daily_close.loc[:, 'Date'] = daily_close.index
-dsath.loc[:, 'Date'] = dsath_df.index
+  for group in INFO_GROUPS:
+    st.write(group_titles[group])
+    for row in symbols[symbols['group'] == group].itertuples():
+      if st.checkbox(row.button_name, value=row.button_default):
+        selected.append(row.Index)
+
+# symbols without a file in the dump are not in the snapshot
+columns_to_keep = tuple(name for name in selected if name in daily_close_df.columns)
 
 ###############################################################################
 
 st.header('Indices')
 
-data_load_state = st.text('Creating graph...')
-
-# melt the dataframe for Plotly Express
-melted_data = daily_close.melt(id_vars='Date', var_name='index', value_name='USD')
-
-fig = px.line(data_frame=melted_data, x='Date', y='USD', color='index', 
-              # labels={'value': 'Value', 'date': 'Date', 'series': 'Series'},
-              # title='Time Series Data',
-              log_y=True,
-)
-
-start_year = daily_close.index.year.min()
-end_year = daily_close.index.year.max()
-years = list(range(1930, end_year + 1, 5))
-if start_year < 1930:
-  years.insert(0, start_year)
-if years[-1] != end_year:
-  years.append(end_year)
-
-fig.update_layout(
-    # autosize=True,
-    # xaxis=dict(
-    #     tickformat='%Y',  # Show year only
-    #     dtick="M60",  # Tick every 60 months (5 years)
-    #     tickangle=45  # Rotate labels for better readability
-    # ),
-    xaxis=dict(
-        tickmode='array',
-        tickvals=pd.to_datetime([f'{year}-01-01' for year in years]),
-        ticktext=[str(year) for year in years],
-        tickangle=45,  # Rotate labels for better readability
-        range=[pd.to_datetime(f'{start_year}-01-01'), pd.to_datetime(f'{end_year}-12-31')],
-    ),
-    # yaxis=dict(
-    #     minor=dict(showgrid=False)
-    # ),
-    # height=500  # you can adjust the height if needed
-)
-
-# fig.update_xaxes(autorange=True)
-
-data_load_state.text('Creating graph... Done!')
-st.plotly_chart(fig, use_container_width=True, theme=None)
-data_load_state.empty()
+fig = get_info_line_figure(date_str, 'close', columns_to_keep, value_name='USD', log_y=True)
+with span('indices: plotly chart'):
+  st.plotly_chart(fig, use_container_width=True, theme=None)
 
 ############################################################################
 
 st.header('Days since latest All Time High')
 
-data_load_state = st.text('Creating graph...')
-
-# Melt the dataframe for Plotly Express
-melted_data = dsath.melt(id_vars='Date', var_name='index', value_name='# days')
-fig = px.line(data_frame=melted_data, x='Date', y='# days', color='index', 
-              # labels={'value': 'Value', 'date': 'Date', 'series': 'Series'},
-              # title='Time Series Data',
-              # log_y=True,
-)
-fig.update_yaxes(title='Days since latest ATH')
-
-fig.update_layout(
-    xaxis=dict(
-        tickmode='array',
-        tickvals=pd.to_datetime([f'{year}-01-01' for year in years]),
-        ticktext=[str(year) for year in years],
-        tickangle=45,  # Rotate labels for better readability
-        range=[pd.to_datetime(f'{start_year}-01-01'), pd.to_datetime(f'{end_year}-12-31')],
-    ),
-)
-
-data_load_state.text('Creating graph... Done!')
-st.plotly_chart(fig, use_container_width=True, theme=None)
-data_load_state.empty()
+fig = get_info_line_figure(date_str, 'days_since_ath', columns_to_keep, value_name='# days',
+                           yaxis_title='Days since latest ATH')
+with span('dsath: plotly chart'):
+  st.plotly_chart(fig, use_container_width=True, theme=None)
 
 ##########################################################################################
 
 st.header('Number of days since the latest daily change')
 
-data_load_state = st.text('Creating graph...')
-
-days_period = st.slider('Days period', min_value=1, max_value=30, value=1)
-change = st.slider('Percentage change', min_value=-15, max_value=15, value=3, format='%d%%')
-
-dschange = daily_close_df[columns_to_keep].apply(days_since_change, change=change, days_period=days_period)
-num_occurences = daily_close_df[columns_to_keep].apply(_num_occurences, change=change).to_list()
+days_period = st.slider('Days period', min_value=SLIDER_DAYS_PERIODS[0],
+                        max_value=SLIDER_DAYS_PERIODS[-1], value=1)
+change = st.slider('Percentage change', min_value=SLIDER_CHANGES[0], max_value=SLIDER_CHANGES[-1],
+                   value=3, format='%d%%')
+
+# all slider combinations are precomputed, here we only slice
+fig = get_info_line_figure(date_str, 'days_since_change', columns_to_keep, (change, days_period),
+                           value_name='# days', title=f'Number of days since the latest at least {change}%',
+                           yaxis_title=f'Days since latest at least {change}% change')
+with span('dschange: plotly chart'):
+  st.plotly_chart(fig, use_container_width=True, theme=None)
+# the occurences are counted on daily changes
+_, num_occurences_cube, _, cube_columns = get_days_since_change_cube(date_str)
+cols_idx = [cube_columns.index(name) for name in columns_to_keep]
+num_occurences = num_occurences_cube[SLIDER_CHANGES.index(change), SLIDER_DAYS_PERIODS.index(1), cols_idx]
+st.text(f'Num occurences per index: {num_occurences.tolist()}.')
 
-dschange['Date'] = dschange.index
-# Melt the dataframe for Plotly Express
-melted_data = dschange.melt(id_vars='Date', var_name='index', value_name='# days')
-title = f'Number of days since the latest at least {change}%'
-fig = px.line(data_frame=melted_data, x='Date', y='# days', color='index', title=title)
-fig.update_yaxes(title=f'Days since latest at least {change}% change')
-
-fig.update_layout(
-    xaxis=dict(
-        tickmode='array',
-        tickvals=pd.to_datetime([f'{year}-01-01' for year in years]),
-        ticktext=[str(year) for year in years],
-        tickangle=45,  # Rotate labels for better readability
-        range=[pd.to_datetime(f'{start_year}-01-01'), pd.to_datetime(f'{end_year}-12-31')],
-    ),
-)
+##########################################################################################
 
-data_load_state.text('Creating graph... Done!')
-st.plotly_chart(fig, use_container_width=True, theme=None)
-data_load_state.empty()
-st.text(f'Num occurences per index: {num_occurences}.')
+st.header('Rolling returns and risk')
+
+# the symbol the correlations are computed with, the first one of the snapshot without ROLLING_REFERENCE
+reference = get_info_rolling_metrics(date_str).reference
+rolling_metric_names = {
+    'volatility_pct': 'Annualized volatility (%)',
+    'max_drawdown_pct': 'Max drawdown (%)',
+    'drawdown_pct': 'Drawdown from the period high (%)',
+    'return_pct': 'Return (%)',
+    'correlation': f'Correlation with {symbols["button_name"].get(reference, reference)}',
+}
+rolling_metric = st.selectbox('Metric', list(rolling_metric_names), format_func=rolling_metric_names.get)
+window = st.select_slider('Window (trading days)', options=ROLLING_WINDOWS, value=252)
+
+# all metrics and windows are precomputed, here we only slice
+fig = get_info_line_figure(date_str, 'rolling', columns_to_keep, (rolling_metric, window),
+                           value_name=rolling_metric_names[rolling_metric])
+with span('rolling: plotly chart'):
+  st.plotly_chart(fig, use_container_width=True, theme=None)
 
 # horizontal separator
 st.markdown("---")
@@ -151,3 +103,4 @@ st.markdown("---")
 st.write()
 st.write(outro_string)
 st.write(f'Page created in {(time.time_ns() - timer_start) / 1_000_000_000:.1f} sec.')
+finish_run()
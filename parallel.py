@@ -0,0 +1,118 @@
+"""Parallel execution of column-independent array functions over a process pool.
+
+The (time x symbols) input is copied once into shared memory, from which the workers read
+their chunk of columns, so the frames are never pickled to the workers. Only the per-chunk
+results are sent back, and they are concatenated along their last (symbols) axis. Because the
+columns are computed independently, the results are bit-identical to a serial call.
+
+Small inputs, a single worker, or a failing pool fall back to a serial call.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional
+
+import numpy as np
+
+# the number of worker processes, 1 disables the parallel mode
+PARALLEL_MAX_WORKERS = int(os.environ.get('FAI_PARALLEL_WORKERS', os.cpu_count() or 1))
+# inputs with fewer (rows x columns) cells are computed serially, the pool overhead dominates
+PARALLEL_MIN_CELLS = int(os.environ.get('FAI_PARALLEL_MIN_CELLS', 4_000_000))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+  """The process pool shared by all calls, started on first use.
+
+  The workers are spawned, not forked, since the streamlit server process runs many threads.
+  """
+  global _pool
+  with _pool_lock:
+    if _pool is None:
+      _pool = ProcessPoolExecutor(max_workers=PARALLEL_MAX_WORKERS,
+                                  mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _shutdown_pool():
+  """Drop a broken pool, the next parallel call starts a new one."""
+  global _pool
+  with _pool_lock:
+    if _pool is not None:
+      _pool.shutdown(wait=False, cancel_futures=True)
+      _pool = None
+
+
+def _run_column_chunk(fn: Callable, shm_name: str, shape: tuple, dtype: str, start: int, stop: int,
+                      out_filepath: Optional[str], kwargs: dict) -> tuple:
+  shm = SharedMemory(name=shm_name)
+  try:
+    values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[:, start:stop]
+    if out_filepath is None:
+      result = fn(values, **kwargs)
+    else:
+      # the first result is written straight into the columns of the memory-mapped file
+      out = np.load(out_filepath, mmap_mode='r+')
+      result = fn(values, out=out[..., start:stop], **kwargs)
+      out.flush()
+      result = (None,) + tuple(result[1:])
+    del values
+    return result
+  finally:
+    shm.close()
+
+
+def map_column_chunks(fn: Callable, values: np.ndarray, out: Optional[np.memmap] = None,
+                      max_workers: int = PARALLEL_MAX_WORKERS, min_cells: int = PARALLEL_MIN_CELLS,
+                      **kwargs) -> tuple:
+  """Call `fn(values, **kwargs)` on chunks of the columns of `values` in parallel.
+
+  Args:
+    fn: a module-level function of a (time x symbols) array returning a tuple of arrays with
+      symbols as their last axis, whose columns are computed independently, eg.
+      `days_since_ath_array` or `days_since_change_array`.
+    values: the 2-D (time x symbols) input.
+    out: optional memory-mapped file of the first result, passed to `fn` as its `out` argument.
+      The workers write their columns straight into it.
+    max_workers: the number of column chunks, at most the number of columns.
+    min_cells: inputs with fewer cells are computed serially.
+
+  Returns:
+    the results of `fn`, as if called once with all columns.
+  """
+  values = np.asarray(values)
+  if out is not None:
+    kwargs['out'] = out
+  num_chunks = min(max_workers, values.shape[1])
+  if num_chunks < 2 or values.size < min_cells or (out is not None and out.filename is None):
+    return fn(values, **kwargs)
+  kwargs.pop('out', None)
+
+  shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+  try:
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    if out is not None:
+      out.flush()
+    bounds = np.linspace(0, values.shape[1], num_chunks + 1).astype(int)
+    pool = _get_pool()
+    futures = [pool.submit(_run_column_chunk, fn, shm.name, values.shape, values.dtype.str, start, stop,
+                           None if out is None else str(out.filename), kwargs)
+               for start, stop in zip(bounds[:-1], bounds[1:])]
+    results = [future.result() for future in futures]
+  except Exception as e:
+    print(f'Parallel execution failed, computing serially: {str(e)}')
+    _shutdown_pool()
+    return fn(values, **kwargs, **({} if out is None else {'out': out}))
+  finally:
+    shm.close()
+    shm.unlink()
+
+  combined = tuple(np.concatenate(outputs, axis=-1) if outputs[0] is not None else None
+                   for outputs in zip(*results))
+  if out is not None:
+    combined = (out,) + combined[1:]
+  return combined
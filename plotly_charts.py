@@ -0,0 +1,111 @@
+"""Plotly figures of the pages."""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from funclib import (CHART_MAX_POINTS, FIGURE_CACHE_MAX_ENTRIES, SLIDER_CHANGES, SLIDER_DAYS_PERIODS,
+                     compact_to_frame, counters_to_frame, get_days_since_change_cube,
+                     get_info_rolling_metrics, get_info_snapshot, get_ratios_rolling_metrics,
+                     minmax_rows_per_column, rolling_metric_frame)
+from profiling import timed_cache_resource
+
+
+def info_frame(date_str: str, series: str, columns: tuple[str, ...], params: tuple = ()) -> pd.DataFrame:
+  """A 'Date'-indexed frame of the `columns` symbols of the `date_str` info snapshot.
+
+  Args:
+    series: 'close', 'days_since_ath', 'days_since_change' with params (change, days_period),
+      or 'rolling' with params (metric, window).
+  """
+  columns = list(columns)
+  close = compact_to_frame(get_info_snapshot(date_str).close)
+  if series == 'close':
+    return close[columns]
+  if series == 'days_since_ath':
+    snapshot = get_info_snapshot(date_str)
+    # the rows of all symbols, like the other series
+    return counters_to_frame(snapshot.days_since_ath.values, snapshot.days_since_ath_first_valid,
+                             close)[columns]
+  if series == 'days_since_change':
+    change, days_period = params
+    dschange_cube, _, first_valid, cube_columns = get_days_since_change_cube(date_str)
+    cols_idx = [cube_columns.index(name) for name in columns]
+    counters = dschange_cube[SLIDER_CHANGES.index(change), SLIDER_DAYS_PERIODS.index(days_period)]
+    return counters_to_frame(counters[:, cols_idx], first_valid[cols_idx], close[columns])
+  if series == 'rolling':
+    metric, window = params
+    return rolling_metric_frame(get_info_rolling_metrics(date_str), metric, window, columns)
+  raise ValueError(f'Unknown series {series}.')
+
+
+def year_ticks_xaxis(index: pd.DatetimeIndex) -> dict:
+  """The x axis of a Date-indexed figure, with a tick every 5 years and the first and last year."""
+  start_year = index.year.min()
+  end_year = index.year.max()
+  years = list(range(1930, end_year + 1, 5))
+  if start_year < 1930:
+    years.insert(0, start_year)
+  if years[-1] != end_year:
+    years.append(end_year)
+  return dict(
+      tickmode='array',
+      tickvals=pd.to_datetime([f'{year}-01-01' for year in years]),
+      ticktext=[str(year) for year in years],
+      tickangle=45,  # Rotate labels for better readability
+      range=[pd.to_datetime(f'{start_year}-01-01'), pd.to_datetime(f'{end_year}-12-31')],
+  )
+
+
+def wide_line_figure(frame: pd.DataFrame, value_name: str = 'value', yaxis_title: Optional[str] = None,
+                     title: Optional[str] = None, log_y: bool = False, legend_title: str = 'index',
+                     max_points: int = CHART_MAX_POINTS) -> go.Figure:
+  """A line per column of a Date-indexed wide `frame`, built straight from its arrays.
+
+  Unlike Plotly Express on a long-format frame, nothing is melted. Every line takes the rows of
+  its own column that `minmax_rows_per_column` keeps for `max_points`, and their dates as
+  float64 milliseconds on a date axis (binary arrays in the figure JSON instead of date strings).
+  """
+  x_title = frame.index.name or 'Date'
+  x = frame.index.to_numpy(dtype='datetime64[ms]').astype(np.float64)
+  values = frame.to_numpy(dtype=np.float64)
+  traces = []
+  for j, (column, rows) in enumerate(zip(map(str, frame.columns),
+                                         minmax_rows_per_column(values, max(max_points // 2, 1)))):
+    traces.append(go.Scatter(x=x[rows], y=values[rows, j], mode='lines', name=column, legendgroup=column,
+                             hovertemplate=f'{legend_title}={column}<br>{x_title}=%{{x}}<br>'
+                                           f'{value_name}=%{{y}}<extra></extra>'))
+  return go.Figure(data=traces, layout=dict(
+      title=title, legend=dict(title=legend_title, tracegroupgap=0),
+      xaxis=dict(type='date', title=x_title),
+      yaxis=dict(type='log' if log_y else 'linear',
+                 title=value_name if yaxis_title is None else yaxis_title)))
+
+
+@timed_cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def get_info_line_figure(date_str: str, series: str, columns: tuple[str, ...], params: tuple = (),
+                         value_name: str = 'value', yaxis_title: Optional[str] = None,
+                         title: Optional[str] = None, log_y: bool = False) -> go.Figure:
+  """A line per symbol of the `info_frame` of (date_str, series, columns, params).
+
+  The figure must be treated as read-only.
+  """
+  fig = wide_line_figure(info_frame(date_str, series, columns, params), value_name, yaxis_title, title,
+                         log_y)
+  # the same years for all series, of the whole snapshot
+  fig.update_layout(xaxis=year_ticks_xaxis(pd.DatetimeIndex(get_info_snapshot(date_str).close.dates)))
+  return fig
+
+
+@timed_cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def get_ratios_rolling_figure(date_str: str, metric: str, window: int, value_name: str = 'value'
+                              ) -> go.Figure:
+  """A line per ratio of the `get_ratios_rolling_metrics` of (date_str, metric, window).
+
+  The figure must be treated as read-only.
+  """
+  rolling = get_ratios_rolling_metrics(date_str)
+  fig = wide_line_figure(rolling_metric_frame(rolling, metric, window), value_name, legend_title='ratio')
+  fig.update_layout(xaxis=year_ticks_xaxis(pd.DatetimeIndex(rolling.dates)))
+  return fig
@@ -0,0 +1,216 @@
+"""Per-stage timing of the pages and the funclib functions.
+
+A page calls `start_run` at its top and `finish_run` at its bottom. In between, every `span`
+(a context manager for page sections) and every function decorated with `timed`,
+`timed_cache_data` or `timed_cache_resource` records its wall time, cache hit or miss, rows
+processed and bytes downloaded. Outside of a run they only call through.
+
+`finish_run` appends the records as JSON lines to the file of the FAI_PROFILE_LOG environment
+variable, and shows them in a sidebar panel when the page is opened with `?debug=1` (or
+FAI_DEBUG=1). The panel can also capture a cProfile (or pyinstrument, if installed) profile of
+the next rerun.
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+PROFILE_LOG_FILEPATH = os.environ.get('FAI_PROFILE_LOG')
+
+# the records of the current run, and the record of the innermost open span
+_run: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('run', default=None)
+_span: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('span', default=None)
+# spans can be updated from the download threads
+_lock = threading.Lock()
+
+
+def _num_rows(result) -> Optional[int]:
+  if hasattr(result, 'shape') and len(result.shape) > 0:
+    return int(result.shape[0])
+  if isinstance(result, dict):
+    return sum(_num_rows(value) or 0 for value in result.values())
+  if isinstance(result, tuple) and result:
+    return _num_rows(result[0])
+  return None
+
+
+@contextmanager
+def span(name: str, **fields):
+  """Record the wall time of the enclosed block as `name`. Yields the record (or None outside
+  of a run), to which fields like 'rows' can be added.
+  """
+  run = _run.get()
+  if run is None:
+    yield None
+    return
+  parent = _span.get()
+  record = {'name': name, 'depth': 0 if parent is None else parent['depth'] + 1,
+            'start_sec': time.perf_counter() - run['start'], **fields}
+  with _lock:
+    run['records'].append(record)
+  token = _span.set(record)
+  start = time.perf_counter()
+  try:
+    yield record
+  finally:
+    record['wall_sec'] = time.perf_counter() - start
+    _span.reset(token)
+
+
+def add(key: str, value: int):
+  """Add `value` to the `key` field of the innermost open span, eg. add('bytes', 1024)."""
+  record = _span.get()
+  if record is not None:
+    with _lock:
+      record[key] = record.get(key, 0) + value
+
+
+def mark_cache_miss():
+  record = _span.get()
+  if record is not None:
+    record['cache'] = 'miss'
+
+
+def timed(fn=None, *, name: Optional[str] = None):
+  """Decorator recording every call of `fn` as a span, with the rows of its result."""
+  if fn is None:
+    return functools.partial(timed, name=name)
+  name = name or fn.__name__
+
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    if _run.get() is None:
+      return fn(*args, **kwargs)
+    with span(name) as record:
+      result = fn(*args, **kwargs)
+      if (num_rows := _num_rows(result)) is not None:
+        record.setdefault('rows', num_rows)
+      return result
+
+  return wrapper
+
+
+def _timed_cache(cache_decorator, fn, **cache_kwargs):
+  @functools.wraps(fn)
+  def on_miss(*args, **kwargs):
+    mark_cache_miss()
+    return fn(*args, **kwargs)
+
+  cached_fn = cache_decorator(on_miss, **cache_kwargs)
+
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    if _run.get() is None:
+      return cached_fn(*args, **kwargs)
+    with span(fn.__name__, cache='hit') as record:
+      result = cached_fn(*args, **kwargs)
+      if (num_rows := _num_rows(result)) is not None:
+        record.setdefault('rows', num_rows)
+      return result
+
+  wrapper.clear = cached_fn.clear
+  return wrapper
+
+
+def timed_cache_data(fn=None, **cache_kwargs):
+  """`st.cache_data` that also records the calls as spans, with cache hit or miss."""
+  import streamlit as st
+  if fn is None:
+    return functools.partial(timed_cache_data, **cache_kwargs)
+  return _timed_cache(st.cache_data, fn, **cache_kwargs)
+
+
+def timed_cache_resource(fn=None, **cache_kwargs):
+  """`st.cache_resource` that also records the calls as spans, with cache hit or miss.
+
+  A result is built once per arguments and shared by all sessions of the process, so a rerun
+  with unchanged arguments only looks it up. Results must be treated as read-only.
+  """
+  import streamlit as st
+  if fn is None:
+    return functools.partial(timed_cache_resource, **cache_kwargs)
+  return _timed_cache(st.cache_resource, fn, **cache_kwargs)
+
+
+def copy_context_for_thread(fn):
+  """Wrap `fn` to run in a copy of the current context, so that spans opened in the calling
+  thread are visible to worker threads (eg. to add the downloaded bytes).
+  """
+  context = contextvars.copy_context()
+
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    return context.copy().run(fn, *args, **kwargs)
+
+  return wrapper
+
+
+def _debug_enabled() -> bool:
+  import streamlit as st
+  return os.environ.get('FAI_DEBUG') == '1' or st.query_params.get('debug') == '1'
+
+
+def start_run(page: str) -> dict:
+  """Start recording the spans of a run (a script execution) of `page`."""
+  import streamlit as st
+  run = {'run_id': uuid.uuid4().hex[:12], 'page': page, 'start': time.perf_counter(),
+         'records': [], 'profiler': None}
+  if st.session_state.pop('_profile_next_run', False):
+    try:
+      from pyinstrument import Profiler
+      run['profiler'] = Profiler()
+      run['profiler'].start()
+    except ImportError:
+      run['profiler'] = cProfile.Profile()
+      run['profiler'].enable()
+  _run.set(run)
+  return run
+
+
+def _profiler_report(profiler) -> str:
+  if isinstance(profiler, cProfile.Profile):
+    profiler.disable()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+    return stream.getvalue()
+  profiler.stop()
+  return profiler.output_text(unicode=False, color=False)
+
+
+def finish_run():
+  """Stop recording, export the records and show the debug panel if enabled."""
+  import streamlit as st
+  run = _run.get()
+  if run is None:
+    return
+  _run.set(None)
+  total_sec = time.perf_counter() - run['start']
+  profile = _profiler_report(run['profiler']) if run['profiler'] is not None else None
+
+  if PROFILE_LOG_FILEPATH:
+    with open(PROFILE_LOG_FILEPATH, 'a') as f:
+      for record in run['records'] + [{'name': 'total', 'depth': 0, 'start_sec': 0.0, 'wall_sec': total_sec}]:
+        f.write(json.dumps({'run_id': run['run_id'], 'page': run['page'], **record}) + '\n')
+
+  if not _debug_enabled():
+    return
+  with st.sidebar.expander('Debug: page timings', expanded=True):
+    st.write(f'Run `{run["run_id"]}`: {total_sec:.3f} sec in total.')
+    rows = [{'stage': ' ' * record['depth'] + record['name'],
+             'ms': round(record.get('wall_sec', float('nan')) * 1000, 1),
+             'cache': record.get('cache', ''), 'rows': record.get('rows'), 'bytes': record.get('bytes')}
+            for record in run['records']]
+    st.dataframe(rows, hide_index=True)
+    if st.button('Profile next rerun'):
+      st.session_state['_profile_next_run'] = True
+      st.rerun()
+    if profile is not None:
+      st.text(profile)
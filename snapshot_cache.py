@@ -0,0 +1,263 @@
+"""Persistent local cache of the parsed close series of the fai-dumps snapshots.
+
+Every (date_str, filename_prefix) close series is stored as a pair of raw .npy files, one with
+the dates and one with the close values, which are memory-mapped on load. The least recently
+used pairs are evicted when the cache grows over `SNAPSHOT_CACHE_MAX_BYTES`.
+
+The end-of-series states of the derived series (see `save_state`) are stored next to them, so
+that the next snapshot resumes the computations from the latest one, and so are the last HTTP
+responses of the downloaded files (see `save_response`), so that they are requested again
+conditionally.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = Path(os.environ.get('FAI_CACHE_DIR', Path.home() / '.cache' / 'financial-assets-insights'))
+SNAPSHOT_CACHE_DIR = CACHE_DIR / 'snapshots'
+SNAPSHOT_CACHE_MAX_BYTES = int(os.environ.get('FAI_SNAPSHOT_CACHE_MAX_BYTES', 512 * 2**20))
+STATE_CACHE_DIR = CACHE_DIR / 'state'
+HTTP_CACHE_DIR = CACHE_DIR / 'http'
+HTTP_CACHE_MAX_BYTES = int(os.environ.get('FAI_HTTP_CACHE_MAX_BYTES', 256 * 2**20))
+
+
+def _cache_filepaths(date_str: str, prefix: str, dirpath: Path) -> tuple[Path, Path]:
+  return dirpath / f'{date_str}-{prefix}-dates.npy', dirpath / f'{date_str}-{prefix}-close.npy'
+
+
+def load_close(date_str: str, prefix: str, dirpath: Path = SNAPSHOT_CACHE_DIR) -> Optional[pd.Series]:
+  """Load a cached close series, memory-mapped and read-only.
+
+  Returns:
+    close: pd.Series with a 'Date' DatetimeIndex, or None if it is not cached.
+  """
+  dates_filepath, close_filepath = _cache_filepaths(date_str, prefix, dirpath)
+  try:
+    dates = np.load(dates_filepath, mmap_mode='r')
+    close = np.load(close_filepath, mmap_mode='r')
+  except (FileNotFoundError, ValueError):
+    return None
+  # mark as recently used for the eviction
+  for filepath in (dates_filepath, close_filepath):
+    os.utime(filepath)
+
+  index = pd.DatetimeIndex(dates, name='Date', copy=False)
+  return pd.Series(close, index=index, name=prefix, copy=False)
+
+
+def save_close(date_str: str, prefix: str, close: pd.Series, dirpath: Path = SNAPSHOT_CACHE_DIR,
+               max_bytes: int = SNAPSHOT_CACHE_MAX_BYTES):
+  """Save a Date-indexed close series to the cache and evict old entries if needed.
+
+  Series without a timezone-naive DatetimeIndex are not cached.
+  """
+  if not isinstance(close.index, pd.DatetimeIndex) or close.index.tz is not None:
+    return
+  dirpath.mkdir(parents=True, exist_ok=True)
+  arrays = (close.index.to_numpy(), close.to_numpy(dtype=np.float64))
+  for filepath, array in zip(_cache_filepaths(date_str, prefix, dirpath), arrays):
+    # write then rename, so that concurrent readers never see a partial file
+    tmp_filepath = filepath.with_name(f'{filepath.stem}.{os.getpid()}.tmp')
+    with open(tmp_filepath, 'wb') as f:
+      np.save(f, array)
+    os.replace(tmp_filepath, filepath)
+  evict(max_bytes, dirpath)
+
+
+def cached_snapshots(dirpath: Path = SNAPSHOT_CACHE_DIR) -> dict[str, frozenset[str]]:
+  """The dated snapshots with cached close series, like the snapshot manifest: date_str ->
+  prefixes."""
+  snapshots = dict()
+  for filepath in dirpath.glob('[0-9]' * 8 + '-*-close.npy'):
+    date_str, prefix = filepath.name[:8], filepath.name[9:-len('-close.npy')]
+    if _cache_filepaths(date_str, prefix, dirpath)[0].exists():
+      snapshots.setdefault(date_str, set()).add(prefix)
+  return {date_str: frozenset(prefixes) for date_str, prefixes in snapshots.items()}
+
+
+def discard(date_str: str, prefix: str, dirpath: Path = SNAPSHOT_CACHE_DIR):
+  """Remove a cached close series, eg. when its source file has been updated."""
+  for filepath in _cache_filepaths(date_str, prefix, dirpath):
+    filepath.unlink(missing_ok=True)
+
+
+def _local_dir_key(dirpath: Path) -> str:
+  dirpath = Path(dirpath).resolve()
+  return f'{dirpath.name}~{hashlib.sha1(str(dirpath).encode()).hexdigest()[:12]}'
+
+
+def local_key(filepath: Path) -> tuple[str, str]:
+  """The (date_str, prefix) cache key of a local close file, in place of the snapshot date and
+  filename prefix of a dump file.
+
+  The key has the name and a hash of the resolved directory, so that directories with the same
+  name do not share entries, and the file stem with its modification time, so that an updated
+  file is loaded again.
+  """
+  return _local_dir_key(filepath.parent), f'{filepath.stem}~{filepath.stat().st_mtime_ns}'
+
+
+def discard_local(filepath: Path, dirpath: Path = SNAPSHOT_CACHE_DIR):
+  """Remove the cached close series of all versions of a local close file (see `local_key`)."""
+  date_str = _local_dir_key(filepath.parent)
+  pattern = re.compile(rf'{re.escape(date_str)}-{re.escape(filepath.stem)}~\d+-(dates|close)\.npy')
+  for cache_filepath in dirpath.glob(f'{glob.escape(date_str)}-{glob.escape(filepath.stem)}~*.npy'):
+    if pattern.fullmatch(cache_filepath.name):
+      cache_filepath.unlink(missing_ok=True)
+
+
+def evict(max_bytes: int = SNAPSHOT_CACHE_MAX_BYTES, dirpath: Path = SNAPSHOT_CACHE_DIR,
+          pattern: str = '*.npy'):
+  """Delete the least recently used entries until the cache is at most `max_bytes`."""
+  filepaths = [(fp.stat(), fp) for fp in dirpath.glob(pattern)]
+  total_bytes = sum(stat.st_size for stat, _ in filepaths)
+  for stat, filepath in sorted(filepaths, key=lambda x: x[0].st_mtime):
+    if total_bytes <= max_bytes:
+      break
+    # a partially evicted pair is seen as not cached by `load_close` and `load_response`
+    filepath.unlink(missing_ok=True)
+    total_bytes -= stat.st_size
+
+
+def cached_closes(date_str: str, prefixes: list[str],
+                  load_fn: Callable[[list[str]], list[Optional[pd.Series]]]
+                  ) -> dict[str, Optional[pd.Series]]:
+  """Get the close series of `prefixes` from the cache, loading and caching the missing ones.
+
+  Args:
+    load_fn: loads the close series of the given prefixes from the original source, with None
+      for the ones that could not be loaded (they are not cached).
+
+  Returns:
+    closes: a dict from prefix to close pd.Series or None, in the order of `prefixes`.
+  """
+  return _cached({prefix: (date_str, prefix) for prefix in prefixes}, load_fn)
+
+
+def cached_local_closes(filepaths: dict[str, Path],
+                        load_fn: Callable[[list[str]], list[Optional[pd.Series]]]
+                        ) -> dict[str, Optional[pd.Series]]:
+  """Like `cached_closes` for local files, keyed by their `local_key`.
+
+  Args:
+    filepaths: name -> close file.
+    load_fn: loads the close series of the given names, with None for the ones that could not be
+      loaded (they are not cached).
+
+  Returns:
+    closes: a dict from name to close pd.Series or None, in the order of `filepaths`.
+  """
+  return _cached({name: local_key(filepath) for name, filepath in filepaths.items()}, load_fn)
+
+
+def _cached(keys: dict[str, tuple[str, str]], load_fn) -> dict[str, Optional[pd.Series]]:
+  closes = {name: load_close(*key) for name, key in keys.items()}
+  missing = [name for name, close in closes.items() if close is None]
+  if missing:
+    for name, close in zip(missing, load_fn(missing)):
+      if close is not None:
+        save_close(*keys[name], close)
+      closes[name] = close
+  return closes
+
+
+def digest(*arrays: np.ndarray) -> str:
+  """A hash of the dtypes, shapes and contents of `arrays`, eg. to check that the first rows of
+  a new snapshot are the rows a state was computed from."""
+  h = hashlib.sha1()
+  for array in arrays:
+    array = np.ascontiguousarray(array)
+    h.update(f'{array.dtype.str}{array.shape}'.encode())
+    h.update(array.view(np.uint8).reshape(-1).data if array.size else b'')
+  return h.hexdigest()
+
+
+def _state_filepath(kind: str, date_str: str, dirpath: Path) -> Path:
+  return dirpath / f'{kind}-{date_str}.npz'
+
+
+def _is_date(date_str: str) -> bool:
+  return re.fullmatch(r'\d{8}', date_str) is not None
+
+
+def _state_date_strs(kind: str, dirpath: Path) -> list[str]:
+  """The dates (YYYYMMDD) of the saved `kind` states, sorted, without the ones of local
+  directories like the consolidated one."""
+  return sorted(date_str for filepath in dirpath.glob(f'{kind}-*.npz')
+                if _is_date(date_str := filepath.name[len(kind) + 1:-len('.npz')]))
+
+
+def save_state(kind: str, date_str: str, dirpath: Path = STATE_CACHE_DIR, **arrays):
+  """Save the `kind` state of the `date_str` snapshot. The state of a dated snapshot replaces
+  the ones of the older dates, the state of a local directory like the consolidated one
+  (`date_str` is its name) only its own one."""
+  dirpath.mkdir(parents=True, exist_ok=True)
+  filepath = _state_filepath(kind, date_str, dirpath)
+  tmp_filepath = filepath.with_name(f'{filepath.stem}.{os.getpid()}.tmp.npz')
+  np.savez(tmp_filepath, **arrays)
+  os.replace(tmp_filepath, filepath)
+  if _is_date(date_str):
+    for old_date_str in _state_date_strs(kind, dirpath):
+      if old_date_str < date_str:
+        _state_filepath(kind, old_date_str, dirpath).unlink(missing_ok=True)
+
+
+def load_state(kind: str, date_str: str, dirpath: Path = STATE_CACHE_DIR
+               ) -> Optional[tuple[str, dict[str, np.ndarray]]]:
+  """The latest `kind` state saved for a snapshot up to `date_str` (inclusive, so a snapshot
+  that grows under the same name, like the consolidated one, resumes from itself). A local
+  directory without a saved state of its own resumes from the latest dated one.
+
+  Returns:
+    (state_date_str, arrays) or None if there is none.
+  """
+  date_strs = [name for name in _state_date_strs(kind, dirpath) if not _is_date(date_str) or name <= date_str]
+  if not _is_date(date_str) and _state_filepath(kind, date_str, dirpath).exists():
+    date_strs.append(date_str)
+  for state_date_str in reversed(date_strs):
+    try:
+      with np.load(_state_filepath(kind, state_date_str, dirpath)) as f:
+        return state_date_str, {key: f[key] for key in f.files}
+    except (OSError, ValueError):
+      continue
+  return None
+
+
+def _response_filepaths(url: str, dirpath: Path) -> tuple[Path, Path]:
+  key = hashlib.sha1(url.encode()).hexdigest()
+  return dirpath / f'{key}.json', dirpath / f'{key}.body'
+
+
+def load_response(url: str, dirpath: Path = HTTP_CACHE_DIR) -> Optional[tuple[dict[str, str], bytes]]:
+  """The validators (the ETag and Last-Modified headers) and the content of the last response
+  saved for `url`, or None if there is none.
+  """
+  validators_filepath, content_filepath = _response_filepaths(url, dirpath)
+  try:
+    validators = json.loads(validators_filepath.read_text())
+    content = content_filepath.read_bytes()
+  except (FileNotFoundError, ValueError):
+    return None
+  # mark as recently used for the eviction
+  os.utime(content_filepath)
+  return validators, content
+
+
+def save_response(url: str, validators: dict[str, str], content: bytes, dirpath: Path = HTTP_CACHE_DIR,
+                  max_bytes: int = HTTP_CACHE_MAX_BYTES):
+  """Save the validators and content of a response of `url` and evict old responses if needed."""
+  dirpath.mkdir(parents=True, exist_ok=True)
+  validators_filepath, content_filepath = _response_filepaths(url, dirpath)
+  # the content first, so that saved validators always come with their content
+  for filepath, data in ((content_filepath, content), (validators_filepath, json.dumps(validators).encode())):
+    tmp_filepath = filepath.with_name(f'{filepath.name}.{os.getpid()}.tmp')
+    tmp_filepath.write_bytes(data)
+    os.replace(tmp_filepath, filepath)
+  evict(max_bytes, dirpath, pattern='*.body')
@@ -0,0 +1,64 @@
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# the modules of the app are at the root of the repository, and the persistent caches of the
+# tests must not touch the user's one
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('FAI_CACHE_DIR', tempfile.mkdtemp(prefix='fai-tests-'))
+
+
+class StandInHandler(http.server.SimpleHTTPRequestHandler):
+  """Serves the files of the server directory, like the fai-dumps repository.
+
+  The server counts the requests of every path and the requests in flight, and answers a path
+  with a 503 as long as its `failures` count is positive.
+  """
+
+  def do_GET(self):
+    server = self.server
+    with server.lock:
+      server.requests[self.path] = server.requests.get(self.path, 0) + 1
+      server.in_flight += 1
+      server.max_in_flight = max(server.max_in_flight, server.in_flight)
+      fail = server.failures.get(self.path, 0) > 0
+      if fail:
+        server.failures[self.path] -= 1
+    try:
+      time.sleep(server.delay)
+      if fail:
+        self.send_error(503)
+      else:
+        super().do_GET()
+    finally:
+      with server.lock:
+        server.in_flight -= 1
+
+  def log_message(self, format, *args):
+    pass
+
+
+@pytest.fixture
+def stand_in_server(tmp_path):
+  """A local HTTP server standing in for URL_ASSETS, serving `server.dirpath`."""
+  dirpath = tmp_path / 'assets'
+  dirpath.mkdir()
+  server = http.server.ThreadingHTTPServer(
+      ('127.0.0.1', 0), functools.partial(StandInHandler, directory=str(dirpath)))
+  server.dirpath = dirpath
+  server.url = f'http://127.0.0.1:{server.server_port}/'
+  server.lock = threading.Lock()
+  server.requests, server.failures = {}, {}
+  server.in_flight = server.max_in_flight = 0
+  server.delay = 0.
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  yield server
+  server.shutdown()
+  server.server_close()
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from parallel import map_column_chunks
+
+COST = 5e-4
+
+GRIDS = {'hold': {}, 'trend': {'window': [5, 50, 200]},
+         'threshold': {'lookback': [5, 21], 'threshold': [0.02, 0.05]},
+         'mean_reversion': {'window': [21, 63], 'entry_z': [1.5, 2], 'exit_z': [0, 0.5]}}
+
+
+@pytest.fixture(scope='module')
+def closes() -> pd.DataFrame:
+  rng = np.random.default_rng(0)
+  values = np.exp(np.cumsum(rng.normal(0, 0.01, (3000, 4)), axis=0))
+  # a late start, a forward filled gap and a column without data
+  values[:300, 1] = np.nan
+  values[1000:1010, 2] = np.nan
+  values[:, 3] = np.nan
+  return pd.DataFrame(values, index=pd.bdate_range('2000-01-03', periods=3000), columns=list('abcd'))
+
+
+def loop_backtest(close: pd.Series, rule: str, params: dict, long_only: bool) -> dict:
+  """One parameter set with pandas, row by row semantics."""
+  first_valid = int(np.argmax(close.notna()))
+  close = close.ffill()
+  log_close = np.log(close)
+  if rule == 'hold':
+    positions = close.notna().astype(float)
+  elif rule == 'trend':
+    deviations = log_close - log_close.rolling(int(params['window'])).mean()
+    positions = np.sign(deviations.where(deviations.abs() >= 1e-12, 0.)).fillna(0.)
+  else:
+    events = pd.Series(np.nan, index=close.index)
+    if rule == 'threshold':
+      change = close / close.shift(int(params['lookback'])) - 1
+      events[change > params['threshold']] = 1.
+      events[change < -params['threshold']] = -1.
+    else:
+      window = int(params['window'])
+      z = (log_close - log_close.rolling(window).mean()) / log_close.rolling(window).std(ddof=0)
+      events[z.abs() < params['exit_z']] = 0.
+      events[z < -params['entry_z']] = 1.
+      events[z > params['entry_z']] = -1.
+    positions = events.ffill().fillna(0.)
+  if long_only:
+    positions = positions.clip(lower=0)
+  trades = positions.diff().fillna(positions).abs()
+  held = positions.shift(1).fillna(0.)
+  daily = (1 + (held * close.pct_change().fillna(0.)).clip(lower=-1)) * (1 - COST) ** trades
+  equity = daily.cumprod()
+  num_days = len(close) - first_valid - 1
+  log_daily = np.log(daily)
+  return dict(total_return_pct=(equity.iloc[-1] - 1) * 100,
+              max_drawdown_pct=(equity / np.maximum(equity.cummax(), 1) - 1).min() * 100,
+              volatility_pct=np.sqrt(max((log_daily**2).sum() / num_days - (log_daily.sum() / num_days)**2, 0)
+                                     * 252) * 100,
+              turnover=trades.sum() / (num_days / 252), num_trades=(trades > 0).sum(),
+              exposure_pct=(held != 0).sum() / num_days * 100)
+
+
+@pytest.mark.parametrize('long_only', [False, True])
+@pytest.mark.parametrize('rule', list(GRIDS))
+def test_run_backtest_matches_a_loop(closes, rule, long_only):
+  result = backtest.run_backtest(closes, rule, backtest.parameter_grid(**GRIDS[rule]), cost_bps=COST * 1e4,
+                                 long_only=long_only)
+  for column in 'abc':
+    frame = backtest.backtest_frame(result, column)
+    for i in range(len(frame)):
+      expected = loop_backtest(closes[column], rule, {name: frame[name][i] for name in GRIDS[rule]}, long_only)
+      for metric, value in expected.items():
+        assert frame[metric][i] == pytest.approx(value, rel=1e-9, abs=1e-9), (column, i, metric)
+  assert np.isnan(result.metrics['cagr_pct'][:, 3]).all()
+  assert not result.metrics['cagr_pct'].flags.writeable
+
+
+@pytest.mark.parametrize('rule', list(GRIDS))
+def test_run_backtest_blocks_and_pool(closes, rule):
+  result = backtest.run_backtest(closes, rule, backtest.parameter_grid(**GRIDS[rule]), cost_bps=10)
+  blocks = backtest.run_backtest(closes, rule, result.params, cost_bps=10, max_bytes=1)
+  pooled = map_column_chunks(backtest._backtest_columns, backtest.log_prices(closes), max_workers=2,
+                             min_cells=1, rule=rule, params=result.params, cost=1e-3, long_only=False,
+                             max_bytes=backtest.BACKTEST_CHUNK_MAX_BYTES)
+  for metric, values in zip(backtest.BACKTEST_METRICS, pooled):
+    np.testing.assert_array_equal(result.metrics[metric], blocks.metrics[metric])
+    np.testing.assert_array_equal(result.metrics[metric], values)
+
+
+@pytest.mark.parametrize('rule, params', [('x', None), ('trend', {'lookback': [1]}),
+                                          ('threshold', {'lookback': [1, 2], 'threshold': [0.1]})])
+def test_run_backtest_invalid_parameters(closes, rule, params):
+  with pytest.raises(ValueError):
+    backtest.run_backtest(closes, rule, params)
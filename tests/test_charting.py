@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+import charting
+import funclib
+
+
+def test_ratios_twin_chart_spec_is_cached(monkeypatch):
+  dates = pd.date_range('1990-01-01', '2024-12-31', name='Date')
+  rng = np.random.default_rng(0)
+  ratios = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates), 2)), axis=0)), index=dates,
+                        columns=['a/b', 'c/d'])
+  pyramid = funclib.build_pyramid(ratios)
+  calls = []
+  monkeypatch.setattr(charting, 'get_ratios_pyramid_snapshot',
+                      lambda date_str: calls.append(date_str) or pyramid)
+
+  args = ('20990601', None, None, 'a/b', 'A/B', 'c/d', 'C/D')
+  spec = charting.get_ratios_twin_chart_spec(*args)
+  data = spec['datasets']['ratios']
+  assert data.columns.to_list() == ['date', 'a/b', 'c/d']
+  # the weekly level fills the chart and is within the point budget
+  pd.testing.assert_frame_equal(data.set_index('date')[['a/b', 'c/d']], pyramid['weekly'], check_names=False,
+                                check_freq=False)
+  # a rerun with the same parameters only looks the spec up
+  assert charting.get_ratios_twin_chart_spec(*args) is spec
+  assert calls == ['20990601']
+
+  zoomed = charting.get_ratios_twin_chart_spec('20990601', '2020', '2020', 'a/b', 'A/B', 'c/d', 'C/D')
+  assert zoomed is not spec and len(calls) == 2
+  pd.testing.assert_frame_equal(zoomed['datasets']['ratios'].set_index('date')[['a/b', 'c/d']],
+                                ratios.loc['2020'], check_names=False, check_freq=False)
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_acquisition import _update_consolidated_csv
+
+
+def history(start: str, num_days: int, offset: float = 0.) -> pd.DataFrame:
+  dates = pd.bdate_range(start, periods=num_days, name='Date')
+  close = 100 + np.arange(num_days, dtype=np.float64) + offset
+  return pd.DataFrame({'Open': close, 'Close': close}, index=dates)
+
+
+class FakeProvider:
+  """A `download_fn` serving a fixed history, or an empty frame like yfinance on errors."""
+
+  def __init__(self, df: pd.DataFrame):
+    self.df = df
+    self.starts = []
+
+  def __call__(self, symbol: str, start: str) -> pd.DataFrame:
+    self.starts.append(start)
+    return self.df.loc[start:]
+
+
+@pytest.fixture
+def filepath(tmp_path):
+  filepath = tmp_path / 'consolidated-sp500-daily.csv'
+  history('2024-01-01', 10).to_csv(filepath)
+  return filepath
+
+
+def read(filepath) -> pd.DataFrame:
+  return pd.read_csv(filepath, parse_dates=['Date'], index_col='Date')
+
+
+def test_appends_the_new_days(filepath):
+  provider = FakeProvider(history('2024-01-01', 15))
+  assert _update_consolidated_csv(filepath, 'SP500', provider, overlap_days=5) == 5
+  # only the tail is downloaded
+  assert provider.starts == ['2024-01-08']
+  pd.testing.assert_frame_equal(read(filepath), history('2024-01-01', 15), check_freq=False)
+
+
+def test_rewrites_the_history_when_the_overlap_differs(filepath):
+  provider = FakeProvider(history('2024-01-01', 15, offset=1.))
+  assert _update_consolidated_csv(filepath, 'SP500', provider, overlap_days=5) == 15
+  assert provider.starts == ['2024-01-08', '1927-01-01']
+  pd.testing.assert_frame_equal(read(filepath), history('2024-01-01', 15, offset=1.), check_freq=False)
+  assert not filepath.with_name(filepath.name + '.tmp').exists()
+
+
+@pytest.mark.parametrize('response', [history('2024-01-01', 0), history('2024-01-01', 12).iloc[[0, 1, 11]]],
+                         ids=['empty', 'incomplete'])
+def test_keeps_the_stored_history_on_a_failed_download(filepath, response):
+  stored = read(filepath)
+  provider = FakeProvider(response)
+  assert _update_consolidated_csv(filepath, 'SP500', provider, overlap_days=5) == 0
+  pd.testing.assert_frame_equal(read(filepath), stored)
+
+
+def test_keeps_the_stored_history_on_a_short_full_download(filepath):
+  stored = read(filepath)
+
+  # the overlap differs, and the full download ends before the stored history
+  def download_fn(symbol, start):
+    return history('2024-01-01', 12, offset=1.) if start != '1927-01-01' else history('2024-01-01', 5)
+
+  assert _update_consolidated_csv(filepath, 'SP500', download_fn, overlap_days=5) == 0
+  pd.testing.assert_frame_equal(read(filepath), stored)
+
+
+def test_writes_the_full_history_when_nothing_is_stored(tmp_path):
+  filepath = tmp_path / 'consolidated-btc-daily.csv'
+  assert _update_consolidated_csv(filepath, 'BTC-USD', FakeProvider(history('2024-01-01', 0)), 5) == 0
+  assert not filepath.exists()
+  assert _update_consolidated_csv(filepath, 'BTC-USD', FakeProvider(history('2024-01-01', 7)), 5) == 7
+  assert len(read(filepath)) == 7
+
+
+def test_incremental_update_is_read_back(tmp_path):
+  import funclib
+  from data_acquisition import download_and_save_data
+  provider = FakeProvider(history('2024-01-01', 10))
+  download_and_save_data(tmp_path, tts=0, incremental=True, download_fn=provider, groups=('indices',))
+  dirpath = tmp_path / funclib.CONSOLIDATED_DIRNAME
+  # the last day is left out
+  assert len(funclib.get_close_data_from_dir(dirpath)) == 9
+  provider.df = history('2024-01-01', 15)
+  download_and_save_data(tmp_path, tts=0, incremental=True, download_fn=provider, groups=('indices',))
+  assert len(funclib.get_close_data_from_dir(dirpath)) == 14
+
+
+def test_full_download_skips_the_failed_symbols(tmp_path, capsys):
+  import funclib
+  from data_acquisition import download_and_save_data
+
+  def download_fn(symbol, start):
+    if symbol == '^GSPC':
+      return None
+    return history('2024-01-01', 0) if symbol == '^NDX' else history('2024-01-01', 5)
+
+  download_and_save_data(tmp_path, tts=0, download_fn=download_fn, groups=('indices',))
+  (dirpath,) = [p for p in tmp_path.iterdir() if p.is_dir()]
+  filenames = {p.name[len(dirpath.name) + 1:] for p in dirpath.glob('*.csv')}
+  assert 'sp500-daily.csv' not in filenames and 'nasdaq100-daily.csv' not in filenames
+  assert len(filenames) == len(funclib.get_symbols('indices').drop_duplicates('filename_prefix')) - 2
+  assert capsys.readouterr().out.count('Could not download') == 2
+  # the manifest lists the files that were written
+  assert funclib.build_manifest(tmp_path)['snapshots'][dirpath.name] == sorted(
+      name[:-len('.csv')] for name in filenames)
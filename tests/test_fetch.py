@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+import funclib
+
+
+def write_csv(dirpath, name: str, num_days: int, header: str = 'Date,Open,Close'):
+  dates = pd.bdate_range('2024-01-01', periods=num_days).strftime('%Y-%m-%d')
+  lines = [header] + [f'{day},1.0,{i + 1.0}' for i, day in enumerate(dates)]
+  (dirpath / name).write_text('\n'.join(lines) + '\n')
+
+
+def test_download_df_csvs_concurrently(stand_in_server):
+  stand_in_server.delay = 0.2
+  names = [f'file{i}.csv' for i in range(8)]
+  for i, name in enumerate(names):
+    write_csv(stand_in_server.dirpath, name, 10 + i, header='date,open,close' if i == 3 else 'Date,Open,Close')
+  dfs = funclib.download_df_csvs([stand_in_server.url + name for name in names], **funclib.CLOSE_CSV_KWARGS)
+  # in the order of the urls
+  closes = [funclib._close_series(df) for df in dfs]
+  assert [len(close) for close in closes] == [10 + i for i in range(8)]
+  np.testing.assert_array_equal(closes[3].to_numpy(), np.arange(1., 14.))
+  assert stand_in_server.max_in_flight > 1
+
+
+def test_download_df_csvs_skips_missing_files(stand_in_server):
+  write_csv(stand_in_server.dirpath, 'a.csv', 5)
+  write_csv(stand_in_server.dirpath, 'c.csv', 7)
+  dfs = funclib.download_df_csvs([stand_in_server.url + name for name in ('a.csv', 'b.csv', 'c.csv')])
+  assert dfs[1] is None
+  assert (len(dfs[0]), len(dfs[2])) == (5, 7)
+  # a 404 is not retried
+  assert stand_in_server.requests['/b.csv'] == 1
+
+
+def test_download_df_csv_retries_transient_errors(stand_in_server):
+  write_csv(stand_in_server.dirpath, 'a.csv', 5)
+  stand_in_server.failures['/a.csv'] = 2
+  df = funclib.download_df_csv(stand_in_server.url + 'a.csv')
+  assert len(df) == 5
+  assert stand_in_server.requests['/a.csv'] == 3
+
+
+def test_download_df_csv_gives_up_after_the_retries(stand_in_server):
+  write_csv(stand_in_server.dirpath, 'a.csv', 5)
+  stand_in_server.failures['/a.csv'] = funclib.FETCH_RETRIES + 1
+  assert funclib.download_df_csv(stand_in_server.url + 'a.csv') is None
+  assert stand_in_server.requests['/a.csv'] == funclib.FETCH_RETRIES + 1
+
+
+def test_load_close_data_from_dumps_in_bulk(stand_in_server, monkeypatch):
+  monkeypatch.setattr(funclib, 'URL_ASSETS', stand_in_server.url)
+  stand_in_server.delay = 0.1
+  date_str = '20990401'
+  snapshot_dirpath = stand_in_server.dirpath / date_str
+  snapshot_dirpath.mkdir()
+  symbol_names = ['btcusd', 'sp500', 'nasdaq100', 'ethusd']
+  # ethusd has no file
+  for num_days, symbol_name in zip([12, 10, 8], symbol_names):
+    write_csv(snapshot_dirpath, f'{date_str}-{funclib._symbol_filename_ending(symbol_name)}.csv', num_days)
+  closes = funclib.load_close_data_from_dumps(date_str, symbol_names)
+  assert closes.columns.to_list() == symbol_names[:3]
+  # aligned and forward filled, without the last day
+  assert len(closes) == 11 and not closes.isna().any().any()
+  np.testing.assert_array_equal(closes['nasdaq100'], np.r_[np.arange(1., 9.), [8., 8., 8.]])
+  assert stand_in_server.max_in_flight > 1
+
+  # the stored files are downloaded once, the missing one is looked up again
+  pd.testing.assert_frame_equal(funclib.load_close_data_from_dumps(date_str, symbol_names), closes)
+  assert stand_in_server.requests == {f'/{date_str}/{date_str}-{funclib._symbol_filename_ending(name)}.csv':
+                                      2 if name == 'ethusd' else 1 for name in symbol_names}
@@ -0,0 +1,349 @@
+import concurrent.futures
+import io
+import itertools
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import funclib
+
+
+@pytest.mark.parametrize('header', ['Date,Open,Close,Volume', 'date,open,close,volume',
+                                    'Close,Open,DATE,Volume'])
+@pytest.mark.parametrize('chunksize', [None, 2])
+def test_read_close_csv_any_header_case(header, chunksize):
+  names = header.lower().split(',')
+  rows = [{'date': f'2024-01-0{day}', 'open': 1., 'close': 10. + day, 'volume': 5} for day in range(1, 6)]
+  text = '\n'.join([header] + [','.join(str(row[name]) for name in names) for row in rows])
+  close = funclib.read_close_csv(io.StringIO(text), chunksize=chunksize)
+  assert close.index.name == 'Date'
+  np.testing.assert_array_equal(close.index, pd.date_range('2024-01-01', periods=5))
+  np.testing.assert_array_equal(close.to_numpy(), 11. + np.arange(5))
+  assert close.dtype == np.float64
+
+
+def _closes_with_gaps(num_rows=400, seed=0):
+  rng = np.random.default_rng(seed)
+  closes = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.02, (num_rows, 3)), axis=0)),
+                        index=pd.date_range('2000-01-01', periods=num_rows), columns=['a', 'b', 'c'])
+  closes.iloc[:37, 1] = np.nan  # a late start
+  closes.iloc[rng.random(num_rows) < 0.1, 0] = np.nan  # gaps
+  closes.iloc[150:190, 2] = np.nan  # a long gap
+  return closes
+
+
+def _max_drawdown(x):
+  return np.nanmin(x / np.fmax.accumulate(x) - 1) * 100
+
+
+@pytest.mark.parametrize('window', [3, 21, 64, 100])
+def test_rolling_metrics_match_pandas(window):
+  closes = _closes_with_gaps()
+  rolling = funclib.compute_rolling_metrics(closes, (window,), reference='b')
+  # the metrics are computed on the forward filled closes
+  filled = closes.ffill()
+  returns = np.log(filled).diff()
+  # the correlation with a flat window is undefined, pandas gives 0 or NaN depending on rounding
+  flat = returns.abs().rolling(window - 1).max() == 0
+  expected = {
+      'volatility_pct': returns.rolling(window - 1).std() * np.sqrt(funclib.ROLLING_DAYS_PER_YEAR) * 100,
+      'correlation': returns.rolling(window - 1).corr(returns['b']).mask(flat | flat[['b']].to_numpy()),
+      'drawdown_pct': (filled / filled.rolling(window, min_periods=1).max() - 1) * 100,
+      'max_drawdown_pct': filled.rolling(window, min_periods=1).apply(_max_drawdown, raw=True),
+      'return_pct': filled.pct_change(window, fill_method=None) * 100,
+  }
+  for metric, frame in expected.items():
+    np.testing.assert_allclose(funclib.rolling_metric_frame(rolling, metric, window), frame,
+                               rtol=1e-7, atol=1e-6, err_msg=metric)
+
+
+def test_rolling_max_drawdown_within_window():
+  closes = pd.DataFrame({'a': [100., 50, 60, 70, 80, 90]}, index=pd.date_range('2024-01-01', periods=6))
+  rolling = funclib.compute_rolling_metrics(closes, (3,), metrics=('max_drawdown_pct',))
+  np.testing.assert_array_equal(rolling.values['max_drawdown_pct'][0, :, 0], [0, -50, -50, 0, 0, 0])
+
+
+def test_summarize_ratios_change_from_first_joint_row():
+  dates = pd.date_range('2024-01-01', periods=4)
+  closes = pd.DataFrame({'a': [1., 2, 2, 2], 'b': [np.nan, np.nan, 1, 1]}, index=dates)
+  summary = funclib.summarize_ratios(funclib.log_prices(closes), ('a', 'b'))
+  np.testing.assert_allclose(summary.change_pct, [[np.nan, 0], [0, np.nan]], atol=1e-12)
+
+
+@pytest.mark.parametrize('lookback_days', [None, 50, 150])
+def test_summarize_ratios_change_matches_compute_ratios(lookback_days):
+  rng = np.random.default_rng(1)
+  dates = pd.date_range('2000-01-01', periods=200)
+  starts = {'a': 0, 'b': 30, 'c': 120, 'd': 199}
+  closes = {name: pd.Series(np.exp(np.cumsum(rng.normal(0, 0.02, len(dates) - start))), index=dates[start:])
+            for name, start in starts.items()}
+  names = tuple(closes)
+  summary = funclib.summarize_ratios(funclib.log_prices(funclib.align_closes(closes)), names, lookback_days)
+
+  ratios = funclib.compute_ratios(closes, {(num, den): (num, den) for num in names for den in names})
+  if lookback_days is not None:
+    ratios = ratios.iloc[-(lookback_days + 1):]
+  for i, num in enumerate(names):
+    for j, den in enumerate(names):
+      ratio = ratios[(num, den)].dropna()
+      expected = np.nan if num == den or ratio.empty else (ratio.iloc[-1] / ratio.iloc[0] - 1) * 100
+      np.testing.assert_allclose(summary.change_pct[i, j], expected, rtol=1e-10, atol=1e-10,
+                                 err_msg=f'{num}/{den}')
+
+
+def test_compact_frames_are_shared_read_only_views():
+  closes = _closes_with_gaps()
+  compact = funclib.to_compact(closes, np.float32)
+  assert compact.values.dtype == np.float32 and not compact.values.flags.writeable
+  frame = funclib.compact_to_frame(compact)
+  assert np.shares_memory(frame.to_numpy(), compact.values)
+  np.testing.assert_array_equal(frame, closes.to_numpy(dtype=np.float32))
+  np.testing.assert_array_equal(frame.index, closes.index)
+
+
+def reference_days_since_ath(signal: pd.Series, eps=None) -> pd.Series:
+  """The loop `days_since_ath_array` replaced."""
+  signal = signal[signal.first_valid_index():].ffill()
+  ath = signal.iloc[0]
+  num_days_since_ath = [0]
+  eps = eps or 0
+  for price in signal[1:]:
+    diff = ath - price
+    if diff < eps:
+      ath = max(ath, price)
+      num_days_since_ath.append(0)
+    else:
+      num_days_since_ath.append(num_days_since_ath[-1] + 1)
+  return pd.Series(num_days_since_ath, index=signal.index, dtype=np.int32)
+
+
+def reference_days_since_change(signal: pd.Series, change, days_period: int) -> tuple[pd.Series, int]:
+  """The loop `days_since_change_array` replaced, with the number of occurences."""
+  signal = signal[signal.first_valid_index():].ffill()
+  pct_change = signal.pct_change(periods=days_period)[1:] * 100
+  num_days_since_change = [0]
+  for i, c in enumerate(pct_change):
+    if (change > 0 and c < change) or (change < 0 and c > change):
+      num_days_since_change.append(num_days_since_change[i] + 1)
+    else:
+      num_days_since_change.append(0)
+  num_occurences = np.count_nonzero(pct_change >= change if change > 0 else pct_change <= change)
+  return pd.Series(num_days_since_change, index=signal.index, dtype=np.int32), num_occurences
+
+
+def closes_with_runs(num_rows: int = 300, seed: int = 2) -> pd.DataFrame:
+  """Closes with NaN runs, late starts, flat stretches and repeated highs."""
+  rng = np.random.default_rng(seed)
+  values = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (num_rows, 5)), axis=0))
+  values[:40, 1] = np.nan  # a late start
+  values[:299, 2] = np.nan  # a start on the last row
+  values[100:130, 0] = np.nan  # a NaN run
+  values[rng.random(num_rows) < 0.1, 3] = np.nan  # scattered NaNs
+  values[50:90, 4] = values[49, 4]  # a flat stretch at a level
+  values[200:210, 4] = values[:200, 4].max()  # at the all time high
+  return pd.DataFrame(values, index=pd.bdate_range('2000-01-03', periods=num_rows))
+
+
+@pytest.mark.parametrize('eps', [None, 0.5])
+def test_days_since_ath_array_matches_the_loop(eps):
+  closes = closes_with_runs()
+  counters, first_valid = funclib.days_since_ath_array(closes.to_numpy(), eps=eps)
+  for j, column in enumerate(closes):
+    expected = reference_days_since_ath(closes[column], eps)
+    assert first_valid[j] == closes.index.get_loc(expected.index[0])
+    np.testing.assert_array_equal(counters[first_valid[j]:, j], expected.to_numpy())
+    assert not counters[:first_valid[j], j].any()
+
+
+def test_days_since_change_array_matches_the_loop():
+  closes = closes_with_runs()
+  changes, days_periods = [-3, -1, 0.5, 2], [1, 3, 10]
+  counters, num_occurences, first_valid = funclib.days_since_change_array(closes.to_numpy(), changes,
+                                                                          days_periods)
+  for (i, change), (k, days_period), (j, column) in itertools.product(
+      enumerate(changes), enumerate(days_periods), enumerate(closes)):
+    expected, expected_num_occurences = reference_days_since_change(closes[column], change, days_period)
+    np.testing.assert_array_equal(counters[i, k, first_valid[j]:, j], expected.to_numpy(),
+                                  err_msg=f'{change}, {days_period}, {column}')
+    assert num_occurences[i, k, j] == expected_num_occurences
+
+
+def test_pyramid_serves_the_coarsest_level_that_fills_the_chart():
+  dates = pd.date_range('1930-01-01', '2024-12-31')
+  ratios = pd.DataFrame({'a/b': np.arange(len(dates), dtype=np.float64)}, index=dates)
+  pyramid = funclib.build_pyramid(ratios)
+  pd.testing.assert_frame_equal(pyramid['daily'], ratios)
+  assert len(pyramid['yearly']) == 95
+  pd.testing.assert_frame_equal(pyramid['monthly'], ratios.resample('ME').last())
+  # 95 years, 1140 months, ~4960 weeks
+  assert funclib.select_pyramid_level(pyramid, width_px=90) == 'yearly'
+  assert funclib.select_pyramid_level(pyramid, width_px=1000) == 'monthly'
+  assert funclib.select_pyramid_level(pyramid, width_px=2000) == 'weekly'
+  assert funclib.select_pyramid_level(pyramid, '2020', '2024', width_px=1000) == 'daily'
+  served = funclib.get_pyramid_range(pyramid, '2000', '2009', width_px=100)
+  pd.testing.assert_frame_equal(served, pyramid['monthly'].loc['2000':'2009'])
+
+
+def test_import_does_not_load_the_download_and_chart_libraries():
+  # a fresh interpreter, the other tests may have imported them already
+  script = ('import sys, funclib\n'
+            'print(sorted(name for name in ("yfinance", "altair") if name in sys.modules))\n'
+            'funclib.generate_twin_chart\n'
+            'print("altair" in sys.modules)\n')
+  result = subprocess.run([sys.executable, '-c', script], cwd=Path(funclib.__file__).parent,
+                          capture_output=True, text=True, check=True)
+  assert result.stdout.split('\n')[:2] == ['[]', 'True']
+
+
+def test_compute_ratios_matches_the_pairwise_reindex():
+  rng = np.random.default_rng(3)
+  business_days = pd.bdate_range('2000-01-03', periods=300, name='Date')
+  all_days = pd.date_range('2000-01-01', periods=420, name='Date')
+  closes = {'a': pd.Series(100 + rng.random(300).cumsum(), index=business_days),
+            # on all calendar days, a late start and unsorted
+            'b': pd.Series(50 + rng.random(350).cumsum(), index=all_days[70:]).iloc[::-1],
+            'gdp': pd.Series(rng.random(3) + 1, index=pd.date_range('1999-12-31', periods=3, freq='YE',
+                                                                     name='Date'))}
+  ratios = {'a/b': ('a', 'b'), 'b/a': ('b', 'a'), 'a/gdp': ('a', 'gdp'), 'b/gdp': ('b', 'gdp')}
+  ratios_df = funclib.compute_ratios(closes, ratios)
+  expected = pd.concat({name: funclib._reindex_and_compute_ratio(closes[num], closes[den])
+                        for name, (num, den) in ratios.items()}, axis=1, sort=True)
+  pd.testing.assert_frame_equal(ratios_df, expected, check_freq=False)
+
+
+@pytest.mark.parametrize('max_points', [2, 100, 1000])
+def test_downsample_keeps_the_extremes_within_the_budget(max_points):
+  closes = _closes_with_gaps(num_rows=5000)
+  closes['label'] = 'x'
+  sampled = funclib.downsample_df(closes, max_points)
+  # the budget is per series, the series share their rows
+  assert len(sampled) <= 3 * max_points + 2
+  assert sampled.index.is_monotonic_increasing and sampled.index.is_unique
+  pd.testing.assert_frame_equal(sampled, closes.loc[sampled.index])
+  assert closes.index[0] in sampled.index and closes.index[-1] in sampled.index
+  for column in ['a', 'b', 'c']:
+    assert sampled[column].max() == closes[column].max()
+    assert sampled[column].min() == closes[column].min()
+
+  # the extremes of every bucket of rows are kept
+  width = -(-len(closes) // (max_points // 2))
+  for start in range(0, len(closes), width):
+    bucket = closes.iloc[start:start + width]
+    for column in ['a', 'b', 'c']:
+      if bucket[column].notna().any():
+        assert bucket[column].idxmax() in sampled.index and bucket[column].idxmin() in sampled.index
+
+
+def test_downsample_keeps_short_frames():
+  closes = _closes_with_gaps(num_rows=50)
+  pd.testing.assert_frame_equal(funclib.downsample_df(closes, 100), closes)
+
+
+@pytest.mark.parametrize('compact_mode, dtype, counter_dtype', [(False, np.float64, np.int32),
+                                                                (True, np.float32, np.uint16)])
+def test_info_snapshot_compact_mode(compact_mode, dtype, counter_dtype, monkeypatch):
+  closes = _closes_with_gaps().ffill()
+  monkeypatch.setattr(funclib, 'COMPACT_MODE', compact_mode)
+  monkeypatch.setattr(funclib, 'load_close_data_from_dumps', lambda date_str: closes)
+  snapshot = funclib._build_info_snapshot(f'2099030{int(compact_mode)}')
+  assert snapshot.close.values.dtype == dtype and snapshot.days_since_ath.values.dtype == counter_dtype
+  assert not snapshot.close.values.flags.writeable and not snapshot.days_since_ath.values.flags.writeable
+  # one date axis for all frames of the snapshot
+  assert snapshot.days_since_ath.dates is snapshot.close.dates
+  np.testing.assert_array_equal(snapshot.close.values, closes.to_numpy(dtype=dtype))
+  expected, first_valid = funclib.days_since_ath_array(closes.to_numpy(dtype=dtype))
+  np.testing.assert_array_equal(snapshot.days_since_ath.values, expected)
+  np.testing.assert_array_equal(snapshot.days_since_ath_first_valid, first_valid)
+
+
+def test_latest_snapshot_is_built_once_and_shared(monkeypatch):
+  monkeypatch.setattr(funclib, '_snapshots', dict())
+  built = []
+  started = threading.Event()
+
+  def build(date_str):
+    built.append(date_str)
+    started.wait(1)
+    return object()
+
+  kind = 'test'
+  with concurrent.futures.ThreadPoolExecutor(8) as executor:
+    futures = [executor.submit(funclib._get_latest_snapshot, kind, '20240101', build) for _ in range(8)]
+    started.set()
+    snapshots = [future.result() for future in futures]
+  assert built == ['20240101']
+  assert all(snapshot is snapshots[0] for snapshot in snapshots)
+
+  # a newer date is swapped in, an older one is built for the caller only
+  newer = funclib._get_latest_snapshot(kind, '20240102', build)
+  assert funclib._get_latest_snapshot(kind, '20240102', build) is newer
+  older = funclib._get_latest_snapshot(kind, '20240101', build)
+  assert older is not snapshots[0]
+  assert funclib._get_latest_snapshot(kind, '20240102', build) is newer
+  assert built == ['20240101', '20240102', '20240101']
+
+
+def test_symbol_registry_loaded_once_and_selected_by_view(tmp_path, monkeypatch):
+  filepath = tmp_path / 'symbols.csv'
+  rows = [','.join(funclib.SYMBOLS_COLUMNS),
+          'b,indices,^B,b,daily,B,True,US,USD',
+          'a,indices,^A,a,daily,A,False,EU,EUR',
+          'c,fx,C=X,c,daily,C,True,EU,EUR']
+  filepath.write_text('\n'.join(rows) + '\n')
+  monkeypatch.setattr(funclib, 'SYMBOLS_FILEPATH', filepath)
+  monkeypatch.setattr(funclib, '_symbol_registry', None)
+  registry = funclib.get_symbol_registry()
+  assert registry.index.to_list() == ['b', 'a', 'c']
+  assert registry['button_default'].to_list() == [True, False, True]
+  filepath.unlink()
+  assert funclib.get_symbol_registry() is registry
+
+  # in registry order, copies of the rows
+  assert funclib.get_symbols('indices').index.to_list() == ['b', 'a']
+  assert funclib.get_symbols(('indices', 'fx'), names=['c', 'a']).index.to_list() == ['a', 'c']
+  fx = funclib.get_symbols('fx')
+  fx.loc['c', 'currency'] = 'USD'
+  assert registry.loc['c', 'currency'] == 'EUR'
+  with pytest.raises(ValueError):
+    funclib.get_symbols(names=['a', 'd'])
+
+
+def test_symbol_registry_rejects_invalid_files(tmp_path, monkeypatch):
+  filepath = tmp_path / 'symbols.csv'
+  monkeypatch.setattr(funclib, 'SYMBOLS_FILEPATH', filepath)
+  for rows in (['name,group', 'a,indices'],
+               [','.join(funclib.SYMBOLS_COLUMNS)] + ['a,indices,^A,a,daily,A,True,US,USD'] * 2):
+    filepath.write_text('\n'.join(rows) + '\n')
+    monkeypatch.setattr(funclib, '_symbol_registry', None)
+    with pytest.raises(ValueError):
+      funclib.get_symbol_registry()
+
+
+def test_fx_adjusted_ratios_match_the_formula(monkeypatch, capsys):
+  rng = np.random.default_rng(4)
+  dates = pd.bdate_range('2000-01-03', periods=200, name='Date')
+  values = np.exp(np.cumsum(rng.normal(0, 0.01, (200, 5)), axis=0)) * [4000, 3000, 7000, 1.1, 1.3]
+  closes = pd.DataFrame(values, index=dates, columns=['us_sp500', 'eu_stoxx50', 'uk_ftse100', 'eurusd', 'gbpusd'])
+  currencies = {'us_sp500': 'USD', 'eu_stoxx50': 'EUR', 'uk_ftse100': 'GBP'}
+  matrix = funclib.compute_fx_adjusted_ratio_matrix(closes, currencies, {'EUR': 'eurusd', 'GBP': 'gbpusd'})
+  # basket1 / basket2 x currency2 / currency1, the currencies in units per USD
+  per_usd = {'USD': 1., 'EUR': 1 / closes['eurusd'], 'GBP': 1 / closes['gbpusd']}
+  for (i, num), (j, den) in itertools.product(enumerate(currencies), repeat=2):
+    expected = closes[num] / closes[den] * per_usd[currencies[den]] / per_usd[currencies[num]]
+    np.testing.assert_allclose(matrix.values[:, i, j], expected, rtol=1e-12, err_msg=f'{num}/{den}')
+
+  ratios = funclib.select_ratios(matrix, ['eu_stoxx50', 'uk_ftse100'], 'us_sp500')
+  assert ratios.columns.to_list() == ['eu_stoxx50/us_sp500', 'uk_ftse100/us_sp500']
+  np.testing.assert_array_equal(ratios.to_numpy(), matrix.values[:, 1:, 0])
+
+  # a basket without the rate of its currency is skipped
+  monkeypatch.setattr(funclib, 'load_close_data_from_dumps',
+                      lambda date_str, symbol_names: closes.drop(columns='gbpusd'))
+  matrix = funclib._build_country_ratios_snapshot('20990501')
+  assert matrix.names == ('us_sp500', 'eu_stoxx50')
+  assert 'uk_ftse100 is skipped' in capsys.readouterr().out
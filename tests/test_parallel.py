@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import parallel
+from funclib import days_since_ath_array, days_since_change_array
+from parallel import map_column_chunks
+
+CHANGES = [2, -1]
+DAYS_PERIODS = [1, 5]
+
+
+@pytest.fixture(scope='module')
+def values() -> np.ndarray:
+  rng = np.random.default_rng(0)
+  values = np.exp(np.cumsum(rng.normal(0, 0.02, (500, 7)), axis=0))
+  # a late start, a gap, a flat stretch and a column without data
+  values[:100, 1] = np.nan
+  values[200:210, 2] = np.nan
+  values[300:350, 3] = values[300, 3]
+  values[:, 4] = np.nan
+  return values
+
+
+def assert_pooled(capsys):
+  """The pool ran the chunks, it did not fall back to a serial call."""
+  assert parallel._pool is not None
+  assert 'Parallel execution failed' not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('max_workers', [2, 3])
+def test_map_column_chunks_matches_a_serial_call(values, capsys, max_workers):
+  expected = days_since_change_array(values, CHANGES, DAYS_PERIODS)
+  pooled = map_column_chunks(days_since_change_array, values, max_workers=max_workers, min_cells=1,
+                             changes=CHANGES, days_periods=DAYS_PERIODS)
+  assert_pooled(capsys)
+  assert len(pooled) == len(expected)
+  for result, reference in zip(pooled, expected):
+    assert result.dtype == reference.dtype
+    np.testing.assert_array_equal(result, reference)
+
+  expected = days_since_ath_array(values)
+  pooled = map_column_chunks(days_since_ath_array, values, max_workers=max_workers, min_cells=1)
+  assert_pooled(capsys)
+  for result, reference in zip(pooled, expected):
+    np.testing.assert_array_equal(result, reference)
+
+
+def test_map_column_chunks_writes_the_memory_mapped_output(values, capsys, tmp_path):
+  expected, num_occurences, first_valid = days_since_change_array(values, CHANGES, DAYS_PERIODS,
+                                                                  dtype=np.uint16)
+  out = np.lib.format.open_memmap(tmp_path / 'counters.npy', mode='w+', dtype=np.uint16,
+                                  shape=expected.shape)
+  pooled = map_column_chunks(days_since_change_array, values, out=out, max_workers=3, min_cells=1,
+                             changes=CHANGES, days_periods=DAYS_PERIODS)
+  assert_pooled(capsys)
+  assert pooled[0] is out
+  np.testing.assert_array_equal(np.load(tmp_path / 'counters.npy'), expected)
+  np.testing.assert_array_equal(pooled[1], num_occurences)
+  np.testing.assert_array_equal(pooled[2], first_valid)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import plotly_charts
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+  rng = np.random.default_rng(0)
+  values = np.exp(np.cumsum(rng.normal(0, 0.01, (3000, 3)), axis=0))
+  values[:500, 1] = np.nan  # a late start
+  values[:, 2] = np.nan  # no data
+  return pd.DataFrame(values, index=pd.bdate_range('2000-01-03', periods=3000, name='Date'),
+                      columns=['a', 'b', 'c'])
+
+
+def trace_series(trace) -> pd.Series:
+  """The values of a line, indexed by its dates."""
+  return pd.Series(np.asarray(trace.y), index=pd.to_datetime(np.asarray(trace.x), unit='ms'))
+
+
+def test_wide_line_figure_has_a_line_per_column(frame):
+  fig = plotly_charts.wide_line_figure(frame, 'close', max_points=10_000)
+  assert [trace.name for trace in fig.data] == ['a', 'b', 'c']
+  assert fig.layout.xaxis.type == 'date'
+  # every line has the valid rows of its column, on the shared dates
+  for trace, column in zip(fig.data, frame):
+    pd.testing.assert_series_equal(trace_series(trace), frame[column].dropna(), check_names=False,
+                                   check_freq=False, check_index_type=False)
+
+
+def test_wide_line_figure_keeps_the_extremes_of_every_line(frame):
+  fig = plotly_charts.wide_line_figure(frame, 'close', max_points=200)
+  for trace, column in zip(fig.data[:2], frame):
+    line = trace_series(trace)
+    close = frame[column].dropna()
+    assert len(line) <= 202
+    assert (line.index[0], line.index[-1]) == (close.index[0], close.index[-1])
+    assert (line.min(), line.max()) == (close.min(), close.max())
+    pd.testing.assert_series_equal(line, close.loc[line.index], check_names=False, check_freq=False,
+                                   check_index_type=False)
+  assert len(fig.data[2].x) == 0
@@ -0,0 +1,154 @@
+"""The derived series resumed from the state of an older snapshot must be bit-identical to the
+ones computed from all rows."""
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import funclib
+import snapshot_cache
+
+_kinds = itertools.count()
+
+
+def new_kind() -> str:
+  """A state kind of its own, so that the states of the tests do not resume each other."""
+  return f'test-{next(_kinds)}'
+
+
+def random_closes(num_rows: int = 400, num_columns: int = 4, seed: int = 0) -> pd.DataFrame:
+  rng = np.random.default_rng(seed)
+  values = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (num_rows, num_columns)), axis=0))
+  # leading NaNs, gaps and an empty column
+  values[:50, 1] = np.nan
+  values[rng.random((num_rows, num_columns)) < 0.05] = np.nan
+  values[:, -1] = np.nan
+  return pd.DataFrame(values, index=pd.bdate_range('2000-01-03', periods=num_rows, name='Date'),
+                      columns=[f's{i}' for i in range(num_columns)])
+
+
+SPLITS = np.random.default_rng(1).integers(1, 400, 40)
+
+
+@pytest.mark.parametrize('split', SPLITS)
+def test_resume_days_since_ath(split):
+  values = random_closes().to_numpy()
+  expected, expected_first_valid = funclib.days_since_ath_array(values)
+  counters, first_valid = funclib.days_since_ath_array(values[:split])
+  state = funclib.days_since_ath_state(values[:split], counters, first_valid)
+  new_counters, first_valid, _ = funclib.resume_days_since_ath(values[split:], state)
+  np.testing.assert_array_equal(np.concatenate([counters, new_counters]), expected)
+  np.testing.assert_array_equal(first_valid, expected_first_valid)
+
+
+@pytest.mark.parametrize('split', SPLITS)
+def test_resume_days_since_change(split):
+  values = random_closes().to_numpy()
+  changes, days_periods = [-3, 0, 2], [1, 5, 20]
+  expected = funclib.days_since_change_array(values, changes, days_periods)
+  counters, num_occurences, first_valid = funclib.days_since_change_array(values[:split], changes, days_periods)
+  state = funclib.days_since_change_state(values[:split], counters, num_occurences, first_valid, days_periods)
+  new_counters, num_occurences, first_valid, _ = funclib.resume_days_since_change(
+      values[split:], state, changes, days_periods)
+  np.testing.assert_array_equal(np.concatenate([counters, new_counters], axis=2), expected[0])
+  np.testing.assert_array_equal(num_occurences, expected[1])
+  np.testing.assert_array_equal(first_valid, expected[2])
+
+
+def test_resumable_days_since_ath_falls_back_on_a_revised_history():
+  kind = new_kind()
+  closes = random_closes()
+  revised = closes.copy()
+  revised.iloc[100, 0] *= 2
+  funclib._resumable_days_since_ath(kind, '20240101', funclib.to_compact(closes.iloc[:300], np.float64))
+  counters, _ = funclib._resumable_days_since_ath(kind, '20240102', funclib.to_compact(revised, np.float64))
+  np.testing.assert_array_equal(counters, funclib.days_since_ath_array(revised.to_numpy())[0])
+
+
+def ratio_closes(seed: int = 0) -> dict[str, pd.Series]:
+  """Closes on different calendars, like the daily indices and the yearly GDP."""
+  closes = random_closes(seed=seed).iloc[:, :3]
+  rng = np.random.default_rng(seed)
+  return {'a': closes['s0'].dropna(), 'b': closes['s1'].dropna().iloc[::2],
+          'gdp': pd.Series(rng.random(5) + 1, index=pd.date_range('1999-12-31', periods=5, freq='YE',
+                                                                   name='Date'))}
+
+
+RATIOS = {'a/b': ('a', 'b'), 'b/a': ('b', 'a'), 'a/gdp': ('a', 'gdp')}
+
+
+@pytest.mark.parametrize('split_date', pd.bdate_range('2000-01-03', periods=400)[SPLITS])
+def test_resumable_compute_ratios(split_date, monkeypatch):
+  kind = new_kind()
+  closes = ratio_closes()
+  funclib._resumable_compute_ratios(kind, '20240101', {symbol: close.loc[:split_date]
+                                                       for symbol, close in closes.items()}, RATIOS)
+  # only the new rows are computed
+  num_rows = []
+  compute_ratios = funclib.compute_ratios
+  monkeypatch.setattr(funclib, 'compute_ratios',
+                      lambda closes, ratios: num_rows.append(sum(map(len, closes.values())))
+                      or compute_ratios(closes, ratios))
+  ratios_df = funclib._resumable_compute_ratios(kind, '20240102', closes, RATIOS)
+  pd.testing.assert_frame_equal(ratios_df, compute_ratios(closes, RATIOS), check_freq=False)
+  assert num_rows[0] <= sum(len(close.loc[split_date:]) + 1 for close in closes.values())
+
+
+def test_resumable_compute_ratios_falls_back_on_a_revised_history():
+  kind = new_kind()
+  closes = ratio_closes()
+  funclib._resumable_compute_ratios(kind, '20240101', {symbol: close.iloc[:-20]
+                                                       for symbol, close in closes.items()}, RATIOS)
+  closes['b'] = closes['b'].copy()
+  closes['b'].iloc[10] *= 2
+  ratios_df = funclib._resumable_compute_ratios(kind, '20240102', closes, RATIOS)
+  pd.testing.assert_frame_equal(ratios_df, funclib.compute_ratios(closes, RATIOS), check_freq=False)
+
+
+def build_cube(date_str: str, closes: pd.DataFrame, dirpath, monkeypatch):
+  close = funclib.to_compact(closes, np.float64)
+  monkeypatch.setattr(funclib, 'get_info_snapshot', lambda date_str: SimpleNamespace(close=close))
+  funclib._build_days_since_change_cube(date_str, dirpath)
+  return np.load(dirpath / f'{date_str}-days_since_change.npy')
+
+
+@pytest.mark.parametrize('revise', [False, True], ids=['resumed', 'revised'])
+def test_build_days_since_change_cube(revise, tmp_path, monkeypatch):
+  # the cube states of the other tests
+  for filepath in snapshot_cache.STATE_CACHE_DIR.glob('info-days_since_change-*.npz'):
+    filepath.unlink()
+  closes = random_closes(num_rows=300)
+  build_cube('20240101', closes.iloc[:250], tmp_path, monkeypatch)
+  if revise:
+    closes = closes.copy()
+    closes.iloc[10, 0] *= 2
+  cube = build_cube('20240102', closes, tmp_path, monkeypatch)
+  expected = funclib.days_since_change_array(closes.to_numpy(), funclib.SLIDER_CHANGES,
+                                             funclib.SLIDER_DAYS_PERIODS, dtype=np.uint16)
+  np.testing.assert_array_equal(cube, expected[0])
+  with np.load(tmp_path / '20240102-days_since_change-meta.npz') as meta:
+    np.testing.assert_array_equal(meta['num_occurences'], expected[1])
+    np.testing.assert_array_equal(meta['first_valid'], expected[2])
+  # the older cube is deleted
+  assert sorted(filepath.name for filepath in tmp_path.iterdir()) == [
+      '20240102-days_since_change-meta.npz', '20240102-days_since_change.npy']
+
+
+@pytest.mark.parametrize('change', ['symbols', 'dtype'])
+def test_days_since_change_cube_rebuilt_for_other_closes(change, tmp_path, monkeypatch):
+  closes = random_closes(num_rows=300)
+  build_cube('20240101', closes.iloc[:, :2], tmp_path, monkeypatch)
+  if change == 'symbols':
+    close = funclib.to_compact(closes, np.float64)
+  else:
+    close = funclib.to_compact(closes.iloc[:, :2], np.float32)
+  monkeypatch.setattr(funclib, 'get_info_snapshot', lambda date_str: SimpleNamespace(close=close))
+  funclib.get_days_since_change_cube.clear()
+  cube, num_occurences, _, columns = funclib.get_days_since_change_cube('20240101', tmp_path)
+  expected = funclib.days_since_change_array(close.values.astype(np.float64), funclib.SLIDER_CHANGES,
+                                             funclib.SLIDER_DAYS_PERIODS, dtype=np.uint16)
+  assert columns == list(close.columns)
+  np.testing.assert_array_equal(cube, expected[0])
+  np.testing.assert_array_equal(num_occurences, expected[1])
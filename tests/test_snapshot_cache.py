@@ -0,0 +1,85 @@
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+import snapshot_cache
+
+
+def close_series(num_days: int, offset: float = 0.) -> pd.Series:
+  return pd.Series(100 + np.arange(num_days, dtype=np.float64) + offset,
+                   index=pd.date_range('2024-01-01', periods=num_days, name='Date'))
+
+
+def is_memory_mapped(array) -> bool:
+  while array is not None:
+    if isinstance(array, mmap.mmap):
+      return True
+    array = getattr(array, 'base', None)
+  return False
+
+
+def test_load_close_is_memory_mapped_and_read_only(tmp_path):
+  snapshot_cache.save_close('20240101', 'sp500', close_series(10), tmp_path)
+  close = snapshot_cache.load_close('20240101', 'sp500', tmp_path)
+  pd.testing.assert_series_equal(close, close_series(10), check_names=False, check_freq=False)
+  values = close.to_numpy()
+  assert is_memory_mapped(values) and is_memory_mapped(close.index.to_numpy())
+  assert not values.flags.writeable
+  assert snapshot_cache.load_close('20240101', 'nasdaq100', tmp_path) is None
+
+
+def test_evict_least_recently_used(tmp_path):
+  for i, prefix in enumerate(['a', 'b', 'c']):
+    snapshot_cache.save_close('20240101', prefix, close_series(100), tmp_path)
+    for filepath in tmp_path.glob(f'*-{prefix}-*.npy'):
+      os.utime(filepath, (i, i))
+  # loading marks as recently used
+  assert snapshot_cache.load_close('20240101', 'a', tmp_path) is not None
+  pair_bytes = sum(fp.stat().st_size for fp in tmp_path.glob('*-a-*.npy'))
+  snapshot_cache.evict(2 * pair_bytes, tmp_path)
+  assert sorted({fp.name.split('-')[1] for fp in tmp_path.glob('*.npy')}) == ['a', 'c']
+
+
+def test_cached_local_closes_by_directory_and_modification_time(tmp_path):
+  filepaths = []
+  for parent in ('x', 'y'):
+    filepath = tmp_path / parent / 'consolidated' / 'consolidated-sp500-daily.csv'
+    filepath.parent.mkdir(parents=True)
+    close_series(5, offset=len(filepaths)).to_csv(filepath)
+    filepaths.append(filepath)
+  loads = []
+
+  def get(filepath):
+    def load_fn(names):
+      loads.append(filepath)
+      return [pd.read_csv(filepath, parse_dates=['Date'], index_col='Date').iloc[:, 0] for _ in names]
+    return snapshot_cache.cached_local_closes({'sp500': filepath}, load_fn)['sp500']
+
+  # the directories have the same name but not the same entries
+  assert get(filepaths[0]).iloc[0] == 100 and get(filepaths[1]).iloc[0] == 101
+  assert get(filepaths[0]).iloc[0] == 100 and len(loads) == 2
+  # an updated file is loaded again
+  close_series(7).to_csv(filepaths[0])
+  os.utime(filepaths[0], ns=(0, filepaths[0].stat().st_mtime_ns + 10**9))
+  assert len(get(filepaths[0])) == 7 and len(loads) == 3
+
+  snapshot_cache.discard_local(filepaths[0])
+  assert get(filepaths[0]) is not None and len(loads) == 4
+  assert get(filepaths[1]) is not None and len(loads) == 4
+
+
+def test_states_of_local_directories_keep_the_dated_ones(tmp_path):
+  for date_str in ('20240101', '20240102'):
+    snapshot_cache.save_state('kind', date_str, tmp_path, value=np.array(date_str))
+  assert sorted(fp.name for fp in tmp_path.iterdir()) == ['kind-20240102.npz']
+  # a local directory resumes from the latest dated state, then from its own one
+  assert snapshot_cache.load_state('kind', 'consolidated', tmp_path)[0] == '20240102'
+  snapshot_cache.save_state('kind', 'consolidated', tmp_path, value=np.array('consolidated'))
+  assert sorted(fp.name for fp in tmp_path.iterdir()) == ['kind-20240102.npz', 'kind-consolidated.npz']
+  assert snapshot_cache.load_state('kind', 'consolidated', tmp_path)[0] == 'consolidated'
+  # and dated snapshots never resume from it
+  assert snapshot_cache.load_state('kind', '20240103', tmp_path)[0] == '20240102'
+  snapshot_cache.save_state('kind', '20240103', tmp_path, value=np.array('20240103'))
+  assert sorted(fp.name for fp in tmp_path.iterdir()) == ['kind-20240103.npz', 'kind-consolidated.npz']
@@ -0,0 +1,121 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import funclib
+import snapshot_cache
+
+
+def write_snapshot(dirpath, date_str: str, groups, skip: int = 0):
+  """Write empty dump files of the symbols of `groups`, without the first `skip` ones."""
+  snapshot_dirpath = dirpath / date_str
+  snapshot_dirpath.mkdir(exist_ok=True)
+  for symbol_name in funclib.get_symbols(groups).index[skip:]:
+    (snapshot_dirpath / f'{date_str}-{funclib._symbol_filename_ending(symbol_name)}.csv').write_text('')
+
+
+def publish(dirpath):
+  """Write the manifest, newer than the previous one by more than the 1 second resolution of
+  Last-Modified."""
+  funclib.write_manifest(dirpath)
+  filepath = dirpath / funclib.MANIFEST_FILENAME
+  publish.mtime = max(getattr(publish, 'mtime', 0), time.time()) + 2
+  os.utime(filepath, (publish.mtime, publish.mtime))
+
+
+@pytest.fixture
+def assets(stand_in_server, monkeypatch):
+  """The stand-in server as URL_ASSETS, with the manifest loaded again on every call."""
+  monkeypatch.setattr(funclib, 'URL_ASSETS', stand_in_server.url)
+  monkeypatch.setattr(funclib, 'MANIFEST_TTL_SEC', 0)
+  monkeypatch.setattr(funclib, '_reported_missing', set())
+  return stand_in_server
+
+
+def test_latest_snapshot_from_the_manifest(assets, capsys):
+  write_snapshot(assets.dirpath, '20240101', funclib.INFO_GROUPS)
+  write_snapshot(assets.dirpath, '20240201', 'usa')
+  publish(assets.dirpath)
+  assert funclib.latest_snapshot_date(funclib.INFO_GROUPS) == '20240101'
+  assert funclib.latest_snapshot_date('usa') == '20240201'
+
+  # a newer snapshot with a failed download is still picked, and the missing symbol reported
+  write_snapshot(assets.dirpath, '20240301', funclib.INFO_GROUPS, skip=1)
+  publish(assets.dirpath)
+  assert funclib.latest_snapshot_date(funclib.INFO_GROUPS) == '20240301'
+  assert 'misses the files' in capsys.readouterr().out
+  # once
+  funclib.latest_snapshot_date(funclib.INFO_GROUPS)
+  assert 'misses the files' not in capsys.readouterr().out
+
+
+def test_latest_snapshot_needs_the_min_coverage(assets):
+  write_snapshot(assets.dirpath, '20240101', funclib.INFO_GROUPS + ('usa',))
+  # too few of the INFO symbols, and not all usa ones
+  write_snapshot(assets.dirpath, '20240301', funclib.INFO_GROUPS, skip=4)
+  write_snapshot(assets.dirpath, '20240301', 'usa', skip=1)
+  publish(assets.dirpath)
+  assert funclib.latest_snapshot_date(funclib.INFO_GROUPS) == '20240101'
+  assert funclib.latest_snapshot_date('usa') == '20240101'
+
+
+def test_latest_snapshot_fallbacks(assets, tmp_path, monkeypatch):
+  # no manifest on the server, no snapshot of the groups
+  assert funclib.latest_snapshot_date('usa') == funclib.FALLBACK_SNAPSHOT_DATES['usa']
+
+  # the snapshots already in the snapshot cache, newer than the fallback
+  endings = [funclib._symbol_filename_ending(symbol_name) for symbol_name in funclib.get_symbols('usa').index]
+  close = pd.Series([1.], index=pd.DatetimeIndex(['2024-01-02'], name='Date'))
+  for ending in endings:
+    snapshot_cache.save_close('20990101', ending, close)
+  try:
+    assert funclib.latest_snapshot_date('usa') == '20990101'
+  finally:
+    for ending in endings:
+      snapshot_cache.discard('20990101', ending)
+
+  # a local directory without a manifest is listed
+  dirpath = tmp_path / 'local'
+  dirpath.mkdir()
+  write_snapshot(dirpath, '20240501', 'usa')
+  monkeypatch.setattr(funclib, 'URL_ASSETS', f'{dirpath}{os.sep}')
+  assert funclib.latest_snapshot_date('usa') == '20240501'
+
+
+def test_manifest_kept_when_the_server_is_down(assets, monkeypatch):
+  write_snapshot(assets.dirpath, '20240201', 'usa')
+  publish(assets.dirpath)
+  assert funclib.latest_snapshot_date('usa') == '20240201'
+  assets.failures['/' + funclib.MANIFEST_FILENAME] = 100
+  assert funclib.latest_snapshot_date('usa') == '20240201'
+
+
+def test_unchanged_manifest_is_not_parsed_again(assets):
+  write_snapshot(assets.dirpath, '20240201', 'usa')
+  publish(assets.dirpath)
+  first = funclib.get_snapshot_manifest()
+  assert funclib.get_snapshot_manifest() is first
+  write_snapshot(assets.dirpath, '20240301', 'usa')
+  publish(assets.dirpath)
+  assert '20240301' in funclib.get_snapshot_manifest()
+
+
+def test_fetch_url_conditional_requests(assets):
+  filepath = assets.dirpath / 'a.csv'
+  filepath.write_text('Date,Close\n2024-01-02,1.0\n')
+  url = assets.url + 'a.csv'
+  first = funclib.fetch_url(url)
+  assert not first.not_modified
+
+  # an unchanged file costs a 304, its content comes from the cache
+  second = funclib.fetch_url(url)
+  assert second.not_modified and second.content == first.content
+  assert assets.requests['/a.csv'] == 2
+
+  # Last-Modified has a resolution of a second
+  filepath.write_text('Date,Close\n2024-01-02,1.0\n2024-01-03,2.0\n')
+  os.utime(filepath, (time.time() + 2, time.time() + 2))
+  third = funclib.fetch_url(url)
+  assert not third.not_modified and third.content.endswith(b'2.0\n')
@@ -1,18 +1,21 @@
 import time
 
-import altair as alt
 import pandas as pd
 import streamlit as st
 
+from backtest import BACKTEST_RULES, backtest_frame, get_ratios_backtest
+from charting import get_ratios_twin_chart_spec
 from description_strings import (description_ftw5000, description_ixic,
                                  description_ndx, description_spx,
                                  description_spxew, description_usgdp,
                                  outro_string)
-from funclib import generate_twin_chart, get_ratios_df
-
-alt.data_transformers.enable('vegafusion')
+from funclib import (ROLLING_WINDOWS, get_ratios_pyramid_snapshot, get_ratios_rolling_metrics,
+                     latest_snapshot_date)
+from plotly_charts import get_ratios_rolling_figure
+from profiling import finish_run, span, start_run
 
 timer_start = time.time_ns()
+start_run('usa_index_ratios')
 
 st.title('Comparing economy and market cap indicators')
 st.write(
@@ -22,7 +25,14 @@ st.write(
     'helps *adjust for the impact of currency fluctuations*, providing a clearer comparison '
     'of their underlying market trends.')
 
-ratios_df = get_ratios_df(symbol_source='20241203', subsample_step=4, append_date_column=True)
+# the newest snapshot of the dumps, read-only
+date_str = latest_snapshot_date('usa')
+all_dates = get_ratios_pyramid_snapshot(date_str)['daily'].index
+with st.sidebar:
+  start_year, end_year = st.slider('Period', min_value=all_dates[0].year, max_value=all_dates[-1].year,
+                                   value=(all_dates[0].year, all_dates[-1].year))
+# the charts use the coarsest resolution that fills them for the period (see `get_pyramid_range`)
+chart_range = (date_str, str(start_year), str(end_year))
 
 # Chart 1 #########################################################################################
 st.header('Economic indicators - Market cap')
@@ -33,11 +43,11 @@ with st.expander('Data info', expanded=False, icon=':material/info:'):
   st.write(description_spx)
   st.write(description_ftw5000)
 
-twin_axes_chart = generate_twin_chart(ratios_df,
-                                      'spx/usgdp', 'S&P 500   /   GDP real',
-                                      'ftw5000/usgdp', 'Total market   /   GDP real')
-# theme=None is needed because streamlit doesn't handle vegafusion for now
-st.altair_chart(twin_axes_chart, use_container_width=True, theme=None)
+spec = get_ratios_twin_chart_spec(*chart_range,
+                                  'spx/usgdp', 'S&P 500   /   GDP real',
+                                  'ftw5000/usgdp', 'Total market   /   GDP real')
+with span('chart 1: vega-lite chart'):
+  st.vega_lite_chart(spec=spec, use_container_width=True, theme=None)
 
 # Chart 2 ########################################################################################
 st.header('S&P 500 ratios')
@@ -51,10 +61,11 @@ with st.expander('Data info', expanded=False, icon=':material/info:'):
 
 st.write('')  # leave an empty space
 
-twin_axes_chart = generate_twin_chart(ratios_df,
-                                      'spx/ftw5000', 'S&P 500   /   Total market',
-                                      'spx/spxew', 'S&P 500   /   S&P 500 EW')
-st.altair_chart(twin_axes_chart, use_container_width=True)
+spec = get_ratios_twin_chart_spec(*chart_range,
+                                  'spx/ftw5000', 'S&P 500   /   Total market',
+                                  'spx/spxew', 'S&P 500   /   S&P 500 EW')
+with span('chart 2: vega-lite chart'):
+  st.vega_lite_chart(spec=spec, use_container_width=True)
 
 # Chart 3 #########################################################################################
 st.header('NASDAQ 100 ratios')
@@ -72,10 +83,69 @@ with st.expander('Data info', expanded=False, icon=':material/info:'):
 st.write('')  # leave an empty space
 
 # generate chart
-twin_axes_chart = generate_twin_chart(ratios_df,
-                                      'ndx/spx', 'NASDAQ 100   /   S&P 500',
-                                      'ndx/ixic', 'NASDAQ 100   /   NASDAQ Composite')
-st.altair_chart(twin_axes_chart, use_container_width=True)
+spec = get_ratios_twin_chart_spec(*chart_range,
+                                  'ndx/spx', 'NASDAQ 100   /   S&P 500',
+                                  'ndx/ixic', 'NASDAQ 100   /   NASDAQ Composite')
+with span('chart 3: vega-lite chart'):
+  st.vega_lite_chart(spec=spec, use_container_width=True)
+
+# Rolling returns and risk ########################################################################
+st.header('Rolling returns and risk of the ratios')
+
+# the ratio the correlations are computed with
+reference = get_ratios_rolling_metrics(date_str).reference
+rolling_metric_names = {
+    'volatility_pct': 'Annualized volatility (%)',
+    'max_drawdown_pct': 'Max drawdown (%)',
+    'drawdown_pct': 'Drawdown from the period high (%)',
+    'return_pct': 'Return (%)',
+    'correlation': f'Correlation with {reference}',
+}
+rolling_metric = st.selectbox('Metric', list(rolling_metric_names), format_func=rolling_metric_names.get)
+window = st.select_slider('Window (trading days)', options=ROLLING_WINDOWS, value=252)
+fig = get_ratios_rolling_figure(date_str, rolling_metric, window, rolling_metric_names[rolling_metric])
+with span('rolling: plotly chart'):
+  st.plotly_chart(fig, use_container_width=True, theme=None)
+
+# Trading the ratios ##############################################################################
+st.header('Trading the ratios')
+st.write('Backtests of simple trading rules on the daily ratios of the whole history, for many '
+         'parameters of every rule. Trading a ratio is holding the numerator against the '
+         'denominator when long, and the opposite when short. A position is taken at a close and '
+         'earns the change of the ratio on the next day.')
+
+pairs = {'ndx/ixic': 'NASDAQ 100   /   NASDAQ Composite', 'ndx/spx': 'NASDAQ 100   /   S&P 500',
+         'spx/ftw5000': 'S&P 500   /   Total market', 'spx/spxew': 'S&P 500   /   S&P 500 EW'}
+rule_names = {'hold': 'Buy and hold', 'trend': 'Trend (moving average)', 'threshold': 'Threshold (momentum)',
+              'mean_reversion': 'Mean reversion (z-score)'}
+rule = st.radio('Rule', list(BACKTEST_RULES), format_func=rule_names.get, index=1, horizontal=True)
+cost_bps = st.select_slider('Trading costs (basis points per traded position)', [0, 5, 10, 25, 50], value=5)
+# all parameter sets of the rule are backtested once per (snapshot, rule, costs) and shared by
+# all sessions, the page only summarizes them
+result = get_ratios_backtest(date_str, rule, float(cost_bps))
+frames = {pair: backtest_frame(result, pair) for pair in pairs if pair in result.columns}
+num_sets = len(result.metrics['max_drawdown_pct'])
+summary = pd.DataFrame({
+    label: {'median max drawdown %': frames[pair]['max_drawdown_pct'].median(),
+            'best max drawdown %': frames[pair]['max_drawdown_pct'].max(),
+            'median CAGR %': frames[pair]['cagr_pct'].median(),
+            'best CAGR %': frames[pair]['cagr_pct'].max(),
+            'median turnover per year': frames[pair]['turnover'].median()}
+    for pair, label in pairs.items() if pair in frames}).T
+st.dataframe(summary.style.format('{:.1f}'), use_container_width=True)
+if {'ndx/ixic', 'ndx/spx'} <= frames.keys():
+  ixic_drawdown = frames['ndx/ixic']['max_drawdown_pct'].median()
+  spx_drawdown = frames['ndx/spx']['max_drawdown_pct'].median()
+  st.write(f'Over {num_sets} parameter set{"s" if num_sets > 1 else ""} of the rule, the median '
+           f'max drawdown is {ixic_drawdown:.1f}% for the NASDAQ 100 - NASDAQ Composite pair and '
+           f'{spx_drawdown:.1f}% for the NASDAQ 100 - S&P 500 pair, so the first pair has '
+           f'{"smaller" if ixic_drawdown > spx_drawdown else "larger"} drawdowns.')
+
+if rule != 'hold':
+  with st.expander('Best parameters', expanded=False, icon=':material/tune:'):
+    pair = st.selectbox('Ratio', list(frames), format_func=pairs.get)
+    sort_by = st.selectbox('Sorted by', ['cagr_pct', 'max_drawdown_pct', 'total_return_pct'])
+    st.dataframe(frames[pair].nlargest(10, sort_by), hide_index=True, use_container_width=True)
 
 st.divider()
 
@@ -83,3 +153,4 @@ st.divider()
 st.write('')
 st.write(outro_string)
 st.write(f'Page created in {(time.time_ns() - timer_start) / 1_000_000_000:.1f} sec.')
+finish_run()